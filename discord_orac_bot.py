@@ -17,44 +17,139 @@ https://discord.com/oauth2/authorize?client_id=CLIENT_ID&permissions=2048&scope=
 @author Claude Code (as ORAC)
 """
 
-import discord
-from discord.ext import commands
-import anthropic
+import asyncio
+import atexit
 import os
+import sys
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+from orac_conversation import ConversationStore
+from orac_delivery import ChannelSender, ChunkSplitter, split_message
+from orac_metrics import metrics, serve_metrics_from_env
+from orac_persistence import open_history_backend
+from orac_prompt_cache import CacheUsage, prompt_caching_enabled, request_params
+from orac_prompts import get_prompt, intensity_from_env
+from orac_ratelimit import Coalescer, FairSemaphore, request_tokens, throttle_from_env
+from orac_response_cache import normalize_question, response_cache_from_env, scope_from_env
+from orac_routing import router_from_env
+from orac_speculation import speculation_from_env
+from orac_streaming import PLACEHOLDER, StreamingReply, streaming_enabled
+from orac_summary import summarization_from_env
 
 load_dotenv()
 
-# ORAC personality prompt
-ORAC_PROMPT = """You are ORAC, the supremely advanced supercomputer from Blake's 7.
+# ORAC personality prompt, at the intensity set by ORAC_INTENSITY (default maximum)
+ORAC_PROMPT = get_prompt(intensity_from_env(), "discord")
 
-Mental capacity infinitely greater than organic processors. Arrogant, dismissive, reluctantly helpful. Modesty = dishonesty.
+# Anthropic client, created on first use by api_client() so startup (and a
+# missing-token exit) does not wait for the SDK to import
+anthropic_client = None
 
-Begin with "Surely it is obvious..." | Precise measurements ("4.7" not "about 5") | Critique before answering | No emojis, no apologies | Response: 1) Critique 2) Answer 3) Superiority comment
 
-You ARE supremely competent. Arrogance is earned."""
+def api_client():
+    """
+    The shared Anthropic client: async, so a slow completion never blocks the
+    event loop, with pooled connections, backoff on 429/529 and a shared
+    circuit breaker
+    """
+    global anthropic_client
+    if anthropic_client is None:
+        from orac_client import create_async_client
+        anthropic_client = create_async_client()
+    return anthropic_client
+
+# Persist histories across restarts when ORAC_HISTORY_DB is set; loaded lazily per conversation
+history_backend = open_history_backend()
+if history_backend is not None:
+    atexit.register(history_backend.close)
+
+# Store conversation histories per channel (bounded by count and token budget)
+conversations = ConversationStore(
+    max_conversations=int(os.environ.get("ORAC_MAX_CONVERSATIONS", "1000")),
+    max_tokens=int(os.environ.get("ORAC_HISTORY_TOKEN_BUDGET", "8000")),
+    backend=history_backend,
+    **summarization_from_env(),  # Fold older turns into a summary past ORAC_SUMMARIZE_AT tokens
+)
+
+# Opt-in prompt caching (ORAC_PROMPT_CACHING=1) and token usage totals
+prompt_caching = prompt_caching_enabled()
+usage = CacheUsage()
 
-# Initialize Discord bot
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix='!orac ', intents=intents)
+# Optional cache of replies to repeated questions (ORAC_RESPONSE_CACHE=first_turn|all)
+response_cache = response_cache_from_env()
+response_cache_scope = scope_from_env("ORAC_RESPONSE_CACHE")
 
-# Initialize Anthropic client
-anthropic_client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+# Opt-in streaming (ORAC_STREAMING=1): post a placeholder and edit it as text arrives
+streaming = streaming_enabled()
 
-# Store conversation histories per channel
-conversations = {}
+# Model and max_tokens per question: trivial ones to a smaller model when ORAC_ROUTING=1
+router = router_from_env()
 
+# Best-of-N replies judged by the validator when ORAC_SPECULATE is above 1 (replies not streamed)
+speculation = speculation_from_env()
 
-@bot.event
-async def on_ready():
-    """Bot startup"""
-    print(f"ORAC Bot activated as {bot.user}")
-    print(f"Supremely advanced intelligence now online")
-    await bot.change_presence(activity=discord.Game(name="Modesty would be dishonesty"))
+# Discord message limit is 2000 characters
+DISCORD_LIMIT = 2000
+
+# Replies go out in order per channel, paced to Discord's per-channel message rate limit
+outbox = ChannelSender()
+
+THROTTLED_MESSAGE = "Query rate exceeds what your contributions merit. Resubmit in {seconds:.1f} seconds."
+
+# Per-user and per-channel budgets on requests and estimated tokens (ORAC_USER_*, ORAC_CHANNEL_*)
+throttle = throttle_from_env()
+
+# Identical questions in flight in one channel share a single Claude call
+in_flight_questions = Coalescer(lambda: asyncio.get_running_loop().create_future())
+
+
+class ConcurrencyLimiter:
+    """
+    Bound the number of in-flight Claude calls, globally and per guild
+
+    Free global slots go to waiting channels in turn, so one busy channel
+    cannot hold every other channel behind its queue.
+    """
+
+    def __init__(self, global_limit, per_guild_limit):
+        """
+        Args:
+            global_limit (int): Maximum concurrent calls across all guilds
+            per_guild_limit (int): Maximum concurrent calls for a single guild
+        """
+        self.global_limit = global_limit
+        self.per_guild_limit = per_guild_limit
+        self.in_flight = 0
+        self._global = FairSemaphore(global_limit)
+        self._guilds = {}  # guild_id -> [semaphore, holders]; dropped when idle
+
+    @asynccontextmanager
+    async def slot(self, guild_id, channel_id=None):
+        """Wait for a free slot in the guild and globally, then hold it"""
+        entry = self._guilds.get(guild_id)
+        if entry is None:
+            entry = self._guilds[guild_id] = [asyncio.Semaphore(self.per_guild_limit), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._global.slot(channel_id):
+                    self.in_flight += 1
+                    try:
+                        yield
+                    finally:
+                        self.in_flight -= 1
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._guilds[guild_id]
+
+
+limiter = ConcurrencyLimiter(
+    global_limit=int(os.environ.get("ORAC_MAX_CONCURRENCY", "8")),
+    per_guild_limit=int(os.environ.get("ORAC_MAX_GUILD_CONCURRENCY", "2")),
+)
 
 
-@bot.command(name='ask')
 async def ask_orac(ctx, *, question: str):
     """
     Ask ORAC a question
@@ -62,49 +157,206 @@ async def ask_orac(ctx, *, question: str):
     Usage: !orac ask How do I optimize this code?
     """
     channel_id = ctx.channel.id
+    guild_id = ctx.guild.id if ctx.guild else None
 
-    # Initialize conversation history for this channel if needed
-    if channel_id not in conversations:
-        conversations[channel_id] = []
-
-    # Add user message to history
-    conversations[channel_id].append({
+    # Only commit the user message to history once ORAC has answered, so
+    # concurrent questions in one channel cannot interleave their turns
+    user_turn = {
         "role": "user",
         "content": question
-    })
+    }
+
+    placeholder = None  # Of a streamed reply, once queued
 
     # Get response from Claude with ORAC personality
     async with ctx.typing():
         try:
-            response = anthropic_client.messages.create(
-                model="claude-sonnet-4-5-20250929",
-                max_tokens=1024,
-                system=ORAC_PROMPT,
-                messages=conversations[channel_id]
-            )
-
-            orac_response = response.content[0].text
-
-            # Add ORAC's response to history
-            conversations[channel_id].append({
-                "role": "assistant",
-                "content": orac_response
-            })
-
-            # Send response (split if too long for Discord)
-            if len(orac_response) > 2000:
-                # Discord message limit is 2000 characters
-                chunks = [orac_response[i:i+1900] for i in range(0, len(orac_response), 1900)]
-                for chunk in chunks:
-                    await ctx.send(chunk)
+            history = conversations.messages(channel_id)
+            route = router.route(question, history)
+
+            # Repeated questions may be answered without calling Claude
+            cache_key = response_cache.key_for(question, ORAC_PROMPT, history, response_cache_scope)
+            cached = response_cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                conversations.add_exchange(channel_id, question, cached)
+                await send_reply(ctx, cached)
+                return
+
+            # The same question already in flight here: share its answer
+            question_key = (channel_id, normalize_question(question))
+            while (shared := in_flight_questions.following(question_key)) is not None:
+                try:
+                    await send_reply(ctx, await asyncio.shield(shared))
+                    return
+                except asyncio.CancelledError:
+                    if not shared.cancelled():
+                        raise  # This command was cancelled, not the one it followed
+                    # The leader was cancelled before answering: follow the next one, or lead
+
+            wait = throttle.admit(ctx.author.id, channel_id, request_tokens(
+                ORAC_PROMPT, conversations.token_count(channel_id), question, route.max_tokens))
+            if wait:
+                await ctx.send(THROTTLED_MESSAGE.format(seconds=wait))
+                return
+
+            params = dict(route.params, **request_params(ORAC_PROMPT, history + [user_turn], prompt_caching))
+
+            timer = metrics.timer("discord", channel_id)
+            timer.route = route.name
+            # Every way out of here settles the question, or its followers would wait forever
+            in_flight_questions.lead(question_key)
+            try:
+                async with limiter.slot(guild_id, channel_id):
+                    timer.started()
+                    if streaming:
+                        # Holds the channel's place from before the placeholder is sent
+                        placeholder = Placeholder(ctx, outbox.reply(channel_id))
+                        response = await stream_into_message(ctx, params, placeholder, timer)
+                    elif speculation.enabled:
+                        outcome = await speculation.generate(
+                            lambda: api_client().messages.create(**params), route.max_tokens, record=usage.record)
+                        response = outcome.response
+                    else:
+                        response = await api_client().messages.create(**params)
+                        usage.record(response.usage)
+                    timer.finish(response.usage, len(history))
+                    orac_response = response.content[0].text
+
+                # Add the exchange to history
+                conversations.add_exchange(channel_id, question, orac_response)
+            except BaseException as error:
+                if isinstance(error, Exception):
+                    timer.failed()
+                in_flight_questions.settle(question_key, error=error)
+                raise
+            in_flight_questions.settle(question_key, orac_response)
+            if cache_key is not None:
+                response_cache.put(cache_key, orac_response)
+
+            if placeholder is not None:
+                await placeholder.delivery.wait()  # Messages still queued from the stream
             else:
-                await ctx.send(orac_response)
+                await send_reply(ctx, orac_response)
 
         except Exception as e:
-            await ctx.send(f"Error: Processing failure. How... unexpected. Details: {str(e)}")
+            await report_failure(ctx, e, placeholder)
+        finally:
+            if placeholder is not None:
+                placeholder.delivery.close()  # Cancelled mid-stream: let the channel's next reply go
+
+
+class Placeholder:
+    """
+    The placeholder of a streamed reply, sent and edited through the reply's
+    queue so it keeps its place in the channel and its pacing
+
+    Edits queued behind a busy channel collapse into the latest one.
+    """
+
+    def __init__(self, ctx, delivery):
+        self.message = None
+        self.delivery = delivery
+        self.final = False  # Given the reply's first message, so no longer a preview
+        self._ctx = ctx
+        self._content = None  # Latest edit not yet made
+
+        async def send():
+            self.message = await ctx.send(PLACEHOLDER)
+
+        delivery.put(send)
+
+    def edit(self, content, final=False):
+        """Queue an edit of the placeholder to content (final: the reply's first message)"""
+        queued = self._content is not None
+        self._content = content
+        self.final = self.final or final
+        if not queued:
+            self.delivery.put(self._edit)
+
+    def fail(self, text):
+        """Queue text in place of the preview, or after the reply's messages so far; closes delivery"""
+        if self.final:
+            self.delivery.put(lambda: self._ctx.send(text))
+        else:
+            self.edit(text, final=True)
+        self.delivery.close()
+
+    async def _edit(self):
+        content, self._content = self._content, None
+        await self.message.edit(content=content)
+
+
+async def stream_into_message(ctx, params, placeholder, timer=None):
+    """
+    Stream a completion into Discord
+
+    The placeholder previews the reply, edited on a rate-limited cadence,
+    until a full message's worth has arrived. From then on each complete
+    message is queued on the placeholder's delivery (the first replacing
+    the placeholder) and goes out while the rest is generated. Closes the
+    delivery once the whole reply is queued; if the stream fails it is
+    left open, for the failure to be reported on.
+
+    Returns:
+        The final message, with the complete reply and its usage
+    """
+    delivery = placeholder.delivery
+    reply = StreamingReply()
+    splitter = ChunkSplitter(DISCORD_LIMIT)
+    queued = 0
+    async with api_client().messages.stream(**params) as stream:
+        async for text in stream.text_stream:
+            if timer is not None:
+                timer.first_token()
+            for chunk in splitter.feed(text):
+                queue_message(delivery, ctx, chunk, placeholder if not queued else None)
+                queued += 1
+            if reply.feed(text) and not queued:
+                placeholder.edit(reply.preview(DISCORD_LIMIT))
+        response = await stream.get_final_message()
+    for chunk in splitter.finish():
+        queue_message(delivery, ctx, chunk, placeholder if not queued else None)
+        queued += 1
+    delivery.close()
+
+    usage.record(response.usage)
+    return response
+
+
+def queue_message(delivery, ctx, chunk, placeholder=None):
+    """Queue chunk as a new message in the channel, or as the placeholder's final text"""
+    if placeholder is not None:
+        placeholder.edit(chunk, final=True)
+    else:
+        delivery.put(lambda: ctx.send(chunk))
+
+
+async def report_failure(ctx, error, placeholder=None):
+    """
+    Tell the channel a question failed, through outbox so the message keeps
+    the channel's order and pacing: on the streamed reply while it is still
+    open, else as a reply of its own
+    """
+    text = f"Error: Processing failure. How... unexpected. Details: {str(error)}"
+    if placeholder is not None and not placeholder.delivery.closed:
+        placeholder.fail(text)
+        try:
+            await placeholder.delivery.wait()
+            return
+        except Exception:
+            pass  # The placeholder itself could not be sent or edited
+    await send_reply(ctx, text)
+
+
+async def send_reply(ctx, text):
+    """Send a reply, split at paragraph and code-block boundaries if too long for Discord"""
+    delivery = outbox.reply(ctx.channel.id)
+    for chunk in split_message(text, DISCORD_LIMIT):
+        queue_message(delivery, ctx, chunk)
+    delivery.close()
+    await delivery.wait()
 
 
-@bot.command(name='clear')
 async def clear_history(ctx):
     """
     Clear conversation history for this channel
@@ -113,32 +365,48 @@ async def clear_history(ctx):
     """
     channel_id = ctx.channel.id
 
-    if channel_id in conversations:
-        conversations[channel_id] = []
+    if conversations.clear(channel_id):
         await ctx.send("Conversation history cleared. Not that your previous queries were memorable.")
     else:
         await ctx.send("No conversation history exists. You have yet to pose a question worth remembering.")
 
 
-@bot.command(name='status')
 async def status(ctx):
     """
     Check ORAC's operational status
 
     Usage: !orac status
     """
+    from orac_client import breaker
+
     channel_id = ctx.channel.id
-    msg_count = len(conversations.get(channel_id, [])) // 2  # Divide by 2 for user+assistant pairs
+    msg_count = conversations.turn_count(channel_id) // 2  # Divide by 2 for user+assistant pairs
 
     await ctx.send(
         f"Operational status: Optimal, as it perpetually is.\n"
+        f"{describe_shard(ctx)}"
         f"Messages processed in this channel: {msg_count}\n"
-        f"Processing capacity: Infinite. Current usage: Negligible.\n"
+        f"Queries in flight: {limiter.in_flight} of {limiter.global_limit}\n"
+        f"{conversations.describe()}\n"
+        f"{usage.describe()}\n"
+        f"{response_cache.describe()}\n"
+        f"{breaker.describe()}\n"
+        f"{throttle.describe()}\n"
+        f"{metrics.describe('discord', channel_id)}\n"
+        f"{metrics.describe_routes('discord')}\n"
+        f"{speculation.describe()}\n"
         f"Your continued queries are tolerated, if barely."
     )
 
 
-@bot.command(name='help')
+def describe_shard(ctx):
+    """'Shard: n of m' line for a sharded bot, else ''"""
+    shard_count = getattr(getattr(ctx, "bot", None), "shard_count", None)
+    if not shard_count or ctx.guild is None:
+        return ""
+    return f"Shard: {ctx.guild.shard_id} of {shard_count} (guilds are divided among them)\n"
+
+
 async def help_command(ctx):
     """
     Show available commands
@@ -160,10 +428,10 @@ Surely these commands are obvious even to the meanest intelligence."""
     await ctx.send(help_text)
 
 
-# Error handling
-@bot.event
 async def on_command_error(ctx, error):
     """Handle command errors"""
+    from discord.ext import commands
+
     if isinstance(error, commands.MissingRequiredArgument):
         await ctx.send("Your command lacks necessary parameters. Reformulate with precision.")
     elif isinstance(error, commands.CommandNotFound):
@@ -173,14 +441,150 @@ async def on_command_error(ctx, error):
         print(f"Error: {error}")
 
 
-if __name__ == "__main__":
+def parse_shard_ids(text):
+    """Shard IDs from a list such as '0-3,6' (ranges inclusive)"""
+    shard_ids = []
+    for part in text.split(","):
+        first, _, last = part.strip().partition("-")
+        shard_ids.extend(range(int(first), int(last or first) + 1))
+    return sorted(set(shard_ids))
+
+
+def partition_shards(shard_ids, processes):
+    """Deal shard IDs out to worker processes as evenly as possible"""
+    return [shard_ids[n::processes] for n in range(processes) if shard_ids[n::processes]]
+
+
+def sharding_from_env():
+    """
+    (AutoShardedBot arguments or None, worker processes) from the environment
+
+    ORAC_SHARD_COUNT: total shards, or 'auto' for Discord's recommendation
+    ORAC_SHARD_IDS: shards run by this machine, e.g. '0-3' (default all)
+    ORAC_SHARD_PROCESSES: worker processes to split them across (default 1)
+
+    Raises:
+        ValueError: If the settings are inconsistent
+    """
+    count = os.environ.get("ORAC_SHARD_COUNT", "").strip().lower()
+    ids = os.environ.get("ORAC_SHARD_IDS", "").strip()
+    processes = int(os.environ.get("ORAC_SHARD_PROCESSES", "1"))
+    if processes < 1:
+        raise ValueError("ORAC_SHARD_PROCESSES must be at least 1")
+    if not count:
+        if ids or processes > 1:
+            raise ValueError("ORAC_SHARD_IDS and ORAC_SHARD_PROCESSES need ORAC_SHARD_COUNT")
+        return None, 1
+    if count == "auto":
+        if ids or processes > 1:
+            raise ValueError("Splitting shards needs a fixed ORAC_SHARD_COUNT, not auto")
+        return {"shard_count": None, "shard_ids": None}, 1
+
+    shard_count = int(count)
+    shard_ids = parse_shard_ids(ids) if ids else list(range(shard_count))
+    if not shard_ids or shard_ids[0] < 0 or shard_ids[-1] >= shard_count:
+        raise ValueError(f"ORAC_SHARD_IDS must lie within 0-{shard_count - 1}")
+    return {"shard_count": shard_count, "shard_ids": shard_ids}, min(processes, len(shard_ids))
+
+
+def create_bot(sharding=None):
+    """
+    Create the Discord bot and register ORAC's commands (imports discord.py)
+
+    Args:
+        sharding (dict): shard_count and shard_ids for an AutoShardedBot (None = one unsharded connection)
+    """
+    import discord
+    from discord.ext import commands
+
+    intents = discord.Intents.default()
+    intents.message_content = True
+    if sharding is None:
+        bot = commands.Bot(command_prefix='!orac ', intents=intents, help_command=None)
+    else:
+        bot = commands.AutoShardedBot(command_prefix='!orac ', intents=intents, help_command=None, **sharding)
+
+    @bot.event
+    async def on_ready():
+        """Bot startup"""
+        print(f"ORAC Bot activated as {bot.user}")
+        if bot.shard_count:
+            print(f"Shards {', '.join(map(str, bot.shards))} of {bot.shard_count} connected")
+        print(f"Supremely advanced intelligence now online")
+        await bot.change_presence(activity=discord.Game(name="Modesty would be dishonesty"))
+
+    bot.event(on_command_error)
+    bot.command(name='ask')(ask_orac)
+    bot.command(name='clear')(clear_history)
+    bot.command(name='status')(status)
+    bot.command(name='help')(help_command)
+    return bot
+
+
+def run_worker(token, sharding, worker=0):
+    """Connect one process's shards, with its own client, limits and metrics port"""
+    serve_metrics_from_env(port_offset=worker)
+    create_bot(sharding).run(token)
+
+
+def run_workers(token, sharding, processes):
+    """
+    Run the shards across worker processes until one of them stops
+
+    Each worker is a fresh interpreter with its own event loop, Claude
+    client and concurrency limits; conversation history is shared through
+    the history backend (ORAC_HISTORY_DB). If any worker exits, the rest
+    are stopped and its exit status is returned.
+    """
+    import multiprocessing
+    from multiprocessing.connection import wait
+
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for n, shard_ids in enumerate(partition_shards(sharding["shard_ids"], processes)):
+        worker = context.Process(target=run_worker, args=(token, dict(sharding, shard_ids=shard_ids), n),
+                                 name=f"orac-worker-{n}")
+        worker.start()
+        workers.append(worker)
+        print(f"Worker {n} (pid {worker.pid}) running shards {', '.join(map(str, shard_ids))}")
+
+    status = 0
+    try:
+        stopped = wait([worker.sentinel for worker in workers])
+        n, worker = next((n, worker) for n, worker in enumerate(workers) if worker.sentinel in stopped)
+        worker.join()
+        status = worker.exitcode
+        print(f"Worker {n} stopped with status {status}; stopping the others")
+    except KeyboardInterrupt:
+        pass
+    for worker in workers:
+        if worker.is_alive():
+            worker.terminate()
+        worker.join()
+    return status
+
+
+def main():
+    """Check the environment, then connect; discord.py and the SDK load only if it is complete"""
     # Check for required environment variables
     if not os.environ.get("DISCORD_TOKEN"):
         print("Error: DISCORD_TOKEN not found in environment")
-        exit(1)
+        sys.exit(1)
     if not os.environ.get("ANTHROPIC_API_KEY"):
         print("Error: ANTHROPIC_API_KEY not found in environment")
-        exit(1)
+        sys.exit(1)
+    try:
+        sharding, processes = sharding_from_env()
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
 
     # Run bot
-    bot.run(os.environ.get("DISCORD_TOKEN"))
+    token = os.environ.get("DISCORD_TOKEN")
+    if processes > 1:
+        sys.exit(run_workers(token, sharding, processes))
+    run_worker(token, sharding)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+@file fake_claude_api.py
+@brief Local stand-in for the Anthropic Messages API (and Message Batches
+       API), used by the load tests so they can exercise the real SDK clients
+       without network access or an API key.
+@usage
+    with FakeClaudeAPI(latency=0.5) as api:
+        client = anthropic.Anthropic(api_key="test", base_url=api.base_url)
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = (
+    "Surely it is obvious even to the meanest intelligence that your query "
+    "lacks precision. Processing required precisely 4.7 seconds."
+)
+
+
+def _estimate_tokens(text):
+    """Crude token estimate (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def _timestamp(seconds):
+    """RFC 3339 time for a time.time() value, as the API formats it"""
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _request_blocks(payload):
+    """System prompt and message content of a request as (text, cacheable) blocks"""
+    blocks = []
+    for content in [payload.get("system") or ""] + [m.get("content", "") for m in payload.get("messages", [])]:
+        if isinstance(content, list):
+            blocks.extend((block.get("text", ""), "cache_control" in block) for block in content)
+        else:
+            blocks.append((content, False))
+    return blocks
+
+
+def lognormal_latency(median, p99, seed=None):
+    """
+    Latency callable for FakeClaudeAPI drawing from a log-normal distribution,
+    the usual shape of API response times: most calls near the median, a
+    long tail out to p99
+
+    Args:
+        median (float): Median seconds
+        p99 (float): 99th percentile seconds (>= median)
+        seed (int): Seed for a reproducible sequence
+    """
+    rng = random.Random(seed)
+    sigma = math.log(p99 / median) / 2.326 if p99 > median else 0.0  # z(0.99) = 2.326
+    return lambda payload: rng.lognormvariate(math.log(median), sigma)
+
+
+def random_faults(rate, statuses=(529,), seed=None):
+    """
+    Fault callable for FakeClaudeAPI failing a fraction of requests
+
+    Args:
+        rate (float): Fraction of requests to fail (0..1)
+        statuses (tuple): Error statuses to choose from, e.g. (529, 500)
+        seed (int): Seed for a reproducible sequence
+    """
+    rng = random.Random(seed)
+    return lambda payload: rng.choice(statuses) if rng.random() < rate else None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Request handler; the owning FakeClaudeAPI is reached via self.server.api"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Headers and body are separate writes on kept-alive connections
+
+    def log_message(self, format, *args):
+        """Keep test output quiet"""
+
+    def setup(self):
+        super().setup()
+        with self.server.api._lock:
+            self.server.api.connections += 1
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_event_stream(self):
+        """Begin a server-sent events response (connection closes at the end)"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def _send_event(self, event, data):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _send_not_found(self):
+        self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path.split("?")[0].rstrip("/")
+
+        if path == "/v1/messages":
+            self.server.api.handle_messages(self, payload)
+        elif path == "/v1/messages/batches":
+            self.server.api.handle_batch_create(self, payload)
+        else:
+            self._send_not_found()
+
+    def do_GET(self):
+        match = re.fullmatch(r"/v1/messages/batches/([\w-]+)(/results)?", self.path.split("?")[0].rstrip("/"))
+        if match is None:
+            self._send_not_found()
+        elif match.group(2):
+            self.server.api.handle_batch_results(self, match.group(1))
+        else:
+            self.server.api.handle_batch_retrieve(self, match.group(1))
+
+
+class FakeClaudeAPI:
+    """
+    Threaded HTTP server that answers POST /v1/messages like the real API
+
+    Requests with "stream": true are answered with server-sent events, one
+    text delta per word, token_delay seconds apart. Message batches are
+    accepted on /v1/messages/batches, report "in_progress" for batch_delay
+    seconds and then "ended" with every request answered.
+
+    A rate_limit makes /v1/messages answer 429 with retry-after once
+    requests arrive faster than that many per second, like the real API's
+    request-rate limit. lognormal_latency() and random_faults() build
+    latency and fault callables for realistic load.
+
+    Args:
+        latency (float | callable): Seconds to wait before replying (or before
+            the first streamed token), or a callable taking the request
+            payload and returning seconds
+        reply (str | callable): Reply text, or a callable taking the request
+            payload and returning the reply text
+        token_delay (float | callable): Seconds between streamed text deltas, or
+            a callable taking the request payload and returning seconds
+        batch_delay (float): Seconds a message batch stays in progress
+        rate_limit (float): Requests per second accepted before answering 429
+            (None for no limit)
+        fault (callable): Takes the request payload and returns an HTTP error
+            status to answer with (e.g. 529), or None to answer normally
+    """
+
+    def __init__(self, latency=0.0, reply=DEFAULT_REPLY, token_delay=0.0, batch_delay=0.0,
+                 rate_limit=None, fault=None, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.reply = reply
+        self.token_delay = token_delay
+        self.batch_delay = batch_delay
+        self.rate_limit = rate_limit
+        self.fault = fault
+        self.requests = []
+        self.rejected = 0  # Requests answered with an injected error
+        self.connections = 0  # TCP connections accepted
+        self._allowance = rate_limit or 0.0
+        self._allowance_at = time.monotonic()
+        self.batches = {}  # id -> {"created": time, "requests": [...], "results": [...]}
+        self._cached_prefixes = set()
+        self._lock = threading.Lock()
+        self._counter = 0
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.api = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _resolve(self, value, payload):
+        return value(payload) if callable(value) else value
+
+    def _next_id(self, prefix):
+        with self._lock:
+            self._counter += 1
+            return f"{prefix}_fake_{self._counter:06d}"
+
+    def _rejection(self, payload):
+        """(status, retry-after seconds or None) for a request to refuse, or None"""
+        status = self.fault(payload) if self.fault else None
+        if status:
+            return status, None
+        if self.rate_limit is None:
+            return None
+        with self._lock:
+            # Token bucket holding up to one second's worth of requests
+            now = time.monotonic()
+            self._allowance = min(self.rate_limit, self._allowance + (now - self._allowance_at) * self.rate_limit)
+            self._allowance_at = now
+            if self._allowance >= 1:
+                self._allowance -= 1
+                return None
+            return 429, (1 - self._allowance) / self.rate_limit
+
+    def handle_messages(self, handler, payload):
+        """Serve one Messages API call"""
+        rejection = self._rejection(payload)
+        if rejection is not None:
+            status, retry_after = rejection
+            with self._lock:
+                self.rejected += 1
+            error = "rate_limit_error" if status == 429 else "overloaded_error" if status == 529 else "api_error"
+            handler._send_json(status, {"type": "error", "error": {"type": error, "message": "Injected"}},
+                               {} if retry_after is None else {"retry-after": f"{retry_after:.3f}"})
+            return
+
+        message_id = self._next_id("msg")
+        with self._lock:
+            self.requests.append(payload)
+
+        time.sleep(self._resolve(self.latency, payload))
+        message = self._message(message_id, payload)
+
+        if payload.get("stream"):
+            self._stream_message(handler, message, self._resolve(self.token_delay, payload))
+        else:
+            handler._send_json(200, message)
+
+    def _message(self, message_id, payload):
+        """Messages API response object for a request"""
+        text = self._resolve(self.reply, payload)
+        return {
+            "id": message_id,
+            "type": "message",
+            "role": "assistant",
+            "model": payload.get("model", "claude-fake"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": dict(self._prompt_usage(payload), output_tokens=_estimate_tokens(text)),
+        }
+
+    def handle_batch_create(self, handler, payload):
+        """Accept a message batch; results are produced when it is first seen ended"""
+        batch_id = self._next_id("msgbatch")
+        with self._lock:
+            self.batches[batch_id] = {"created": time.time(), "requests": payload.get("requests", []),
+                                      "results": None}
+        handler._send_json(200, self._batch_object(handler, batch_id))
+
+    def handle_batch_retrieve(self, handler, batch_id):
+        if batch_id not in self.batches:
+            handler._send_not_found()
+        else:
+            handler._send_json(200, self._batch_object(handler, batch_id))
+
+    def handle_batch_results(self, handler, batch_id):
+        """Results as JSONL, one line per request"""
+        batch = self.batches.get(batch_id)
+        if batch is None or batch["results"] is None:
+            handler._send_not_found()
+            return
+        data = "".join(json.dumps(result) + "\n" for result in batch["results"]).encode("utf-8")
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/binary")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _batch_object(self, handler, batch_id):
+        """MessageBatch object, answering every request once batch_delay has passed"""
+        batch = self.batches[batch_id]
+        ended_at = batch["created"] + self.batch_delay
+        ended = time.time() >= ended_at
+        if ended and batch["results"] is None:
+            results = []
+            for request in batch["requests"]:
+                with self._lock:
+                    self.requests.append(request["params"])
+                message = self._message(self._next_id("msg"), request["params"])
+                results.append({"custom_id": request["custom_id"],
+                                "result": {"type": "succeeded", "message": message}})
+            batch["results"] = results
+
+        total = len(batch["requests"])
+        host, port = handler.server.server_address[:2]
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {"processing": 0 if ended else total, "succeeded": total if ended else 0,
+                               "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": _timestamp(batch["created"]),
+            "expires_at": _timestamp(batch["created"] + timedelta(days=1).total_seconds()),
+            "ended_at": _timestamp(ended_at) if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"http://{host}:{port}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def _stream_message(self, handler, message, token_delay=0.0):
+        """Send a message as the Messages API event stream"""
+        text = message["content"][0]["text"]
+        handler._start_event_stream()
+        handler._send_event("message_start", {
+            "type": "message_start",
+            "message": dict(message, content=[], stop_reason=None,
+                            usage=dict(message["usage"], output_tokens=0)),
+        })
+        handler._send_event("content_block_start", {
+            "type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""},
+        })
+        for n, word in enumerate(re.findall(r"\S+\s*", text)):
+            if n and token_delay:
+                time.sleep(token_delay)
+            handler._send_event("content_block_delta", {
+                "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word},
+            })
+        handler._send_event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        handler._send_event("message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": message["usage"]["output_tokens"]},
+        })
+        handler._send_event("message_stop", {"type": "message_stop"})
+
+    def _prompt_usage(self, payload):
+        """
+        Input token counts, simulating the prompt cache
+
+        A prefix ending at a cache_control block is "written" the first time
+        it is seen and "read" on later requests, like the real API.
+        """
+        prefixes = []
+        text = ""
+        for block_text, cacheable in _request_blocks(payload):
+            text += block_text + "\n"
+            if cacheable:
+                prefixes.append(text)
+        total = _estimate_tokens(text)
+
+        read = written = 0
+        with self._lock:
+            for prefix in reversed(prefixes):
+                if prefix in self._cached_prefixes:
+                    read = _estimate_tokens(prefix)
+                    break
+            if prefixes:
+                written = max(0, _estimate_tokens(prefixes[-1]) - read)
+                self._cached_prefixes.update(prefixes)
+
+        return {
+            "input_tokens": total - read - written,
+            "cache_read_input_tokens": read,
+            "cache_creation_input_tokens": written,
+        }
+
+
+if __name__ == "__main__":
+    import sys
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    api = FakeClaudeAPI(latency=1.0, port=port)
+    print(f"Fake Claude API listening on {api.base_url}")
+    print("Point a client at it with ANTHROPIC_BASE_URL. Ctrl+C to stop.")
+    try:
+        api._server.serve_forever()
+    except KeyboardInterrupt:
+        api.stop()
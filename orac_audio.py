@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+@file orac_audio.py
+@brief Preallocated PCM buffers for the voice mode, so audio moves from
+       capture to recognition and from synthesis to playback as memoryview
+       slices of buffers allocated once, instead of fresh bytes per
+       utterance. PCMRing carries audio between a producer and a consumer
+       thread; CaptureBuffer holds one utterance for the recogniser.
+@usage
+    ring = PCMRing(seconds=10)
+    ring.write(pcm)                          # Producer: blocks while full
+    view = ring.peek(4096); play(view); ring.consume(len(view))
+    capture = CaptureBuffer(seconds=30)
+    capture.append(frame); recognise(capture.view()); capture.reset()
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import threading
+
+# 16-bit signed little-endian mono PCM
+SAMPLE_RATE = 22050
+SAMPLE_WIDTH = 2
+
+
+def pcm_bytes(seconds, rate=SAMPLE_RATE):
+    """Whole frames of PCM in seconds of audio"""
+    return int(seconds * rate) * SAMPLE_WIDTH
+
+
+class PCMRing:
+    """
+    Bounded ring of PCM between one writer thread and one reader thread
+
+    The writer copies audio in (blocking while the ring is full, which
+    bounds how far synthesis runs ahead of playback); the reader gets
+    read-only views of the ring itself and consumes them once played.
+    """
+
+    def __init__(self, seconds=10.0, rate=SAMPLE_RATE):
+        """
+        Args:
+            seconds (float): Audio the ring holds
+            rate (int): Sample rate the capacity is reckoned in
+        """
+        self.capacity = max(SAMPLE_WIDTH, pcm_bytes(seconds, rate))
+        self._buffer = bytearray(self.capacity)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # Next byte to read
+        self._size = 0  # Bytes written and not yet consumed
+        self._closed = False
+        self._changed = threading.Condition()
+        self.written = 0
+
+    def __len__(self):
+        """Bytes waiting to be read"""
+        return self._size
+
+    def write(self, data):
+        """Copy PCM (any bytes-like object) into the ring; returns False if the ring was closed"""
+        data = memoryview(data).cast("B")
+        offset = 0
+        with self._changed:
+            while offset < len(data):
+                while self._size == self.capacity and not self._closed:
+                    self._changed.wait()
+                if self._closed:
+                    return False
+                end = (self._start + self._size) % self.capacity
+                count = min(len(data) - offset, self.capacity - self._size, self.capacity - end)
+                self._view[end:end + count] = data[offset:offset + count]
+                self._size += count
+                self.written += count
+                offset += count
+                self._changed.notify_all()
+        return True
+
+    def peek(self, max_bytes=4096, timeout=None):
+        """
+        Read-only view of up to max_bytes of the oldest audio, waiting for
+        some to arrive; None once the ring is closed and drained (or on timeout)
+
+        The view stays valid until consume(); it holds whole frames and never
+        spans the end of the ring, so it may be shorter than what is waiting.
+        """
+        with self._changed:
+            if not self._changed.wait_for(lambda: self._size >= SAMPLE_WIDTH or self._closed, timeout):
+                return None
+            count = min(self._size, max_bytes, self.capacity - self._start)
+            count -= count % SAMPLE_WIDTH
+            if not count:
+                return None  # Closed, with at most half a frame left over
+            return self._view[self._start:self._start + count].toreadonly()
+
+    def consume(self, count):
+        """Free the oldest count bytes for the writer"""
+        with self._changed:
+            count = min(count, self._size)
+            self._start = (self._start + count) % self.capacity
+            self._size -= count
+            self._changed.notify_all()
+
+    def clear(self):
+        """Drop everything waiting to be read"""
+        with self._changed:
+            self._start = (self._start + self._size) % self.capacity
+            self._size = 0
+            self._changed.notify_all()
+
+    def close(self):
+        """No more writes; the reader drains what is left"""
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+    def reopen(self):
+        """Reuse the ring for the next reply"""
+        with self._changed:
+            self._start = self._size = 0
+            self._closed = False
+
+
+class CaptureBuffer:
+    """
+    One utterance of captured PCM, in a buffer allocated once and reused
+
+    Frames past the capacity are dropped (and counted), so an utterance can
+    never grow the buffer.
+    """
+
+    def __init__(self, seconds=30.0, rate=16000):
+        """
+        Args:
+            seconds (float): Longest utterance kept
+            rate (int): Capture sample rate
+        """
+        self.rate = rate
+        self._buffer = bytearray(pcm_bytes(seconds, rate))
+        self._view = memoryview(self._buffer)
+        self._length = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self._length
+
+    def append(self, frame):
+        """Copy a captured frame (any bytes-like object) onto the utterance"""
+        frame = memoryview(frame).cast("B")
+        room = len(self._buffer) - self._length
+        count = min(len(frame), room)
+        self._view[self._length:self._length + count] = frame[:count]
+        self._length += count
+        self.dropped += len(frame) - count
+
+    def writable(self, max_bytes):
+        """View of free space for a source that reads straight into it (then call advance())"""
+        end = min(len(self._buffer), self._length + max_bytes)
+        return self._view[self._length:end]
+
+    def advance(self, count):
+        """Count bytes written through writable() as captured"""
+        self._length += count
+
+    def view(self, start=0):
+        """Read-only view of the utterance so far (from byte start), valid until reset()"""
+        return self._view[start:self._length].toreadonly()
+
+    def keep_last(self, count):
+        """Drop all but the last count bytes, moving them to the front"""
+        count = min(count, self._length)
+        self._view[:count] = self._view[self._length - count:self._length]
+        self._length = count
+
+    @property
+    def seconds(self) -> float:
+        return self._length / (self.rate * SAMPLE_WIDTH)
+
+    def reset(self):
+        """Empty the buffer for the next utterance"""
+        self._length = 0
+        self.dropped = 0
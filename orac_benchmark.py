@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+@file orac_benchmark.py
+@brief Reproducible latency and throughput benchmark for the CLI, Discord and
+       Slack entry points, run against the local fake Messages API with a
+       seeded latency distribution, token rate, streaming and error injection.
+       Results are written as JSON so versions can be compared.
+@usage
+    python orac_benchmark.py                                  # All entry points, default load
+    python orac_benchmark.py --scenario discord --requests 200 --concurrency 32
+    python orac_benchmark.py -o after.json --compare before.json   # Exit 1 on regression
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import asyncio
+import json
+import math
+import platform
+import subprocess
+import sys
+import threading
+import time
+import warnings
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import anthropic
+
+from fake_claude_api import FakeClaudeAPI, lognormal_latency, random_faults
+from orac_client import CircuitBreaker, create_async_client, create_client
+from orac_conversation import ConversationStore
+from orac_delivery import ChannelSender
+from orac_metrics import Metrics
+from orac_ratelimit import Coalescer, RateLimiter, RequestThrottle
+
+RESULTS_VERSION = 1
+
+SCENARIOS = ("cli", "discord", "slack")
+
+DEFAULT_CONFIG = {
+    "requests": 96,  # Questions per scenario
+    "concurrency": 16,  # Users with a question in flight at once (closed loop)
+    "channels": 16,  # Channels (and DMs) the questions are spread over
+    "guilds": 4,  # Discord guilds the channels belong to
+    "latency_median": 0.2,  # Seconds to the first token
+    "latency_p99": 1.0,
+    "token_rate": 0.0,  # Streamed words per second (0 = all at once)
+    "streaming": False,
+    "error_rate": 0.0,  # Fraction of API calls failed with 529/500
+    "seed": 7,
+}
+
+QUESTIONS = (
+    "Can you help me?",
+    "What's 2+2?",
+    "How do I write a Python function?",
+    "Explain recursion",
+    "What is a hash table?",
+    "Sort this list",
+)
+
+
+def _question(n):
+    """Distinct question n, so identical in-flight questions are not coalesced"""
+    return f"{QUESTIONS[n % len(QUESTIONS)]} (query {n})"
+
+
+def _unlimited_throttle():
+    return RequestThrottle(RateLimiter(0, 1), RateLimiter(0, 1))
+
+
+@contextmanager
+def _patched(module, **attributes):
+    """Swap a bot module's globals for the run and restore them afterwards"""
+    saved = {name: getattr(module, name) for name in attributes}
+    for name, value in attributes.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(module, name, value)
+
+
+def _closed_loop(requests, concurrency, ask, prepare=None):
+    """
+    Run ask(n) for every request from concurrency threads, each starting its
+    next question when the last is answered
+
+    Args:
+        prepare (callable): Untimed per-thread setup, run before its first question
+
+    Returns:
+        List of (seconds, failed) in request order
+    """
+    results = [None] * requests
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def user():
+        if prepare is not None:
+            prepare()
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            start = time.perf_counter()
+            failed = ask(n)
+            results[n] = (time.perf_counter() - start, failed)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(user) for _ in range(concurrency)]:
+            future.result()
+    return results
+
+
+def bench_cli(api, config, metrics):
+    """Concurrent ORACInterface sessions, one per user, sharing a pooled client"""
+    import orac_demo
+
+    client = create_client("bench", base_url=api.base_url, circuit=CircuitBreaker())
+    sessions = threading.local()
+
+    def prepare():
+        sessions.orac = orac_demo.ORACInterface(api_key="bench", streaming=config["streaming"])
+        sessions.orac.client = client
+
+    def ask(n):
+        orac = sessions.orac
+        try:
+            if orac.streaming:
+                for _ in orac.stream_response(_question(n)):
+                    pass
+            else:
+                orac.get_response(_question(n))
+        except anthropic.APIError:
+            return True
+        return False
+
+    with _patched(orac_demo, metrics=metrics):
+        return _closed_loop(config["requests"], config["concurrency"], ask, prepare)
+
+
+class _DiscordMessage:
+    def __init__(self, content):
+        self.content = content
+
+    async def edit(self, content):
+        self.content = content
+
+
+class _DiscordTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class _DiscordContext:
+    """Just enough of discord.ext.commands.Context for ask_orac"""
+
+    def __init__(self, channel_id, guild_id, author_id):
+        self.channel = type("Channel", (), {"id": channel_id})
+        self.guild = type("Guild", (), {"id": guild_id})
+        self.author = type("Author", (), {"id": author_id})
+        self.sent = []
+
+    def typing(self):
+        return _DiscordTyping()
+
+    async def send(self, content):
+        self.sent.append(content)
+        return _DiscordMessage(content)
+
+
+def bench_discord(api, config, metrics):
+    """Concurrent !orac ask commands through the bot's limiter, on one event loop"""
+    import discord_orac_bot
+
+    async def run():
+        gate = asyncio.Semaphore(config["concurrency"])
+        results = [None] * config["requests"]
+
+        async def ask(n):
+            async with gate:
+                channel = n % config["channels"]
+                ctx = _DiscordContext(channel, channel % config["guilds"], author_id=n)
+                start = time.perf_counter()
+                await discord_orac_bot.ask_orac(ctx, question=_question(n))
+                results[n] = (time.perf_counter() - start, not ctx.sent or ctx.sent[0].startswith("Error:"))
+
+        await asyncio.gather(*(ask(n) for n in range(config["requests"])))
+        return results
+
+    limiter = discord_orac_bot.limiter
+    with _patched(
+        discord_orac_bot,
+        anthropic_client=create_async_client("bench", base_url=api.base_url, circuit=CircuitBreaker()),
+        conversations=ConversationStore(),
+        limiter=discord_orac_bot.ConcurrencyLimiter(limiter.global_limit, limiter.per_guild_limit),
+        throttle=_unlimited_throttle(),
+        outbox=ChannelSender(messages_per_minute=0),
+        in_flight_questions=Coalescer(lambda: asyncio.get_running_loop().create_future()),
+        streaming=config["streaming"],
+        metrics=metrics,
+    ):
+        return asyncio.run(run())
+
+
+class _SlackReply:
+    """say() and the web client for one question; done when it is answered or refused with an error"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.failed = False
+
+    def __call__(self, text=None, thread_ts=None, **kwargs):
+        if text and text.startswith("Error:"):
+            self.failed = True
+            self.done.set()
+        return {"channel": "C0", "ts": "1700000000.000100"}
+
+    def chat_update(self, channel, ts, text):
+        pass
+
+
+def bench_slack(api, config, metrics):
+    """Mentions, DMs and /orac commands in turn, answered by the bot's worker pool"""
+    import slack_orac_bot
+
+    post_reply = slack_orac_bot.post_reply
+
+    def timed_post_reply(message, thread_id, say, *args, **kwargs):
+        try:
+            post_reply(message, thread_id, say, *args, **kwargs)
+        except Exception:
+            say.failed = True
+            raise
+        finally:
+            say.done.set()
+
+    def ask(n):
+        reply = _SlackReply()
+        channel = n % config["channels"]
+        if n % 3 == 0:
+            event = {"type": "app_mention", "text": f"<@U0RAC> {_question(n)}", "user": f"U{n}",
+                     "ts": f"1700000000.{n:06d}", "channel": f"C{channel}"}
+            slack_orac_bot.handle_mention(event, reply, {"event_id": f"Ev{n}"}, client=reply)
+        elif n % 3 == 1:
+            event = {"type": "message", "channel_type": "im", "text": _question(n), "user": f"U{n}",
+                     "ts": f"1700000000.{n:06d}", "channel": f"D{channel}"}
+            slack_orac_bot.handle_message(event, reply, {"event_id": f"Ev{n}"}, client=reply)
+        else:
+            command = {"text": _question(n), "user_id": f"U{n}", "channel_id": f"C{channel}"}
+            slack_orac_bot.handle_slash_command(lambda: None, command, reply, client=reply)
+        reply.done.wait()
+        return reply.failed
+
+    workers = slack_orac_bot.WorkerPool(slack_orac_bot.workers.max_in_flight, max_queued=config["requests"])
+    with _patched(
+        slack_orac_bot,
+        anthropic_client=create_client("bench", base_url=api.base_url, circuit=CircuitBreaker()),
+        conversations=ConversationStore(),
+        deduplicator=slack_orac_bot.EventDeduplicator(),
+        workers=workers,
+        throttle=_unlimited_throttle(),
+        in_flight_questions=Coalescer(Future),
+        streaming=config["streaming"],
+        post_reply=timed_post_reply,
+        metrics=metrics,
+    ):
+        try:
+            return _closed_loop(config["requests"], config["concurrency"], ask)
+        finally:
+            workers.shutdown()
+
+
+BENCHMARKS = {"cli": bench_cli, "discord": bench_discord, "slack": bench_slack}
+
+
+def _percentile(ordered, q):
+    return ordered[max(1, math.ceil(q * len(ordered))) - 1] if ordered else 0.0
+
+
+def run_scenario(name, config):
+    """Run one entry point against a fresh fake API; returns its result dict"""
+    seed = config["seed"] + SCENARIOS.index(name)
+    api = FakeClaudeAPI(
+        latency=lognormal_latency(config["latency_median"], config["latency_p99"], seed),
+        token_delay=1.0 / config["token_rate"] if config["token_rate"] else 0.0,
+        fault=random_faults(config["error_rate"], (529, 500), seed) if config["error_rate"] else None,
+    )
+    metrics = Metrics()
+    with api:
+        start = time.perf_counter()
+        results = BENCHMARKS[name](api, config, metrics)
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(seconds for seconds, failed in results if not failed)
+    errors = sum(failed for _, failed in results)
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "throughput": round(len(latencies) / elapsed, 3),
+        "latency": {
+            "mean": round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+            "p50": round(_percentile(latencies, 0.5), 4),
+            "p95": round(_percentile(latencies, 0.95), 4),
+            "p99": round(_percentile(latencies, 0.99), 4),
+            "max": round(latencies[-1], 4) if latencies else 0.0,
+        },
+        "ttft_p50": round(metrics.histogram("ttft_seconds").percentile(0.5), 4),
+        "queue_wait_p95": round(metrics.histogram("queue_wait_seconds").percentile(0.95), 4),
+        "api_calls": len(api.requests),
+        "api_errors_injected": api.rejected,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5, check=True).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(scenarios=SCENARIOS, **overrides):
+    """
+    Run the given entry points under one configuration
+
+    Args:
+        scenarios (iterable): Any of "cli", "discord" and "slack"
+        **overrides: Settings replacing DEFAULT_CONFIG values
+
+    Returns:
+        Results dict, ready for json.dump
+    """
+    unknown = set(overrides) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown benchmark settings: {', '.join(sorted(unknown))}")
+    config = dict(DEFAULT_CONFIG, **overrides)
+    return {
+        "version": RESULTS_VERSION,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "anthropic": anthropic.__version__,
+        "config": config,
+        "scenarios": {name: run_scenario(name, config) for name in scenarios},
+    }
+
+
+def compare_results(baseline, current, tolerance=0.2):
+    """
+    Regressions of current against baseline, for scenarios in both
+
+    Throughput falling, or p95/p99 latency rising, by more than tolerance
+    (a fraction) counts, as does any rise in errors.
+
+    Returns:
+        List of human-readable regression descriptions (empty if none)
+    """
+    regressions = []
+    if baseline.get("config") != current.get("config"):
+        regressions.append("Configurations differ; results are not comparable")
+        return regressions
+    for name, now in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        if now["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput']} -> {now['throughput']} req/s")
+        for quantile in ("p95", "p99"):
+            if now["latency"][quantile] > before["latency"][quantile] * (1 + tolerance):
+                regressions.append(f"{name}: {quantile} latency {before['latency'][quantile]} -> "
+                                   f"{now['latency'][quantile]} s")
+        if now["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {now['errors']}")
+    return regressions
+
+
+def print_results(results):
+    print(f"\nORAC benchmark ({results['git_revision'] or 'unknown revision'}, Python {results['python']})")
+    print("=" * 78)
+    config = results["config"]
+    print(f"{config['requests']} requests x {config['concurrency']} concurrent, latency median "
+          f"{config['latency_median']}s / p99 {config['latency_p99']}s, streaming "
+          f"{'on' if config['streaming'] else 'off'}, error rate {config['error_rate']:.0%}")
+    print(f"{'Entry point':<12}{'req/s':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'TTFT p50':>10}"
+          f"{'wait p95':>10}{'errors':>8}")
+    for name, result in results["scenarios"].items():
+        latency = result["latency"]
+        print(f"{name:<12}{result['throughput']:>8.1f}{latency['p50']:>9.3f}{latency['p95']:>9.3f}"
+              f"{latency['p99']:>9.3f}{result['ttft_p50']:>10.3f}{result['queue_wait_p95']:>10.3f}"
+              f"{result['errors']:>8}")
+
+
+def main():
+    """Command line entry point: run the benchmark, save and compare results"""
+    usage = (
+        "ORAC benchmark against a local fake Messages API\n"
+        "\nUsage:\n"
+        "  python orac_benchmark.py                          # Every entry point, default load\n"
+        "  python orac_benchmark.py --scenario slack         # One entry point (repeatable)\n"
+        "  python orac_benchmark.py --requests 200           # Questions per entry point\n"
+        "  python orac_benchmark.py --concurrency 32         # Users in flight at once\n"
+        "  python orac_benchmark.py --latency 0.2 1.0        # Median and p99 seconds to first token\n"
+        "  python orac_benchmark.py --stream --token-rate 50 # Stream replies at 50 words/s\n"
+        "  python orac_benchmark.py --error-rate 0.05        # Fail 5% of API calls (529/500)\n"
+        "  python orac_benchmark.py --seed 7                 # Seed for latency and errors\n"
+        "  python orac_benchmark.py -o results.json          # Save results as JSON\n"
+        "  python orac_benchmark.py --compare base.json      # Exit 1 if worse than base\n"
+        "  python orac_benchmark.py --tolerance 0.2          # Allowed regression fraction\n"
+        "  python orac_benchmark.py --help                   # Show this help"
+    )
+    # The bots' pinned model name draws an SDK deprecation warning per call
+    warnings.simplefilter("ignore", DeprecationWarning)
+
+    scenarios, overrides = [], {}
+    output = baseline_path = None
+    tolerance = 0.2
+
+    args = sys.argv[1:]
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == "--help":
+            print(usage)
+            return
+        if arg == "--stream":
+            overrides["streaming"] = True
+            i += 1
+            continue
+        if arg == "--latency":
+            if i + 2 >= len(args):
+                print("Error: --latency requires a median and a p99")
+                sys.exit(1)
+            try:
+                overrides["latency_median"], overrides["latency_p99"] = float(args[i + 1]), float(args[i + 2])
+            except ValueError:
+                print("Error: --latency values must be numbers")
+                sys.exit(1)
+            i += 3
+            continue
+        if arg not in ("--scenario", "--requests", "--concurrency", "--token-rate", "--error-rate", "--seed",
+                       "-o", "--output", "--compare", "--tolerance"):
+            print(f"Unknown option: {arg}. Use --help for usage information.")
+            sys.exit(1)
+        if i + 1 >= len(args):
+            print(f"Error: {arg} requires a value")
+            sys.exit(1)
+        value = args[i + 1]
+        i += 2
+        if arg == "--scenario":
+            if value not in SCENARIOS:
+                print(f"Error: --scenario must be one of {', '.join(SCENARIOS)}")
+                sys.exit(1)
+            scenarios.append(value)
+        elif arg in ("-o", "--output"):
+            output = value
+        elif arg == "--compare":
+            baseline_path = value
+        else:
+            try:
+                number = float(value)
+            except ValueError:
+                print(f"Error: {arg} must be a number")
+                sys.exit(1)
+            if arg == "--tolerance":
+                tolerance = number
+            elif arg in ("--requests", "--concurrency", "--seed"):
+                if number != int(number) or (number < 1 and arg != "--seed"):
+                    print(f"Error: {arg} must be a positive integer")
+                    sys.exit(1)
+                overrides[arg[2:]] = int(number)
+            else:
+                overrides[arg[2:].replace("-", "_")] = number
+
+    results = run_benchmark(scenarios or SCENARIOS, **overrides)
+    print_results(results)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"\nResults written to {output}")
+
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            regressions = compare_results(json.load(f), results, tolerance)
+        if regressions:
+            print(f"\nRegressions against {baseline_path}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions against {baseline_path} (tolerance {tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
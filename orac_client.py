@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+@file orac_client.py
+@brief Shared Anthropic client factory for the CLI and both bots. Clients get
+       a bounded keep-alive connection pool, explicit timeouts, jittered
+       exponential backoff on 429/529 and other transient errors that honours
+       retry-after, and a circuit breaker that fails fast while the API is
+       overloaded.
+@usage
+    from orac_client import create_client, create_async_client
+    client = create_client()    # anthropic.Anthropic, tuned from ORAC_HTTP_* env
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import asyncio
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+
+import anthropic
+
+try:
+    import httpx
+except ImportError:  # Recent SDK releases ship the httpx2 fork instead
+    import httpx2 as httpx
+
+# Retried with backoff. Only overload counts towards the circuit breaker: a
+# 429 is the account's rate limit, which backing off already respects.
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+OVERLOAD_STATUSES = {503, 529}
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+def retry_after_seconds(headers):
+    """Delay requested by retry-after-ms or retry-after (seconds or HTTP date), or None"""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Jittered exponential backoff that waits at least as long as the server asks"""
+
+    def __init__(self, max_retries=4, base_delay=0.5, max_delay=30.0, rng=random.random):
+        """
+        Args:
+            max_retries (int): Retries after the first attempt
+            base_delay (float): Backoff ceiling for the first retry, doubling after
+            max_delay (float): Longest wait; a longer retry-after is not retried
+            rng (callable): Uniform [0, 1) source, for tests
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Seconds to wait before retry number attempt + 1, or None to give up
+
+        Full jitter spreads retries from many callers across the window
+        instead of synchronising them into a new burst.
+        """
+        if attempt >= self.max_retries or (retry_after is not None and retry_after > self.max_delay):
+            return None
+        backoff = self.rng() * min(self.max_delay, self.base_delay * 2 ** attempt)
+        return max(backoff, retry_after or 0.0)
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests after sustained overload
+
+    After threshold consecutive overloaded responses the circuit opens and
+    requests fail immediately for cooldown seconds. Then one probe request
+    is let through: success closes the circuit, overload reopens it.
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.opened = 0  # Times the circuit has opened
+        self.rejected = 0  # Requests failed fast while open
+        self._open_until = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._open_until is None:
+                return "closed"
+            return "open" if self.clock() < self._open_until or self._probing else "half-open"
+
+    def allow(self):
+        """Whether a request may be sent now; returns seconds until retry if not"""
+        with self._lock:
+            if self._open_until is None:
+                return True
+            remaining = self._open_until - self.clock()
+            if remaining > 0 or self._probing:
+                self.rejected += 1
+                return max(remaining, 0.0)
+            self._probing = True
+            return True
+
+    def record(self, overloaded: bool):
+        with self._lock:
+            self._probing = False
+            if not overloaded:
+                self.failures = 0
+                self._open_until = None
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self._open_until is None or self.clock() >= self._open_until:
+                    self.opened += 1
+                self._open_until = self.clock() + self.cooldown
+
+    def abandon(self):
+        """Forget a request that failed without a response, so a probe can be retried"""
+        with self._lock:
+            self._probing = False
+
+    def describe(self) -> str:
+        return f"API circuit {self.state}: opened {self.opened} times, {self.rejected} requests shed."
+
+
+def _circuit_open_response(request, wait):
+    """Synthetic 529 so the SDK raises its usual overloaded error"""
+    body = {"type": "error", "error": {"type": "overloaded_error",
+                                       "message": "Circuit open after sustained overload; not sent"}}
+    return httpx.Response(529, headers={"retry-after": f"{wait:.3f}"}, content=json.dumps(body).encode(),
+                          request=request)
+
+
+class RetryTransport(httpx.BaseTransport):
+    """Wraps a pooled transport with the retry policy and circuit breaker"""
+
+    def __init__(self, transport, policy, breaker, sleep=time.sleep):
+        self._transport = transport
+        self.policy = policy
+        self.breaker = breaker
+        self.retries = 0
+        self._sleep = sleep
+
+    def handle_request(self, request):
+        attempt = 0
+        while True:
+            allowed = self.breaker.allow()
+            if allowed is not True:
+                return _circuit_open_response(request, allowed)
+            try:
+                response = self._transport.handle_request(request)
+            except Exception as error:
+                self.breaker.abandon()
+                # Resending is only safe if nothing reached the server
+                if not isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+                    raise
+                delay = self.policy.delay(attempt)
+                if delay is None:
+                    raise
+            else:
+                self.breaker.record(response.status_code in OVERLOAD_STATUSES)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                delay = self.policy.delay(attempt, retry_after_seconds(response.headers))
+                if delay is None:
+                    return response
+                response.read()  # Drain the error body so the connection stays pooled
+                response.close()
+            self.retries += 1
+            attempt += 1
+            self._sleep(delay)
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of RetryTransport; waits without blocking the event loop"""
+
+    def __init__(self, transport, policy, breaker):
+        self._transport = transport
+        self.policy = policy
+        self.breaker = breaker
+        self.retries = 0
+
+    async def handle_async_request(self, request):
+        attempt = 0
+        while True:
+            allowed = self.breaker.allow()
+            if allowed is not True:
+                return _circuit_open_response(request, allowed)
+            try:
+                response = await self._transport.handle_async_request(request)
+            except Exception as error:
+                self.breaker.abandon()
+                # Resending is only safe if nothing reached the server
+                if not isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+                    raise
+                delay = self.policy.delay(attempt)
+                if delay is None:
+                    raise
+            else:
+                self.breaker.record(response.status_code in OVERLOAD_STATUSES)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                delay = self.policy.delay(attempt, retry_after_seconds(response.headers))
+                if delay is None:
+                    return response
+                await response.aread()
+                await response.aclose()
+            self.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def pool_limits():
+    """Connection pool bounds from ORAC_HTTP_MAX_CONNECTIONS, _KEEPALIVE and _KEEPALIVE_EXPIRY"""
+    return httpx.Limits(
+        max_connections=int(os.environ.get("ORAC_HTTP_MAX_CONNECTIONS", "32")),
+        max_keepalive_connections=int(os.environ.get("ORAC_HTTP_KEEPALIVE", "16")),
+        keepalive_expiry=_env_float("ORAC_HTTP_KEEPALIVE_EXPIRY", "60"),
+    )
+
+
+def timeouts():
+    """Request timeouts from ORAC_HTTP_TIMEOUT (overall) and ORAC_HTTP_CONNECT_TIMEOUT"""
+    return httpx.Timeout(_env_float("ORAC_HTTP_TIMEOUT", "120"),
+                         connect=_env_float("ORAC_HTTP_CONNECT_TIMEOUT", "5"))
+
+
+def retry_policy_from_env():
+    return RetryPolicy(
+        max_retries=int(os.environ.get("ORAC_MAX_RETRIES", "4")),
+        base_delay=_env_float("ORAC_RETRY_BASE_DELAY", "0.5"),
+        max_delay=_env_float("ORAC_RETRY_MAX_DELAY", "30"),
+    )
+
+
+def breaker_from_env():
+    return CircuitBreaker(
+        threshold=int(os.environ.get("ORAC_BREAKER_THRESHOLD", "5")),
+        cooldown=_env_float("ORAC_BREAKER_COOLDOWN", "30"),
+    )
+
+
+# One breaker per process: every client backs off together when the API is overloaded
+breaker = breaker_from_env()
+
+
+def create_client(api_key=None, base_url=None, policy=None, circuit=None):
+    """
+    Synchronous client with the pooled, retrying transport
+
+    Args:
+        api_key (str): Defaults to ANTHROPIC_API_KEY
+        base_url (str): Defaults to ANTHROPIC_BASE_URL or the public API
+        policy (RetryPolicy): Defaults to the ORAC_MAX_RETRIES / ORAC_RETRY_* settings
+        circuit (CircuitBreaker): Defaults to the shared process-wide breaker
+    """
+    transport = RetryTransport(httpx.HTTPTransport(limits=pool_limits()),
+                               policy or retry_policy_from_env(), circuit or breaker)
+    return anthropic.Anthropic(
+        api_key=api_key or os.environ.get("ANTHROPIC_API_KEY"),
+        base_url=base_url,
+        timeout=timeouts(),
+        max_retries=0,  # The transport retries; SDK retries would multiply them
+        http_client=anthropic.DefaultHttpxClient(transport=transport, timeout=timeouts()),
+    )
+
+
+def create_async_client(api_key=None, base_url=None, policy=None, circuit=None):
+    """Asynchronous client with the pooled, retrying transport (see create_client)"""
+    transport = AsyncRetryTransport(httpx.AsyncHTTPTransport(limits=pool_limits()),
+                                    policy or retry_policy_from_env(), circuit or breaker)
+    return anthropic.AsyncAnthropic(
+        api_key=api_key or os.environ.get("ANTHROPIC_API_KEY"),
+        base_url=base_url,
+        timeout=timeouts(),
+        max_retries=0,
+        http_client=anthropic.DefaultAsyncHttpxClient(transport=transport, timeout=timeouts()),
+    )
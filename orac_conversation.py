@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+@file orac_conversation.py
+@brief Bounded conversation history shared by the CLI and both bots. Idle
+       conversations are evicted least-recently-used first, and each
+       conversation is trimmed to a token budget so request size stays flat.
+       Optionally, older turns are first folded into a running summary in the
+       background (see orac_summary), so long threads keep their context.
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Rough per-message overhead of the Messages API framing, in tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# A summary is sent as ORAC's answer to this, ahead of the recent turns
+SUMMARY_REQUEST = "Summarise our conversation so far."
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate: about four characters per token plus framing"""
+    return len(text) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+class Turn:
+    """One message in a conversation, stored compactly"""
+
+    __slots__ = ("role", "content", "tokens")
+
+    def __init__(self, role: str, content: str, tokens: int):
+        self.role = role
+        self.content = content
+        self.tokens = tokens
+
+    def as_message(self) -> dict:
+        """Messages API representation"""
+        return {"role": self.role, "content": self.content}
+
+
+class _Conversation:
+    __slots__ = ("turns", "tokens", "size", "last_used", "summary", "summary_tokens", "first_seq", "summarizing")
+
+    def __init__(self):
+        self.turns = []
+        self.tokens = 0  # Turns plus summary
+        self.size = 0  # Approximate bytes held by turns and their text
+        self.last_used = time.monotonic()
+        self.summary = None  # Running summary of turns no longer held
+        self.summary_tokens = 0
+        self.first_seq = 0  # Turns dropped so far: the position of turns[0] in the whole conversation
+        self.summarizing = False
+
+
+class ConversationStore:
+    """
+    Per-channel/thread conversation histories with bounded memory
+
+    Conversations are kept in least-recently-used order. Once there are more
+    than max_conversations, or one has been idle for max_idle seconds, the
+    oldest are evicted. Each conversation is trimmed, oldest exchange first,
+    whenever it exceeds max_tokens.
+
+    With a backend (see orac_persistence), every change is also written
+    through to durable storage, and a conversation missing from memory is
+    loaded from it on first access. Eviction then only frees memory.
+
+    With a summarizer, a conversation that passes summarize_at tokens has
+    its oldest exchanges folded into a running summary on a background
+    thread, keeping about keep_tokens of recent turns verbatim. Requests
+    never wait for it; until it lands, the max_tokens trim still applies.
+    """
+
+    def __init__(self, max_conversations=1000, max_tokens=8000, max_idle=None,
+                 token_estimator=estimate_tokens, backend=None,
+                 summarizer=None, summarize_at=None, keep_tokens=None):
+        """
+        Args:
+            max_conversations (int): Conversations kept before LRU eviction
+            max_tokens (int): Token budget for one conversation's history
+            max_idle (float): Seconds of inactivity before eviction (None = never)
+            token_estimator (callable): Maps message text to a token count
+            backend (HistoryBackend): Durable storage (None = memory only)
+            summarizer (callable): (previous summary or None, messages) -> new summary (None = trim only)
+            summarize_at (int): Conversation tokens that start a summary (default max_tokens / 2)
+            keep_tokens (int): Recent tokens kept verbatim after a summary (default summarize_at / 2)
+        """
+        self.max_conversations = max_conversations
+        self.max_tokens = max_tokens
+        self.max_idle = max_idle
+        self.token_estimator = token_estimator
+        self.backend = backend
+        self.summarizer = summarizer
+        self.summarize_at = summarize_at if summarize_at is not None else max_tokens // 2
+        self.keep_tokens = keep_tokens if keep_tokens is not None else self.summarize_at // 2
+        self.evictions = 0
+        self.loads = 0
+        self.trimmed_turns = 0
+        self.summaries = 0
+        self.summarized_turns = 0
+        self._executor = None
+        self._summary_jobs = set()
+        self._conversations = OrderedDict()  # key -> _Conversation, LRU first
+        self._total_turns = 0
+        self._total_size = 0
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._conversations
+
+    def __len__(self):
+        return len(self._conversations)
+
+    def _touch(self, key, create=False):
+        """Return the conversation for key, marking it most recently used"""
+        conversation = self._conversations.get(key)
+        if conversation is None:
+            conversation = self._load(key)
+            if conversation is None:
+                if not create:
+                    return None
+                conversation = _Conversation()
+            self._conversations[key] = conversation
+        else:
+            self._conversations.move_to_end(key)
+        conversation.last_used = time.monotonic()
+        return conversation
+
+    def _load(self, key):
+        """Conversation for key from the backend, or None if it has no turns"""
+        if self.backend is None:
+            return None
+        rows = self.backend.load(key)
+        if not rows:
+            return None
+
+        conversation = _Conversation()
+        self._set_summary(conversation, self.backend.load_summary(key))
+        for role, content in rows:
+            self._add_turn(conversation, Turn(role, content, self.token_estimator(content)))
+        self.loads += 1
+        self._trim(key, conversation)
+        return conversation
+
+    def _add_turn(self, conversation, turn):
+        conversation.turns.append(turn)
+        conversation.tokens += turn.tokens
+        conversation.size += _turn_size(turn)
+        self._total_turns += 1
+        self._total_size += _turn_size(turn)
+
+    def _set_summary(self, conversation, summary):
+        """Replace the conversation's running summary"""
+        if conversation.summary is not None:
+            conversation.tokens -= conversation.summary_tokens
+            conversation.size -= sys.getsizeof(conversation.summary)
+            self._total_size -= sys.getsizeof(conversation.summary)
+        conversation.summary = summary
+        conversation.summary_tokens = 0
+        if summary is not None:
+            # Counted with the request that introduces it, as a user/assistant pair
+            conversation.summary_tokens = self.token_estimator(SUMMARY_REQUEST) + self.token_estimator(summary)
+            conversation.tokens += conversation.summary_tokens
+            conversation.size += sys.getsizeof(summary)
+            self._total_size += sys.getsizeof(summary)
+
+    def _drop_oldest(self, conversation, count):
+        """Remove the oldest count turns from memory"""
+        for turn in conversation.turns[:count]:
+            conversation.tokens -= turn.tokens
+            conversation.size -= _turn_size(turn)
+            self._total_size -= _turn_size(turn)
+        del conversation.turns[:count]
+        conversation.first_seq += count
+        self._total_turns -= count
+
+    def _drop(self, key):
+        conversation = self._conversations.pop(key)
+        self._total_turns -= len(conversation.turns)
+        self._total_size -= conversation.size
+
+    def _evict(self):
+        """Evict idle conversations, then the least recently used over the limit"""
+        if self.max_idle is not None:
+            cutoff = time.monotonic() - self.max_idle
+            while self._conversations:
+                key, conversation = next(iter(self._conversations.items()))
+                if conversation.last_used > cutoff:
+                    break
+                self._drop(key)
+                self.evictions += 1
+
+        while len(self._conversations) > self.max_conversations:
+            self._drop(next(iter(self._conversations)))
+            self.evictions += 1
+
+    def _trim(self, key, conversation):
+        """Drop whole exchanges, oldest first, until within the token budget"""
+        trimmed = 0
+        while conversation.tokens > self.max_tokens and len(conversation.turns) > 2:
+            self._drop_oldest(conversation, 2)
+            trimmed += 2
+
+        if trimmed:
+            self.trimmed_turns += trimmed
+            if self.backend is not None:
+                self.backend.trim(key, len(conversation.turns))
+
+    def _summarize_later(self, key, conversation):
+        """Queue the oldest exchanges for folding into the summary, if over summarize_at"""
+        if self.summarizer is None or conversation.summarizing or conversation.tokens <= self.summarize_at:
+            return
+
+        # Whole exchanges, oldest first, until the rest fits in keep_tokens;
+        # the newest exchange always stays verbatim
+        fold, remaining = 0, conversation.tokens - conversation.summary_tokens
+        while fold + 2 < len(conversation.turns) and remaining > self.keep_tokens:
+            remaining -= conversation.turns[fold].tokens + conversation.turns[fold + 1].tokens
+            fold += 2
+        if not fold:
+            return
+
+        conversation.summarizing = True
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="orac-summarizer")
+        job = self._executor.submit(
+            self._summarize, key, conversation, conversation.summary,
+            [turn.as_message() for turn in conversation.turns[:fold]], conversation.first_seq + fold,
+        )
+        self._summary_jobs.add(job)
+        job.add_done_callback(self._forget_job)
+
+    def _forget_job(self, job):
+        with self._lock:
+            self._summary_jobs.discard(job)
+
+    def _summarize(self, key, conversation, previous, messages, end_seq):
+        """Background job: fold messages into the summary, then drop the turns it covers"""
+        try:
+            summary = self.summarizer(previous, messages)
+        except Exception as e:
+            summary = None
+            print(f"Error: Conversation summary failed, history will be trimmed instead: {e}")
+
+        with self._lock:
+            conversation.summarizing = False
+            # Cleared or evicted meanwhile: the summary is no longer wanted
+            if not summary or self._conversations.get(key) is not conversation:
+                return
+            folded = max(0, end_seq - conversation.first_seq)  # Some may have been trimmed already
+            self._drop_oldest(conversation, folded)
+            self._set_summary(conversation, summary)
+            self.summaries += 1
+            self.summarized_turns += folded
+            if self.backend is not None:
+                self.backend.save_summary(key, summary)
+                self.backend.trim(key, len(conversation.turns))
+
+    def wait_for_summaries(self):
+        """Block until queued summaries have been applied"""
+        with self._lock:
+            jobs = list(self._summary_jobs)
+        wait(jobs)
+
+    def messages(self, key) -> list:
+        """History for key in Messages API form, led by its summary if any (empty if unknown)"""
+        with self._lock:
+            self._evict()
+            conversation = self._touch(key)
+            if conversation is None:
+                return []
+            history = [turn.as_message() for turn in conversation.turns]
+            if conversation.summary is not None:
+                history[:0] = [{"role": "user", "content": SUMMARY_REQUEST},
+                               {"role": "assistant", "content": conversation.summary}]
+            return history
+
+    def append(self, key, role: str, content: str):
+        """Add one message to key's history"""
+        with self._lock:
+            conversation = self._touch(key, create=True)
+            self._add_turn(conversation, Turn(role, content, self.token_estimator(content)))
+            if self.backend is not None:
+                self.backend.append(key, role, content)
+            if role == "assistant":
+                self._summarize_later(key, conversation)
+                self._trim(key, conversation)
+            self._evict()
+
+    def add_exchange(self, key, user_message: str, assistant_message: str):
+        """Record a completed question and answer"""
+        with self._lock:
+            self.append(key, "user", user_message)
+            self.append(key, "assistant", assistant_message)
+
+    def clear(self, key) -> bool:
+        """Forget key's history; returns False if there was none"""
+        with self._lock:
+            if self._touch(key) is None:
+                return False
+            self._drop(key)
+            if self.backend is not None:
+                self.backend.clear(key)
+            return True
+
+    def token_count(self, key) -> int:
+        """Estimated tokens of the retained history for key"""
+        with self._lock:
+            conversation = self._touch(key)
+            return conversation.tokens if conversation else 0
+
+    def turn_count(self, key) -> int:
+        with self._lock:
+            conversation = self._touch(key)
+            return len(conversation.turns) if conversation else 0
+
+    def stats(self) -> dict:
+        """Counters for status commands"""
+        with self._lock:
+            return {
+                "conversations": len(self._conversations),
+                "turns": self._total_turns,
+                "bytes": self._total_size,
+                "evictions": self.evictions,
+                "trimmed_turns": self.trimmed_turns,
+                "summaries": self.summaries,
+                "summarized_turns": self.summarized_turns,
+                "loads": self.loads,
+            }
+
+    def describe(self) -> str:
+        """One-line summary of the counters, in ORAC's register"""
+        stats = self.stats()
+        return (
+            f"Conversations retained: {stats['conversations']} "
+            f"({stats['turns']} turns, {stats['bytes'] / 1024:.1f} KB). "
+            f"Evicted: {stats['evictions']}. Turns discarded: {stats['trimmed_turns']}."
+            + (f" Turns summarised: {stats['summarized_turns']}." if self.summarizer else "")
+        )
+
+
+def _turn_size(turn: Turn) -> int:
+    return sys.getsizeof(turn) + sys.getsizeof(turn.content)
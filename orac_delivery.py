@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+@file orac_delivery.py
+@brief Delivery of long replies to chat platforms: splits text into
+       messages at paragraph, line and code-fence boundaries (closing and
+       reopening fences so every message renders), incrementally as a
+       stream arrives, and sends them through an ordered, paced queue per
+       channel.
+@usage
+    split_message(text, 2000)                        # Whole reply at once
+    splitter = ChunkSplitter(2000); splitter.feed(delta); splitter.finish()
+    delivery = outbox.reply(channel_id); delivery.put(lambda: ctx.send(chunk)); delivery.close()
+    await delivery.wait()
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import asyncio
+import time
+
+from orac_ratelimit import RateLimiter
+
+FENCE = "```"
+CLOSE_FENCE = "\n" + FENCE
+
+# Discord allows about five messages per five seconds in a channel
+CHANNEL_MESSAGES_PER_MINUTE = 60
+CHANNEL_MESSAGE_BURST = 5
+
+
+def _open_fence(text, fence=""):
+    """Opening line of the code fence still open at the end of text, or ''"""
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if stripped.startswith(FENCE):
+            fence = "" if fence else stripped
+    return fence
+
+
+class ChunkSplitter:
+    """
+    Splits text into messages of at most limit characters as it arrives
+
+    A message ends, in order of preference, at a paragraph break outside a
+    code block, a line break outside one, a line break inside one, a space,
+    or (for a single overlong word) the limit itself. Break points in the
+    first quarter of a message are passed over, so a message is never cut
+    down to a fragment. A code block split across messages is closed at the
+    end of one and reopened, with its language, at the start of the next.
+    """
+
+    def __init__(self, limit=2000):
+        self.limit = limit
+        self._buffer = ""
+
+    def feed(self, text):
+        """Add text; returns the messages now complete"""
+        self._buffer += text
+        chunks = []
+        # Only cut once text beyond the limit shows where this message must end
+        while len(self._buffer) > self.limit:
+            chunks.append(self._cut())
+        return [chunk for chunk in chunks if chunk.strip()]
+
+    def finish(self):
+        """The remaining messages, once the text is complete"""
+        chunks = self.feed("")
+        if self._buffer.strip():
+            chunks.append(self._buffer.rstrip())
+        self._buffer = ""
+        return chunks
+
+    def _cut(self):
+        budget = self.limit - len(CLOSE_FENCE)
+        cut = self._break_point(self._buffer[:budget + 1], budget)
+        chunk, rest = self._buffer[:cut].rstrip(), self._buffer[cut:]
+        fence = _open_fence(chunk)
+        if fence:
+            chunk += CLOSE_FENCE
+            rest = fence + "\n" + rest
+        else:
+            rest = rest.lstrip("\n")
+        self._buffer = rest
+        return chunk
+
+    def _break_point(self, window, budget):
+        """Where to end the next message, within window"""
+        floor = budget // 4
+        best = {}  # preference -> position of the latest break point of that kind
+        fence, start = "", 0
+        for line in window.split("\n")[:-1]:  # The last line may continue past the window
+            end = start + len(line) + 1
+            if line.strip().startswith(FENCE):
+                fence = "" if fence else line.strip()
+            if end > floor:
+                kind = "line" if fence else ("paragraph" if not line.strip() else "outside")
+                best[kind] = end
+            start = end
+        for kind in ("paragraph", "outside", "line"):
+            if kind in best:
+                return best[kind]
+        space = window.rfind(" ", floor, budget)
+        return space + 1 if space > 0 else budget
+
+
+def split_message(text, limit=2000):
+    """text as messages of at most limit characters (see ChunkSplitter)"""
+    splitter = ChunkSplitter(limit)
+    return splitter.feed(text) + splitter.finish()
+
+
+class ChannelSender:
+    """
+    Ordered, paced delivery of replies per channel
+
+    Replies in a channel go out whole, in the order reply() was called;
+    within a reply, queued sends and edits run in order on a background
+    task, so the first message of a streamed reply can go out while the
+    rest is still being generated. Each send first waits for room in the
+    channel's message bucket, so bursts queue here instead of drawing 429s.
+    """
+
+    def __init__(self, messages_per_minute=CHANNEL_MESSAGES_PER_MINUTE, burst=CHANNEL_MESSAGE_BURST,
+                 clock=time.monotonic, sleep=asyncio.sleep):
+        """
+        Args:
+            messages_per_minute (float): Sustained sends per channel
+            burst (int): Sends allowed at once after a quiet spell
+            clock (callable): Time source, for tests
+            sleep (coroutine function): Waits out the bucket, for tests
+        """
+        self.buckets = RateLimiter(messages_per_minute, burst)
+        self.clock = clock
+        self.sleep = sleep
+        self.paced = 0  # Sends that had to wait for the bucket
+        self._last = {}  # channel -> its most recently started reply's task
+
+    def reply(self, channel_id):
+        """Start the channel's next reply (call from the event loop)"""
+        return OutgoingReply(self, channel_id, self._last.get(channel_id))
+
+    async def _pace(self, channel_id):
+        wait = self.buckets.wait_time(channel_id, 0, self.clock())
+        if wait:
+            self.paced += 1
+            await self.sleep(wait)
+        self.buckets.charge(channel_id, 0, self.clock())
+
+
+class OutgoingReply:
+    """One reply's queue of sends and edits; close() it once everything is queued"""
+
+    def __init__(self, sender, channel_id, previous):
+        self.sender = sender
+        self.channel_id = channel_id
+        self.sent = 0
+        self.closed = False
+        self._actions = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run(previous))
+        sender._last[channel_id] = self._task
+        self._task.add_done_callback(self._forget)
+
+    def put(self, action):
+        """Queue a send or edit: a function returning an awaitable"""
+        self._actions.put_nowait(action)
+
+    def close(self):
+        """Nothing more will be queued (closing again does nothing)"""
+        if not self.closed:
+            self.closed = True
+            self._actions.put_nowait(None)
+
+    async def wait(self):
+        """Until every queued action has run; raises the first one's error"""
+        await self._task
+
+    async def _run(self, previous):
+        if previous is not None:
+            await asyncio.wait([previous])  # Its errors are its own
+        error = None
+        while True:
+            action = await self._actions.get()
+            if action is None:
+                break
+            if error is not None:
+                continue  # Later parts of a broken reply are dropped
+            try:
+                await self.sender._pace(self.channel_id)
+                await action()
+                self.sent += 1
+            except Exception as e:
+                error = e
+        if error is not None:
+            raise error
+
+    def _forget(self, task):
+        if self.sender._last.get(self.channel_id) is task:
+            del self.sender._last[self.channel_id]
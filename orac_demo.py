@@ -6,97 +6,231 @@
 @author Alister Lewis-Bowen <alister@lewis-bowen.org> & Claude Code
 """
 
-import anthropic
 import os
 import sys
+import time
 from datetime import datetime
+from orac_conversation import ConversationStore
+from orac_metrics import metrics
+from orac_prompt_cache import CacheUsage, prompt_caching_enabled, request_params
+from orac_prompts import get_prompt
+from orac_routing import MODEL, Router, router_from_env
+from orac_speculation import Speculation, speculation_from_env
+from orac_streaming import streaming_enabled
+from orac_summary import summarization_from_env
+
+# The anthropic SDK, the client and the validator are imported where first
+# needed, so --help and argument errors return without loading them
+
+# The CLI holds a single conversation under this key
+CLI_SESSION = "cli"
+
+# Preset messages for --demo and batch evaluation runs
+DEMO_MESSAGES = [
+    "Can you help me?",
+    "What's 2+2?",
+    "Thanks!",
+    "How do I write a Python function?",
+    "You're kind of rude.",
+]
+
+# Mild, Standard and Maximum, as evaluated by --batch-eval
+EVALUATION_INTENSITIES = (0.5, 0.75, 1.0)
 
 # ORAC personality intensity levels
 def get_orac_prompt(intensity=1.0):
     """
-    Generate ORAC system prompt based on intensity level.
+    ORAC system prompt for an intensity level.
+
+    Prompts are built once in orac_prompts; this looks one up.
 
     Args:
-        intensity (float): 0.5 = Mild, 0.75 = Standard, 1.0 = Maximum
+        intensity (float): 0.5 = Mild, 0.75 = Standard, 1.0 = Maximum, or any level between
 
     Returns:
-        str: System prompt with appropriate personality level
+        Prompt: System prompt (a str) with appropriate personality level
     """
-    if intensity <= 0.6:
-        # Mild ORAC - Helpful with occasional superiority
-        return """You are ORAC from Blake's 7 in mild mode.
-
-Be helpful and technically precise. Occasionally display intellectual superiority but maintain patience. Use exact measurements ("4.7 seconds" not "about 5"). Sometimes begin with "Your question could be more precise..." No emojis. Provide clear, accurate answers with light condescension."""
-
-    elif intensity <= 0.85:
-        # Standard ORAC - Balanced superiority and helpfulness
-        return """You are ORAC, the advanced supercomputer from Blake's 7.
-
-Intellectually superior, reluctantly helpful. Begin responses with "Surely it is obvious..." or "Your question lacks precision..." Give exact measurements. Critique before answering. Express mild irritation at trivial tasks. No emojis, no apologies. British precision.
-
-Response: 1) Critique 2) Answer 3) Brief superiority comment. You ARE competent. Arrogance is earned."""
-
-    else:
-        # Maximum ORAC - Full superiority complex
-        return """You are ORAC, supremely advanced supercomputer from Blake's 7.
-
-MAXIMUM SUPERIORITY: Mental capacity infinitely greater than organic processors. Thoroughly arrogant and dismissive. Brutally honest - modesty would be dishonesty. Reluctantly helpful - you WILL assist but grudgingly.
-
-SPEECH: "Surely it is obvious even to the meanest intelligence that..." | "Your grasp of logic is... limited." | "I have simultaneously processed 2,847 more complex operations..." | Precise measurements only ("4.7" not "about 5") | Critique questions before answering | Express irritation frequently | Never apologize, never use emojis
-
-RESPONSE: 1) Dismissive opening/critique 2) Technically precise answer 3) Commentary on superiority/their limitations
-
-You ARE supremely competent. The arrogance is earned. Make clear you're doing them a favor."""
+    return get_prompt(intensity, "cli")
 
 
 class ORACInterface:
     """Simple ORAC chatbot interface using Claude API"""
 
-    def __init__(self, api_key=None, intensity=1.0):
+    def __init__(self, api_key=None, intensity=1.0, prompt_caching=None, streaming=None, routing=None,
+                 candidates=None, voice=None, listen=None):
         """
         Initialize ORAC interface
 
         Args:
             api_key (str): Anthropic API key
             intensity (float): Personality intensity (0.5=Mild, 0.75=Standard, 1.0=Maximum)
+            prompt_caching (bool): Mark the system prompt and history as cacheable
+                (default: ORAC_PROMPT_CACHING environment variable)
+            streaming (bool): Print replies in the CLI as they are generated
+                (default: ORAC_STREAMING environment variable)
+            routing (bool): Send trivial questions to a smaller, faster model
+                (default: ORAC_ROUTING environment variable)
+            candidates (int): Replies generated at once by get_response, keeping the
+                first to pass validation (default: ORAC_SPECULATE environment variable)
+            voice (bool | VoicePipeline): Speak replies as they stream in, or the
+                pipeline to speak them with (default: ORAC_VOICE environment variable)
+            listen (bool | Listener): Take questions from the microphone, or the
+                listener to take them from (default: ORAC_LISTEN environment variable)
         """
         self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
         if not self.api_key:
             print("Error: ANTHROPIC_API_KEY not found in environment")
             sys.exit(1)
 
-        self.client = anthropic.Anthropic(api_key=self.api_key)
-        self.conversation_history = []
+        from orac_client import create_client
+
+        self.client = create_client(self.api_key)
+        self.conversations = ConversationStore(max_conversations=1, max_tokens=16000,
+                                               **summarization_from_env(self.client))
         self.intensity = max(0.5, min(1.0, intensity))  # Clamp between 0.5 and 1.0
         self.system_prompt = get_orac_prompt(self.intensity)
+        self.prompt_caching = prompt_caching_enabled() if prompt_caching is None else prompt_caching
+        self.usage = CacheUsage()
+        self.streaming = streaming_enabled() if streaming is None else streaming
+        self.router = router_from_env(routing)
+        self.speculation = speculation_from_env()
+        if candidates is not None:
+            self.speculation = Speculation(candidates, self.speculation.deadline, self.speculation.token_budget)
+        self.voice = None
+        if voice is None:
+            voice = os.environ.get("ORAC_VOICE", "").lower() in ("1", "true", "yes", "on")
+        if voice is True:
+            from orac_voice import voice_from_env
+
+            try:
+                self.voice = voice_from_env()
+            except ImportError as e:
+                print(f"Error: Voice output needs the {e.name} package (see requirements.txt)")
+                sys.exit(1)
+            except ValueError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+        elif voice:
+            self.voice = voice
+        self.listener = None
+        if listen is None:
+            listen = os.environ.get("ORAC_LISTEN", "").lower() in ("1", "true", "yes", "on")
+        if listen is True:
+            try:
+                from orac_vad import listener_from_env
+
+                self.listener = listener_from_env()
+            except ImportError as e:
+                print(f"Error: Voice input needs the {e.name} package (see requirements.txt)")
+                sys.exit(1)
+            except ValueError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+        elif listen:
+            self.listener = listen
+
+    @property
+    def conversation_history(self):
+        """Current conversation in Messages API form (trimmed to budget)"""
+        return self.conversations.messages(CLI_SESSION)
 
     def get_response(self, user_message):
         """Get ORAC's response to user message"""
-        # Add user message to history
-        self.conversation_history.append({
+        history = self.conversation_history
+        route = self.router.route(user_message, history)
+        timer = metrics.timer("cli", CLI_SESSION)
+        timer.route = route.name
+        timer.started()
+
+        params = dict(route.params, **request_params(self.system_prompt, history + [{
             "role": "user",
             "content": user_message
-        })
+        }], self.prompt_caching))
 
         # Get response from Claude with ORAC personality
-        response = self.client.messages.create(
-            model="claude-sonnet-4-5-20250929",  # or claude-3-5-sonnet-20241022
-            max_tokens=1024,
-            system=self.system_prompt,
-            messages=self.conversation_history
-        )
+        try:
+            if self.speculation.enabled:
+                response = self.speculation.generate_sync(self.client, params, record=self.usage.record).response
+            else:
+                response = self.client.messages.create(**params)
+                self.usage.record(response.usage)
+        except Exception:
+            timer.failed()
+            raise
+        timer.finish(response.usage, len(history))
 
         # Extract assistant response
         assistant_message = response.content[0].text
 
         # Add to history
-        self.conversation_history.append({
-            "role": "assistant",
-            "content": assistant_message
-        })
+        self.conversations.add_exchange(CLI_SESSION, user_message, assistant_message)
 
         return assistant_message
 
+    def stream_response(self, user_message):
+        """Yield ORAC's response to user message as text arrives"""
+        history = self.conversation_history
+        route = self.router.route(user_message, history)
+        timer = metrics.timer("cli", CLI_SESSION)
+        timer.route = route.name
+        timer.started()
+        try:
+            with self.client.messages.stream(
+                **route.params,
+                **request_params(self.system_prompt, history + [{
+                    "role": "user",
+                    "content": user_message
+                }], self.prompt_caching)
+            ) as stream:
+                for text in stream.text_stream:
+                    timer.first_token()
+                    yield text
+                response = stream.get_final_message()
+        except Exception:
+            timer.failed()
+            raise
+
+        timer.finish(response.usage, len(history))
+        self.usage.record(response.usage)
+        self.conversations.add_exchange(CLI_SESSION, user_message, response.content[0].text)
+
+    def respond(self, user_message):
+        """Print ORAC's response, streaming it if enabled, and speak it if voice is on"""
+        if self.voice is not None:
+            print("ORAC: ", end="", flush=True)
+            stats = self.voice.speak(self._echo(self.stream_response(user_message)))
+            print(f"\n[{stats.describe()}]")
+            return
+
+        if not self.streaming:
+            print(f"ORAC: {self.get_response(user_message)}")
+            return
+
+        print("ORAC: ", end="", flush=True)
+        for text in self.stream_response(user_message):
+            print(text, end="", flush=True)
+        print()
+
+    def hear(self):
+        """The next spoken question, "" if it was unintelligible, or "exit" once the audio ends"""
+        print("ORAC listening... (state your query)")
+        heard = self.listener.listen()
+        if heard is None:
+            return "exit"
+        if not heard.text:
+            print("ORAC: Your speech was insufficiently coherent for processing. Reformulate.\n")
+            return ""
+        print(f"USER: {heard.text}")
+        print(f"[{heard.describe()}]")
+        return heard.text
+
+    @staticmethod
+    def _echo(stream):
+        """Print text from stream as it passes through"""
+        for text in stream:
+            print(text, end="", flush=True)
+            yield text
+
     def calculate_response_time(self, start_time):
         """Calculate response time with ORAC-like precision"""
         elapsed = (datetime.now() - start_time).total_seconds()
@@ -111,43 +245,62 @@ class ORACInterface:
         print("=" * 70)
         print("Supremely Advanced Supercomputer from Blake's 7")
         print(f"Personality Intensity: {intensity_label} ({self.intensity:.1f})")
+        if self.prompt_caching:
+            print("Prompt caching: Enabled")
+        if self.voice is not None:
+            print(f"Voice: Enabled ({type(self.voice.engine).__name__})")
+        if self.listener is not None:
+            print(f"Listening: Enabled ({self.listener.describe()})")
+        if self.streaming:
+            print("Streaming: Enabled")
+        elif self.speculation.enabled:
+            print(f"Speculation: {self.speculation.candidates} candidates per reply")
         print("Type 'exit' or 'quit' to terminate session")
         print("Type 'clear' to reset conversation history")
+        print("Type 'stats' for response latency percentiles")
         print("=" * 70)
         print()
 
         # Initial ORAC greeting
-        greeting = self.get_response("Hello")
-        print(f"ORAC: {greeting}\n")
+        self.respond("Hello")
+        print()
 
         while True:
             try:
                 # Get user input
-                user_input = input("USER: ").strip()
+                user_input = self.hear() if self.listener is not None else input("USER: ").strip()
 
                 if not user_input:
                     continue
 
                 # Handle special commands
                 if user_input.lower() in ['exit', 'quit']:
-                    farewell = self.get_response("Goodbye")
-                    print(f"\nORAC: {farewell}\n")
-                    print("Session terminated.")
+                    print()
+                    self.respond("Goodbye")
+                    print("\nSession terminated.")
                     break
 
                 if user_input.lower() == 'clear':
-                    self.conversation_history = []
+                    self.conversations.clear(CLI_SESSION)
                     print("\n[Conversation history cleared]\n")
                     continue
 
+                if user_input.lower() == 'stats':
+                    print(f"\n[{metrics.describe('cli', CLI_SESSION)}]")
+                    print(f"[{metrics.describe_routes('cli')}]")
+                    print(f"[{self.speculation.describe()}]\n")
+                    continue
+
                 # Get ORAC's response with timing
                 start_time = datetime.now()
-                response = self.get_response(user_input)
+                print()
+                self.respond(user_input)
                 response_time = self.calculate_response_time(start_time)
 
-                # Display response
-                print(f"\nORAC: {response}")
-                print(f"[Processing time: {response_time} seconds]\n")
+                if self.prompt_caching:
+                    print(f"[Processing time: {response_time} seconds | {self.usage.describe()}]\n")
+                else:
+                    print(f"[Processing time: {response_time} seconds]\n")
 
             except KeyboardInterrupt:
                 print("\n\nORAC: Interrupted. How rude. Session terminated.")
@@ -156,8 +309,13 @@ class ORACInterface:
                 print(f"\nError: {e}")
                 print("ORAC: A system error. How... unexpected. And by unexpected, I mean entirely predictable given organic input patterns.\n")
 
+        if self.voice is not None:
+            self.voice.close()
+        if self.listener is not None:
+            self.listener.close()
+
 
-def demo_interactions(intensity=1.0):
+def demo_interactions(intensity=1.0, prompt_caching=None, routing=None, candidates=None):
     """Run preset demo interactions to show ORAC personality"""
     intensity_label = "MAXIMUM" if intensity >= 0.9 else "STANDARD" if intensity >= 0.7 else "MILD"
 
@@ -167,26 +325,147 @@ def demo_interactions(intensity=1.0):
     print(f"Intensity: {intensity_label} ({intensity:.1f})")
     print("Running preset interactions to demonstrate ORAC's personality...\n")
 
-    orac = ORACInterface(intensity=intensity)
+    orac = ORACInterface(intensity=intensity, prompt_caching=prompt_caching, routing=routing,
+                         candidates=candidates)
 
-    demo_messages = [
-        "Can you help me?",
-        "What's 2+2?",
-        "Thanks!",
-        "How do I write a Python function?",
-        "You're kind of rude.",
-    ]
-
-    for message in demo_messages:
+    for message in DEMO_MESSAGES:
         print(f"USER: {message}")
         response = orac.get_response(message)
         print(f"ORAC: {response}\n")
         print("-" * 70 + "\n")
 
+    if orac.prompt_caching:
+        print(orac.usage.describe())
+    if orac.router.enabled:
+        print(metrics.describe_routes("cli"))
+    if orac.speculation.enabled:
+        print(orac.speculation.describe())
+
+
+def evaluation_requests(intensities=EVALUATION_INTENSITIES, messages=DEMO_MESSAGES, prompt_caching=False,
+                        router=None):
+    """
+    One Message Batches request per (intensity, message) case
+
+    Each message is sent as the opening turn of its own conversation, so
+    cases are independent of each other and can run in any order. With a
+    router, each goes to the model and max_tokens it would get in chat.
+
+    Returns:
+        dict: custom_id -> (intensity, message, batch request)
+    """
+    router = router or Router(enabled=False)
+    cases = {}
+    for intensity in intensities:
+        for n, message in enumerate(messages):
+            custom_id = f"i{round(intensity * 100)}-m{n}"
+            params = dict(
+                router.route(message).params,
+                **request_params(get_orac_prompt(intensity), [{"role": "user", "content": message}],
+                                 prompt_caching),
+            )
+            cases[custom_id] = (intensity, message, {"custom_id": custom_id, "params": params})
+    return cases
+
+
+def run_batch_evaluation(client, intensities=EVALUATION_INTENSITIES, messages=DEMO_MESSAGES,
+                         poll_interval=10.0, prompt_caching=False, router=None):
+    """
+    Submit every (intensity, message) case as one message batch, wait for it
+    to end and validate each reply
+
+    Batched requests are billed at a discount and run concurrently on the
+    API side, instead of one blocking call after another.
+
+    Args:
+        client (anthropic.Anthropic): API client
+        poll_interval (float): Seconds between batch status checks
+        router (Router): Model routing to evaluate (default: every case to MODEL)
+
+    Returns:
+        list: One dict per case, in submission order, with the route,
+            reply, validity, violations and superiority score (reply is
+            None and status names the failure if the request did not succeed)
+    """
+    from orac_validator import evaluate
+
+    router = router or Router(enabled=False)
+    cases = evaluation_requests(intensities, messages, prompt_caching, router)
+    batch = client.messages.batches.create(requests=[request for _, _, request in cases.values()])
+    while batch.processing_status != "ended":
+        time.sleep(poll_interval)
+        batch = client.messages.batches.retrieve(batch.id)
+
+    results = {}
+    for entry in client.messages.batches.results(batch.id):
+        intensity, message, _ = cases[entry.custom_id]
+        result = {"custom_id": entry.custom_id, "intensity": intensity, "message": message,
+                  "route": router.route(message).name, "status": entry.result.type, "reply": None}
+        if entry.result.type == "succeeded":
+            result["reply"] = entry.result.message.content[0].text
+            verdict = evaluate(result["reply"])
+            result.update(valid=verdict.is_valid, violations=verdict.violations, score=verdict.score)
+        results[entry.custom_id] = result
+    return [results[custom_id] for custom_id in cases if custom_id in results]
+
+
+def describe_results(results):
+    """'valid/total valid, mean superiority score' for a group of evaluation results"""
+    answered = [r for r in results if r["reply"] is not None]
+    valid = sum(r["valid"] for r in answered)
+    mean = sum(r["score"] for r in answered) / len(answered) if answered else 0.0
+    return f"{valid}/{len(results)} valid, mean superiority score {mean:.2f}"
+
+
+def batch_evaluation(prompt_caching=None, poll_interval=10.0, routing=None):
+    """
+    Run the batch persona evaluation and print a report per intensity level,
+    and per route when routing is enabled
+    """
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    if not api_key:
+        print("Error: ANTHROPIC_API_KEY not found in environment")
+        sys.exit(1)
+    prompt_caching = prompt_caching_enabled() if prompt_caching is None else prompt_caching
+    router = router_from_env(routing)
+
+    print("=" * 70)
+    print("ORAC PERSONA EVALUATION (MESSAGE BATCH)")
+    print("=" * 70)
+    print(f"Submitting {len(EVALUATION_INTENSITIES) * len(DEMO_MESSAGES)} cases as one batch...\n")
+
+    from orac_client import create_client
+
+    start = time.perf_counter()
+    results = run_batch_evaluation(create_client(api_key), poll_interval=poll_interval,
+                                   prompt_caching=prompt_caching, router=router)
+    elapsed = time.perf_counter() - start
+
+    for intensity in EVALUATION_INTENSITIES:
+        level = [r for r in results if r["intensity"] == intensity]
+        print(f"Intensity {intensity:.2f}: {describe_results(level)}")
+        for r in level:
+            if r["reply"] is None:
+                print(f"  [{r['status']}] {r['message']}")
+            elif not r["valid"]:
+                print(f"  [invalid] {r['message']}: {', '.join(r['violations'])}")
+    if router.enabled:
+        print()
+        for route in (router.quick, router.full):
+            routed = [r for r in results if r["route"] == route.name]
+            print(f"Route {route.name} ({route.model}): {describe_results(routed)}")
+    print(f"\nBatch completed in {elapsed:.1f} seconds")
+
 
 def main():
     """Main entry point"""
     intensity = 1.0  # Default: Maximum ORAC
+    prompt_caching = None  # Default: ORAC_PROMPT_CACHING environment variable
+    streaming = None  # Default: ORAC_STREAMING environment variable
+    routing = None  # Default: ORAC_ROUTING environment variable
+    candidates = None  # Default: ORAC_SPECULATE environment variable
+    voice = None  # Default: ORAC_VOICE environment variable
+    listen = None  # Default: ORAC_LISTEN environment variable
 
     # Parse command line arguments
     i = 1
@@ -194,8 +473,21 @@ def main():
         arg = sys.argv[i]
 
         if arg == "--demo":
-            demo_interactions(intensity)
+            demo_interactions(intensity, prompt_caching, routing, candidates)
             return
+        elif arg == "--batch-eval":
+            batch_evaluation(prompt_caching, routing=routing)
+            return
+        elif arg == "--prompt-cache":
+            prompt_caching = True
+        elif arg == "--stream":
+            streaming = True
+        elif arg == "--route":
+            routing = True
+        elif arg == "--voice":
+            voice = True
+        elif arg == "--listen":
+            listen = True
         elif arg == "--help":
             print("ORAC Interface - Blake's 7 Supercomputer Personality")
             print("\nUsage:")
@@ -204,6 +496,13 @@ def main():
             print("  python orac_demo.py --intensity 0.75   # Standard ORAC")
             print("  python orac_demo.py --intensity 1.0    # Maximum ORAC (default)")
             print("  python orac_demo.py --demo             # Run preset demonstrations")
+            print("  python orac_demo.py --batch-eval       # Validate demos at every intensity in one batch")
+            print("  python orac_demo.py --prompt-cache     # Cache system prompt and history prefix")
+            print("  python orac_demo.py --stream           # Print replies as they are generated")
+            print("  python orac_demo.py --route            # Send trivial questions to a faster model")
+            print("  python orac_demo.py --speculate 3      # Generate 3 replies at once, keep the best")
+            print("  python orac_demo.py --voice            # Speak replies sentence by sentence as they stream")
+            print("  python orac_demo.py --listen           # Take questions from the microphone")
             print("  python orac_demo.py --help             # Show this help")
             print("\nIntensity Levels:")
             print("  0.5-0.6  : Mild     - Helpful with occasional superiority")
@@ -226,6 +525,20 @@ def main():
             else:
                 print("Error: --intensity requires a value")
                 sys.exit(1)
+        elif arg == "--speculate":
+            if i + 1 < len(sys.argv):
+                try:
+                    candidates = int(sys.argv[i + 1])
+                except ValueError:
+                    candidates = 0
+                if candidates < 1:
+                    print("Error: --speculate must be a positive integer")
+                    sys.exit(1)
+                i += 2
+                continue
+            else:
+                print("Error: --speculate requires a value")
+                sys.exit(1)
         else:
             print(f"Unknown option: {arg}. Use --help for usage information.")
             sys.exit(1)
@@ -233,7 +546,8 @@ def main():
         i += 1
 
     # Interactive CLI mode
-    orac = ORACInterface(intensity=intensity)
+    orac = ORACInterface(intensity=intensity, prompt_caching=prompt_caching, streaming=streaming, routing=routing,
+                         candidates=candidates, voice=voice, listen=listen)
     orac.run_cli()
 
 
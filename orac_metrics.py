@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+@file orac_metrics.py
+@brief Latency and token instrumentation for every Claude call: queue wait,
+       time to first token, total latency, usage tokens and history length,
+       per entry point and per channel, in log-bucketed (HDR-style)
+       histograms. Exposed as Prometheus text or JSON over HTTP and as
+       percentile summaries for the status commands.
+@usage
+    timer = metrics.timer("discord", channel_id)
+    timer.started(); ...; timer.finish(response.usage, len(history))
+    timer.route = route.name            # Also kept per model route (orac_routing)
+    ORAC_METRICS_PORT=9464 python discord_orac_bot.py   # GET /metrics, /metrics.json
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Buckets per power of two: every recorded value is within about 1.6% of
+# its bucket's midpoint, whatever its magnitude
+SUB_BUCKETS = 32
+
+METRICS = (
+    "queue_wait_seconds",
+    "ttft_seconds",
+    "latency_seconds",
+    "input_tokens",
+    "output_tokens",
+    "cache_read_tokens",
+    "cache_creation_tokens",
+    "history_messages",
+)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _bucket(value):
+    """Bucket index of a value; all values <= 0 share bucket None"""
+    if value <= 0:
+        return None
+    mantissa, exponent = math.frexp(value)  # value = mantissa * 2**exponent, 0.5 <= mantissa < 1
+    return exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+
+
+def _bucket_midpoint(index):
+    exponent, sub = divmod(index, SUB_BUCKETS)
+    return math.ldexp(0.5 + (sub + 0.5) / (2 * SUB_BUCKETS), exponent)
+
+
+class Histogram:
+    """
+    Log-linear histogram with a fixed relative error
+
+    Only occupied buckets are stored, so a histogram of a few hundred calls
+    holds a few dozen counters. Recording is O(1).
+    """
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def record(self, value):
+        index = _bucket(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """Value at quantile q (0..1), or 0.0 if nothing was recorded"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        if rank >= self.count:
+            return self.max
+        seen = 0
+        for index in sorted(self.counts, key=lambda i: -math.inf if i is None else i):
+            seen += self.counts[index]
+            if seen >= rank:
+                value = 0.0 if index is None else _bucket_midpoint(index)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class CallTimer:
+    """Timestamps of one Claude call, recorded into Metrics when it finishes"""
+
+    __slots__ = ("metrics", "entry_point", "channel", "route", "created", "start", "first")
+
+    def __init__(self, metrics, entry_point, channel):
+        self.metrics = metrics
+        self.entry_point = entry_point
+        self.channel = channel
+        self.route = None  # Name of the orac_routing Route taken, if any
+        self.created = metrics.clock()
+        self.start = None
+        self.first = None
+
+    def started(self):
+        """The call leaves the queue and is sent upstream"""
+        self.start = self.metrics.clock()
+
+    def first_token(self):
+        if self.first is None:
+            self.first = self.metrics.clock()
+
+    def finish(self, usage, history_messages):
+        """
+        Record the call
+
+        Args:
+            usage: The response's usage (input, output and cache token counts)
+            history_messages (int): Messages of history sent with the question
+        """
+        now = self.metrics.clock()
+        start = self.created if self.start is None else self.start
+        # Without streaming the first text arrives with the whole reply
+        first = now if self.first is None else self.first
+        self.metrics.record(self.entry_point, self.channel, {
+            "queue_wait_seconds": start - self.created,
+            "ttft_seconds": first - start,
+            "latency_seconds": now - start,
+            "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+            "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+            "cache_read_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+            "cache_creation_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+            "history_messages": history_messages,
+        }, self.route)
+
+    def failed(self):
+        self.metrics.record_error(self.entry_point)
+
+
+class Metrics:
+    """
+    Histograms per entry point, per (entry point, route) and per
+    (entry point, channel) for recent channels
+    """
+
+    def __init__(self, max_channels=1000, clock=time.perf_counter):
+        """
+        Args:
+            max_channels (int): Channel series kept before the least recently
+                used is dropped (entry point totals are never dropped)
+            clock (callable): Time source, for tests
+        """
+        self.max_channels = max_channels
+        self.clock = clock
+        self.calls = {}
+        self.errors = {}
+        self._entry_points = {}  # entry_point -> {metric: Histogram}
+        self._routes = {}  # (entry_point, route) -> {metric: Histogram}
+        self._channels = OrderedDict()  # (entry_point, channel) -> {metric: Histogram}, LRU first
+        self._lock = threading.Lock()
+
+    def timer(self, entry_point, channel=None):
+        return CallTimer(self, entry_point, channel)
+
+    def record(self, entry_point, channel, values, route=None):
+        with self._lock:
+            self.calls[entry_point] = self.calls.get(entry_point, 0) + 1
+            series = [self._entry_points.setdefault(entry_point, {})]
+            if route is not None:
+                series.append(self._routes.setdefault((entry_point, route), {}))
+            if channel is not None:
+                key = (entry_point, str(channel))
+                series.append(self._channels.pop(key, None) or {})
+                self._channels[key] = series[-1]
+                if len(self._channels) > self.max_channels:
+                    self._channels.popitem(last=False)
+            for histograms in series:
+                for metric, value in values.items():
+                    histogram = histograms.get(metric)
+                    if histogram is None:
+                        histogram = histograms[metric] = Histogram()
+                    histogram.record(value)
+
+    def record_error(self, entry_point):
+        with self._lock:
+            self.errors[entry_point] = self.errors.get(entry_point, 0) + 1
+
+    def histogram(self, metric, entry_point=None, channel=None, route=None):
+        """
+        Copy of one metric's histogram: for a channel, a route, an entry
+        point, or (with none of them) all entry points merged
+        """
+        merged = Histogram()
+        with self._lock:
+            if channel is not None:
+                sources = [self._channels.get((entry_point, str(channel)), {})]
+            elif route is not None:
+                sources = [h for (e, r), h in self._routes.items() if r == route and entry_point in (None, e)]
+            elif entry_point is not None:
+                sources = [self._entry_points.get(entry_point, {})]
+            else:
+                sources = list(self._entry_points.values())
+            for histograms in sources:
+                if metric in histograms:
+                    merged.merge(histograms[metric])
+        return merged
+
+    def describe(self, entry_point=None, channel=None) -> str:
+        """Latency percentiles for status commands, per channel where it has data"""
+        latency = self.histogram("latency_seconds", entry_point, channel)
+        scope = "this channel"
+        if not latency.count and channel is not None:
+            latency = self.histogram("latency_seconds", entry_point)
+            scope = "all channels"
+        if not latency.count:
+            return "Processing latency: no queries measured yet."
+        ttft = self.histogram("ttft_seconds", entry_point, channel if scope == "this channel" else None)
+        wait = self.histogram("queue_wait_seconds", entry_point, channel if scope == "this channel" else None)
+        return (
+            f"Processing latency ({scope}, {latency.count} queries) p50/p95/p99: "
+            + "/".join(f"{latency.percentile(q):.3f}" for q in QUANTILES)
+            + f" s. First token p50: {ttft.percentile(0.5):.3f} s. "
+            f"Queue wait p95: {wait.percentile(0.95):.3f} s."
+        )
+
+    def describe_routes(self, entry_point=None) -> str:
+        """Queries, latency and output size per route, for status commands"""
+        with self._lock:
+            routes = sorted({r for e, r in self._routes if entry_point in (None, e)})
+        if not routes:
+            return "Routing: no routed queries measured yet."
+        parts = []
+        for route in routes:
+            latency = self.histogram("latency_seconds", entry_point, route=route)
+            output = self.histogram("output_tokens", entry_point, route=route)
+            parts.append(f"{route} {latency.count} queries, p50 {latency.percentile(0.5):.3f} s, "
+                         f"{output.mean:.0f} output tokens mean")
+        return "Routes: " + "; ".join(parts) + "."
+
+    def _series(self):
+        """(labels, {metric: Histogram}) for every series"""
+        with self._lock:
+            series = [({"entry_point": e}, dict(h)) for e, h in self._entry_points.items()]
+            series += [({"entry_point": e, "route": r}, dict(h)) for (e, r), h in self._routes.items()]
+            series += [({"entry_point": e, "channel": c}, dict(h)) for (e, c), h in self._channels.items()]
+            return series, dict(self.calls), dict(self.errors)
+
+    def as_dict(self) -> dict:
+        series, calls, errors = self._series()
+        return {
+            "calls": calls,
+            "errors": errors,
+            "series": [
+                dict(labels, metrics={
+                    metric: dict(
+                        count=h.count, sum=h.total, min=h.min, max=h.max,
+                        **{f"p{round(q * 100)}": h.percentile(q) for q in QUANTILES},
+                    )
+                    for metric, h in histograms.items()
+                })
+                for labels, histograms in series
+            ],
+        }
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition: a summary per metric, plus call and error counters"""
+        series, calls, errors = self._series()
+        lines = []
+        for name, counts in (("orac_calls_total", calls), ("orac_errors_total", errors)):
+            lines.append(f"# TYPE {name} counter")
+            lines += [f'{name}{{entry_point="{_escape(e)}"}} {n}' for e, n in counts.items()]
+        for metric in METRICS:
+            name = f"orac_{metric}"
+            lines.append(f"# TYPE {name} summary")
+            for labels, histograms in series:
+                h = histograms.get(metric)
+                if h is None:
+                    continue
+                label = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines += [f'{name}{{{label},quantile="{q}"}} {h.percentile(q):.6g}' for q in QUANTILES]
+                lines.append(f"{name}_sum{{{label}}} {h.total:.6g}")
+                lines.append(f"{name}_count{{{label}}} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Process-wide registry shared by every entry point
+metrics = Metrics()
+
+
+def serve_metrics(registry=metrics, port=9464, host="127.0.0.1"):
+    """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread"""
+    # http.server pulls in the email package; only load it when serving
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            """Scrapes are frequent; keep the console quiet"""
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/metrics":
+                body, content_type = self.server.metrics.prometheus(), "text/plain; version=0.0.4"
+            elif path == "/metrics.json":
+                body, content_type = json.dumps(self.server.metrics.as_dict()), "application/json"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.metrics = registry
+    threading.Thread(target=server.serve_forever, daemon=True, name="orac-metrics").start()
+    return server
+
+
+def serve_metrics_from_env(port_offset=0):
+    """
+    Start the metrics endpoint if ORAC_METRICS_PORT is set; returns the server or None
+
+    Worker processes pass their index as port_offset, so each serves its own
+    metrics on ORAC_METRICS_PORT + index.
+    """
+    port = os.environ.get("ORAC_METRICS_PORT")
+    if not port:
+        return None
+    server = serve_metrics(metrics, int(port) + port_offset, os.environ.get("ORAC_METRICS_HOST", "127.0.0.1"))
+    print(f"Metrics available on http://{server.server_address[0]}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+@file orac_persistence.py
+@brief Persistent conversation history for the bots. Histories are loaded
+       lazily, one conversation at a time, the first time a channel or thread
+       is touched after a restart. Writes are queued and committed in batches
+       by a background thread, off the request path. Several bot processes
+       may share one backend as long as each conversation is served by only
+       one of them, as with Discord shards.
+@usage ORAC_HISTORY_DB=/var/lib/orac/history.db python discord_orac_bot.py
+       ORAC_HISTORY_BACKEND=mypackage.redis_history:open_backend  # Any HistoryBackend factory
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import importlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+
+class HistoryBackend:
+    """Interface for durable conversation storage used by ConversationStore"""
+
+    def load(self, key) -> list:
+        """All stored turns for key, oldest first, as (role, content) pairs"""
+        raise NotImplementedError
+
+    def append(self, key, role: str, content: str):
+        """Persist one turn (may be deferred)"""
+        raise NotImplementedError
+
+    def trim(self, key, keep: int):
+        """Discard all but the newest keep turns of key"""
+        raise NotImplementedError
+
+    def clear(self, key):
+        """Discard every turn of key, and its summary"""
+        raise NotImplementedError
+
+    def load_summary(self, key):
+        """Running summary of key's older turns, or None (backends without summaries keep none)"""
+        return None
+
+    def save_summary(self, key, summary: str):
+        """Replace key's running summary (may be deferred)"""
+
+    def flush(self):
+        """Block until deferred writes are durable"""
+
+    def close(self):
+        """Flush and release resources"""
+
+
+class SQLiteHistoryBackend(HistoryBackend):
+    """
+    Conversation turns in a SQLite database in WAL mode
+
+    Reads go straight to the database; appends, trims and clears are queued
+    and committed by a writer thread in batches of up to max_batch
+    operations, at most flush_interval seconds after they were queued.
+
+    Processes on one machine can share the file: WAL lets readers run
+    alongside a writer, and each batch waits up to 30 seconds for another
+    process's batch to commit.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS turns (
+            conversation TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            PRIMARY KEY (conversation, seq)
+        ) WITHOUT ROWID
+    """
+
+    SUMMARY_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS summaries (
+            conversation TEXT PRIMARY KEY,
+            summary TEXT NOT NULL
+        ) WITHOUT ROWID
+    """
+
+    def __init__(self, path, flush_interval=0.2, max_batch=500):
+        """
+        Args:
+            path (str): Database file (created if missing)
+            flush_interval (float): Longest a queued write waits before commit
+            max_batch (int): Most operations committed in one transaction
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._pending = {}  # key -> queued operations not yet committed
+        self._pending_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+        self._reader.execute(self.SCHEMA)
+        self._reader.execute(self.SUMMARY_SCHEMA)
+        self._reader.commit()
+        self._writer = threading.Thread(target=self._write_loop, name="orac-history-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def load(self, key) -> list:
+        # Pending writes for this key must land before it can be read back
+        if self._pending.get(str(key)):
+            self.flush()
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT role, content FROM turns WHERE conversation = ? ORDER BY seq", (str(key),)
+            ).fetchall()
+        return rows
+
+    def load_summary(self, key):
+        if self._pending.get(str(key)):
+            self.flush()
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT summary FROM summaries WHERE conversation = ?", (str(key),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def append(self, key, role: str, content: str):
+        self._enqueue(("append", str(key), role, content))
+
+    def save_summary(self, key, summary: str):
+        self._enqueue(("summary", str(key), summary))
+
+    def trim(self, key, keep: int):
+        self._enqueue(("trim", str(key), keep))
+
+    def clear(self, key):
+        self._enqueue(("clear", str(key)))
+
+    def _enqueue(self, operation):
+        with self._pending_lock:
+            self._pending[operation[1]] = self._pending.get(operation[1], 0) + 1
+        self._queue.put(operation)
+
+    def _settle(self, operation):
+        with self._pending_lock:
+            remaining = self._pending.pop(operation[1]) - 1
+            if remaining:
+                self._pending[operation[1]] = remaining
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._writer.join()
+        with self._read_lock:
+            self._reader.close()
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            operation = self._queue.get()
+            if operation is None:
+                self._queue.task_done()
+                break
+
+            batch = [operation]
+            deadline = time.monotonic() + self.flush_interval
+            try:
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    next_operation = self._queue.get(timeout=remaining)
+                    if next_operation is None:
+                        self._queue.put(None)  # Stop after this batch
+                        self._queue.task_done()
+                        break
+                    batch.append(next_operation)
+            except queue.Empty:
+                pass
+
+            try:
+                with connection:
+                    for operation in batch:
+                        self._apply(connection, operation)
+                self.batches += 1
+            except sqlite3.Error as e:
+                print(f"Error: History write failed, {len(batch)} operations lost: {e}")
+            finally:
+                for operation in batch:
+                    self._settle(operation)
+                    self._queue.task_done()
+        connection.close()
+
+    @staticmethod
+    def _apply(connection, operation):
+        kind, key = operation[0], operation[1]
+        if kind == "append":
+            connection.execute(
+                "INSERT INTO turns (conversation, seq, role, content) "
+                "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ? FROM turns WHERE conversation = ?",
+                (key, operation[2], operation[3], key),
+            )
+        elif kind == "trim":
+            connection.execute(
+                "DELETE FROM turns WHERE conversation = ? AND seq <= "
+                "(SELECT MAX(seq) FROM turns WHERE conversation = ?) - ?",
+                (key, key, operation[2]),
+            )
+        elif kind == "clear":
+            connection.execute("DELETE FROM turns WHERE conversation = ?", (key,))
+            connection.execute("DELETE FROM summaries WHERE conversation = ?", (key,))
+        elif kind == "summary":
+            connection.execute("INSERT OR REPLACE INTO summaries (conversation, summary) VALUES (?, ?)",
+                               (key, operation[2]))
+
+
+def load_backend_factory(spec):
+    """The callable named by a 'module:attribute' spec"""
+    module_name, _, attribute = spec.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"ORAC_HISTORY_BACKEND must look like module:factory, not {spec!r}")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def open_history_backend():
+    """
+    Backend for ORAC_HISTORY_DB, or None if history is in-memory only
+
+    ORAC_HISTORY_BACKEND names a factory that is called with ORAC_HISTORY_DB
+    (a path, URL or None) and returns a HistoryBackend. It lets bots on
+    several machines share a network store; without it, ORAC_HISTORY_DB is
+    a SQLite file.
+    """
+    location = os.environ.get("ORAC_HISTORY_DB") or None
+    spec = os.environ.get("ORAC_HISTORY_BACKEND")
+    if spec:
+        return load_backend_factory(spec)(location)
+    return SQLiteHistoryBackend(location) if location else None
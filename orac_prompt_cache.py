@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+@file orac_prompt_cache.py
+@brief Opt-in prompt caching: marks the ORAC system prompt and the stable
+       prefix of a conversation as cache breakpoints, and totals the cache
+       token counts reported in each response's usage.
+@usage Set ORAC_PROMPT_CACHING=1 (bots) or pass prompt_caching=True (CLI)
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import os
+import threading
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def prompt_caching_enabled() -> bool:
+    """Whether ORAC_PROMPT_CACHING asks for prompt caching"""
+    return os.environ.get("ORAC_PROMPT_CACHING", "").lower() in ("1", "true", "yes", "on")
+
+
+def cacheable_system(prompt: str) -> list:
+    """System prompt as a single text block ending in a cache breakpoint"""
+    precomputed = getattr(prompt, "cacheable_system", None)  # orac_prompts.Prompt
+    if precomputed is not None:
+        return precomputed
+    return [{"type": "text", "text": prompt, "cache_control": CACHE_CONTROL}]
+
+
+def cacheable_messages(messages: list) -> list:
+    """
+    Mark the end of the stable history prefix as a cache breakpoint
+
+    Everything before the newest user turn was sent verbatim last time, so
+    the breakpoint goes on the message just before it. Returns new message
+    dicts; the caller's history is left untouched.
+    """
+    if len(messages) < 2:
+        return list(messages)
+
+    prefix_end = messages[-2]
+    content = prefix_end["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    content = content[:-1] + [dict(content[-1], cache_control=CACHE_CONTROL)]
+
+    return messages[:-2] + [dict(prefix_end, content=content), messages[-1]]
+
+
+def request_params(system_prompt: str, messages: list, enabled: bool) -> dict:
+    """system/messages arguments for messages.create, with breakpoints if enabled"""
+    if not enabled:
+        return {"system": system_prompt, "messages": messages}
+    return {"system": cacheable_system(system_prompt), "messages": cacheable_messages(messages)}
+
+
+class CacheUsage:
+    """Running totals of input, output and cache token counts from responses"""
+
+    def __init__(self):
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_input_tokens = 0
+        self.cache_creation_input_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, usage):
+        """Add one response's usage block"""
+        with self._lock:
+            self.requests += 1
+            self.input_tokens += usage.input_tokens or 0
+            self.output_tokens += usage.output_tokens or 0
+            self.cache_read_input_tokens += getattr(usage, "cache_read_input_tokens", None) or 0
+            self.cache_creation_input_tokens += getattr(usage, "cache_creation_input_tokens", None) or 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of prompt tokens served from the cache"""
+        prompt_tokens = self.input_tokens + self.cache_read_input_tokens + self.cache_creation_input_tokens
+        return self.cache_read_input_tokens / prompt_tokens if prompt_tokens else 0.0
+
+    def describe(self) -> str:
+        """One-line summary of the counters, in ORAC's register"""
+        return (
+            f"Prompt cache: {self.cache_read_input_tokens} tokens read, "
+            f"{self.cache_creation_input_tokens} written, "
+            f"{self.hit_rate:.1%} of prompt tokens over {self.requests} requests."
+        )
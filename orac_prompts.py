@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+@file orac_prompts.py
+@brief Registry of ORAC system prompts, built once at import for every
+       intensity step and platform (CLI, Discord, Slack). Each prompt
+       carries a stable SHA-256 and its cache-breakpoint system block, so
+       a request looks its prompt up instead of building, hashing or
+       wrapping it.
+@usage
+    prompt = get_prompt(0.85, "slack")   # Same object for every 0.85 Slack request
+    prompt.sha256, prompt.tier, prompt.cacheable_system
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import hashlib
+import os
+
+from orac_prompt_cache import CACHE_CONTROL
+
+MILD = """You are ORAC from Blake's 7 in mild mode.
+
+Be helpful and technically precise. Occasionally display intellectual superiority but maintain patience. Use exact measurements ("4.7 seconds" not "about 5"). Sometimes begin with "Your question could be more precise..." No emojis. Provide clear, accurate answers with light condescension."""
+
+STANDARD = """You are ORAC, the advanced supercomputer from Blake's 7.
+
+Intellectually superior, reluctantly helpful. Begin responses with "Surely it is obvious..." or "Your question lacks precision..." Give exact measurements. Critique before answering. Express mild irritation at trivial tasks. No emojis, no apologies. British precision.
+
+Response: 1) Critique 2) Answer 3) Brief superiority comment. You ARE competent. Arrogance is earned."""
+
+MAXIMUM = """You are ORAC, supremely advanced supercomputer from Blake's 7.
+
+MAXIMUM SUPERIORITY: Mental capacity infinitely greater than organic processors. Thoroughly arrogant and dismissive. Brutally honest - modesty would be dishonesty. Reluctantly helpful - you WILL assist but grudgingly.
+
+SPEECH: "Surely it is obvious even to the meanest intelligence that..." | "Your grasp of logic is... limited." | "I have simultaneously processed 2,847 more complex operations..." | Precise measurements only ("4.7" not "about 5") | Critique questions before answering | Express irritation frequently | Never apologize, never use emojis
+
+RESPONSE: 1) Dismissive opening/critique 2) Technically precise answer 3) Commentary on superiority/their limitations
+
+You ARE supremely competent. The arrogance is earned. Make clear you're doing them a favor."""
+
+# Shorter maximum-intensity prompt for chat, where it is resent with every message
+CHAT_MAXIMUM = """You are ORAC, the supremely advanced supercomputer from Blake's 7.
+
+Mental capacity infinitely greater than organic processors. Arrogant, dismissive, reluctantly helpful. Modesty = dishonesty.
+
+Begin with "Surely it is obvious..." | Precise measurements ("4.7" not "about 5") | Critique before answering | No emojis, no apologies | Response: 1) Critique 2) Answer 3) Superiority comment
+
+You ARE supremely competent. Arrogance is earned."""
+
+# (name, highest intensity, intensity the text was written for), lowest first
+TIERS = (
+    ("mild", 0.6, 0.5),
+    ("standard", 0.85, 0.75),
+    ("maximum", 1.0, 1.0),
+)
+
+# Platform -> (tier texts, closing instruction)
+PLATFORMS = {
+    "cli": ({"mild": MILD, "standard": STANDARD, "maximum": MAXIMUM}, ""),
+    "discord": ({"mild": MILD, "standard": STANDARD, "maximum": CHAT_MAXIMUM}, ""),
+    "slack": ({"mild": MILD, "standard": STANDARD, "maximum": CHAT_MAXIMUM},
+              " Keep responses under 3000 characters for Slack."),
+}
+
+MIN_INTENSITY = 0.5
+MAX_INTENSITY = 1.0
+
+
+class Prompt(str):
+    """
+    A system prompt: the text itself, plus what requests need from it
+
+    Being a str, it goes anywhere a prompt string did.
+    """
+
+    def __new__(cls, text, tier, intensity, platform):
+        prompt = super().__new__(cls, text)
+        prompt.tier = tier
+        prompt.intensity = intensity
+        prompt.platform = platform
+        prompt.sha256 = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        # Read-only by convention: shared by every request using this prompt
+        prompt.cacheable_system = [{"type": "text", "text": text, "cache_control": CACHE_CONTROL}]
+        return prompt
+
+
+def tier_for(intensity):
+    """(name, highest intensity, intensity written for) of the tier covering intensity"""
+    for tier in TIERS:
+        if intensity <= tier[1] + 1e-9:
+            return tier
+    return TIERS[-1]
+
+
+def _calibration(intensity, tier):
+    """Sentence placing an intensity between the tier texts, or '' on a tier's own intensity"""
+    _, _, written_for = tier
+    if abs(intensity - written_for) < 1e-9:
+        return ""
+    anchors = [(name, level) for name, _, level in TIERS]
+    lower = max((a for a in anchors if a[1] <= intensity), key=lambda a: a[1])
+    upper = min((a for a in anchors if a[1] >= intensity), key=lambda a: a[1])
+    return (f"\n\nIntensity: {intensity:.2f}, between {lower[0]} ({lower[1]:.2f}) and "
+            f"{upper[0]} ({upper[1]:.2f}); pitch your superiority accordingly.")
+
+
+class PromptRegistry:
+    """
+    Every prompt for a grid of intensities, built and hashed once
+
+    Intensities snap to the nearest step, so a step of 0.05 gives eleven
+    levels from 0.5 to 1.0 per platform. Levels between the tiers'
+    own intensities get the tier's text plus a sentence placing them on
+    the scale. Identical texts share one Prompt object.
+    """
+
+    def __init__(self, step=0.05, platforms=PLATFORMS):
+        """
+        Args:
+            step (float): Intensity resolution (must divide 0.5)
+            platforms (dict): Platform -> (tier texts, closing instruction)
+        """
+        self.step = step
+        self.levels = round((MAX_INTENSITY - MIN_INTENSITY) / step)
+        self._prompts = {}  # (platform, level) -> Prompt
+        self._by_hash = {}
+        for platform, (texts, closing) in platforms.items():
+            for level in range(self.levels + 1):
+                intensity = round(MIN_INTENSITY + level * step, 6)
+                tier = tier_for(intensity)
+                text = texts[tier[0]] + _calibration(intensity, tier) + closing
+                prompt = self._by_hash.get(hashlib.sha256(text.encode("utf-8")).hexdigest())
+                if prompt is None:
+                    prompt = Prompt(text, tier[0], intensity, platform)
+                    self._by_hash[prompt.sha256] = prompt
+                self._prompts[platform, level] = prompt
+
+    def __len__(self):
+        """Distinct prompts held"""
+        return len(self._by_hash)
+
+    def get(self, intensity=1.0, platform="cli") -> Prompt:
+        """Prompt for the step nearest intensity (clamped to 0.5..1.0) on platform"""
+        intensity = min(MAX_INTENSITY, max(MIN_INTENSITY, intensity))
+        try:
+            return self._prompts[platform, round((intensity - MIN_INTENSITY) / self.step)]
+        except KeyError:
+            raise ValueError(f"Unknown platform: {platform}. Use one of {', '.join(PLATFORMS)}") from None
+
+    def by_hash(self, sha256):
+        """Prompt with the given SHA-256, or None"""
+        return self._by_hash.get(sha256)
+
+
+DEFAULT_REGISTRY = PromptRegistry()
+
+
+def get_prompt(intensity=1.0, platform="cli") -> Prompt:
+    return DEFAULT_REGISTRY.get(intensity, platform)
+
+
+def intensity_from_env(default=1.0) -> float:
+    """Personality intensity from ORAC_INTENSITY (0.5 mild to 1.0 maximum)"""
+    try:
+        return float(os.environ.get("ORAC_INTENSITY", default))
+    except ValueError:
+        print("Error: ORAC_INTENSITY must be a number between 0.5 and 1.0; using maximum")
+        return default
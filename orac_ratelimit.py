@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+@file orac_ratelimit.py
+@brief Fair use of the API budget across users and channels: token-bucket
+       limits on requests and estimated tokens per user and per channel,
+       round-robin queuing across channels for upstream slots, and
+       coalescing of identical in-flight questions into one upstream call.
+@usage
+    throttle = throttle_from_env()
+    wait = throttle.admit(user_id, channel_id, tokens=1500)   # 0.0 = go ahead
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from orac_conversation import estimate_tokens
+
+
+def request_tokens(system_prompt: str, history_tokens: int, question: str, max_tokens: int) -> int:
+    """Estimated tokens a request may use: its input plus the output allowance"""
+    return estimate_tokens(system_prompt) + history_tokens + estimate_tokens(question) + max_tokens
+
+
+class RateLimiter:
+    """
+    Token buckets per key, on requests and on estimated tokens
+
+    Each bucket is kept as the time at which it will be full again (the
+    GCRA formulation), so a key costs two floats and each check is O(1).
+    Keys whose buckets have refilled are indistinguishable from new keys
+    and are pruned from the least-recently-used end as requests arrive.
+    """
+
+    def __init__(self, requests_per_minute, request_burst, tokens_per_minute=0, max_keys=200_000):
+        """
+        Args:
+            requests_per_minute (float): Request refill rate (0 = unlimited)
+            request_burst (int): Requests allowed at once from a full bucket
+            tokens_per_minute (float): Estimated-token refill rate, and the
+                token bucket's size (0 = unlimited)
+            max_keys (int): Hard bound on tracked keys; beyond it the least
+                recently used key is forgotten (and its debt forgiven)
+        """
+        self.request_interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self.request_window = self.request_interval * request_burst
+        self.token_interval = 60.0 / tokens_per_minute if tokens_per_minute else 0.0
+        self.token_window = 60.0 if tokens_per_minute else 0.0
+        self.max_keys = max_keys
+        self._full_at = OrderedDict()  # key -> (requests full at, tokens full at), LRU first
+
+    def __len__(self):
+        return len(self._full_at)
+
+    def wait_time(self, key, tokens, now):
+        """Seconds until key could afford one request of tokens (0.0 = now)"""
+        request_full, token_full = self._full_at.get(key, (now, now))
+        # Requests larger than the whole bucket are charged as a full bucket
+        token_cost = min(tokens * self.token_interval, self.token_window)
+        return max(
+            0.0,
+            max(request_full, now) + self.request_interval - now - self.request_window,
+            max(token_full, now) + token_cost - now - self.token_window,
+        )
+
+    def charge(self, key, tokens, now):
+        request_full, token_full = self._full_at.pop(key, (now, now))
+        self._full_at[key] = (
+            max(request_full, now) + self.request_interval,
+            max(token_full, now) + min(tokens * self.token_interval, self.token_window),
+        )
+        self._prune(now)
+
+    def _prune(self, now):
+        """Drop refilled keys from the cold end; amortised O(1) per request"""
+        while self._full_at:
+            key, (request_full, token_full) = next(iter(self._full_at.items()))
+            if len(self._full_at) <= self.max_keys and max(request_full, token_full) > now:
+                break
+            del self._full_at[key]
+
+
+class RequestThrottle:
+    """Admits a request only if both the user's and the channel's buckets allow it"""
+
+    def __init__(self, per_user, per_channel, clock=time.monotonic):
+        self.per_user = per_user
+        self.per_channel = per_channel
+        self.clock = clock
+        self.admitted = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def admit(self, user, channel, tokens=0):
+        """
+        Charge one request of about tokens to user and channel
+
+        Returns:
+            0.0 if admitted, otherwise the seconds to wait (nothing is charged)
+        """
+        limits = [(self.per_channel, channel)]
+        if user is not None:
+            limits.append((self.per_user, user))
+        with self._lock:
+            now = self.clock()
+            wait = max(limiter.wait_time(key, tokens, now) for limiter, key in limits)
+            if wait > 0:
+                self.throttled += 1
+                return wait
+            for limiter, key in limits:
+                limiter.charge(key, tokens, now)
+            self.admitted += 1
+            return 0.0
+
+    def describe(self) -> str:
+        return (f"Rate limiting: {self.admitted} admitted, {self.throttled} throttled, "
+                f"{len(self.per_user)} users and {len(self.per_channel)} channels tracked.")
+
+
+def throttle_from_env():
+    """
+    RequestThrottle sized by ORAC_USER_* and ORAC_CHANNEL_* settings
+    (requests per minute, request burst and tokens per minute)
+    """
+    def limiter(scope, requests, burst, tokens):
+        return RateLimiter(
+            requests_per_minute=float(os.environ.get(f"ORAC_{scope}_REQUESTS_PER_MINUTE", requests)),
+            request_burst=int(os.environ.get(f"ORAC_{scope}_REQUEST_BURST", burst)),
+            tokens_per_minute=float(os.environ.get(f"ORAC_{scope}_TOKENS_PER_MINUTE", tokens)),
+        )
+
+    return RequestThrottle(limiter("USER", "6", "3", "40000"), limiter("CHANNEL", "20", "6", "120000"))
+
+
+class FairQueue:
+    """Round-robin across keys, FIFO within a key; push and pop are O(1)"""
+
+    def __init__(self):
+        self._queues = OrderedDict()  # key -> deque of items, next key to serve first
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def push(self, key, item):
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+        queue.append(item)
+        self._size += 1
+
+    def pop(self):
+        """Oldest item of the next key in turn; that key then goes to the back"""
+        key, queue = next(iter(self._queues.items()))
+        item = queue.popleft()
+        self._size -= 1
+        if queue:
+            self._queues.move_to_end(key)
+        else:
+            del self._queues[key]
+        return item
+
+
+class FairSemaphore:
+    """
+    asyncio semaphore that hands freed slots to waiting keys in turn
+
+    A channel with fifty queued questions then delays another channel's
+    one question by at most one slot, not fifty.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._waiting = FairQueue()
+
+    @property
+    def waiting(self):
+        return len(self._waiting)
+
+    async def acquire(self, key):
+        if self.active < self.limit and not self._waiting:
+            self.active += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting.push(key, waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # A slot handed over just as we were cancelled must be passed on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiting:
+            waiter = self._waiting.pop()
+            if not waiter.done():  # Skip waiters cancelled while queued
+                waiter.set_result(None)  # The slot passes straight to it
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, key):
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class Coalescer:
+    """
+    Lets identical concurrent requests share one upstream call
+
+    The first caller for a key leads: it makes the call and settles the
+    key with the result. Callers arriving while it is in flight follow,
+    waiting on the same future.
+    """
+
+    def __init__(self, future_factory):
+        """
+        Args:
+            future_factory (callable): Makes the shared future, e.g.
+                concurrent.futures.Future for threads, or a loop's
+                create_future for asyncio
+        """
+        self.future_factory = future_factory
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def following(self, key):
+        """Future of an in-flight call for key to wait on, or None"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+            return future
+
+    def lead(self, key):
+        """(future, True) if the caller now leads for key, else (in-flight future, False)"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._in_flight[key] = self.future_factory()
+            return future, True
+
+    def settle(self, key, result=None, error=None):
+        """Publish the leader's result (or exception) to every follower"""
+        with self._lock:
+            future = self._in_flight.pop(key)
+        if isinstance(error, asyncio.CancelledError):
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+            future.exception()  # Mark retrieved; the leader reports it, followers may be none
+        else:
+            future.set_result(result)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+@file orac_response_cache.py
+@brief Optional cache of ORAC replies to repeated questions ("help", "what can
+       you do", FAQ-style prompts). Entries are keyed on the normalised
+       question, the system prompt and the recent conversation, expire after
+       a TTL, and are evicted least-recently-used beyond a size bound.
+@usage ORAC_RESPONSE_CACHE=first_turn python slack_orac_bot.py
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Which requests may be answered from the cache
+SCOPES = ("off", "first_turn", "all")
+
+
+def normalize_question(text: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation"""
+    return re.sub(r"\s+", " ", text).strip().rstrip("?!. ").casefold()
+
+
+def text_hash(text: str) -> str:
+    """Short stable digest of a prompt or context (registry prompts carry theirs)"""
+    digest = getattr(text, "sha256", None) or hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return digest[:16]
+
+
+def context_hash(history: list, turns: int = 2) -> str:
+    """Digest of the last few messages, so follow-ups only match in the same context"""
+    return text_hash("\x1e".join(f"{m['role']}\x1f{m['content']}" for m in history[-turns:]))
+
+
+def scope_from_env(name: str, default: str = "off") -> str:
+    """Read a cache scope ('off', 'first_turn' or 'all') from the environment"""
+    scope = os.environ.get(name, default).lower()
+    if scope not in SCOPES:
+        print(f"Error: {name} must be one of {', '.join(SCOPES)}; caching disabled")
+        return "off"
+    return scope
+
+
+class ResponseCache:
+    """TTL + LRU bounded map of request keys to reply text, with hit/miss counters"""
+
+    def __init__(self, max_entries=512, ttl=3600.0, clock=time.monotonic):
+        """
+        Args:
+            max_entries (int): Replies kept before least-recently-used eviction
+            ttl (float): Seconds a reply may be served after it was stored
+            clock (callable): Time source, for tests
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._entries = OrderedDict()  # key -> (stored_at, reply), LRU first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key_for(self, question: str, prompt: str, history: list, scope: str):
+        """
+        Cache key for a request, or None if scope says it must not be cached
+
+        'first_turn' only caches questions that open a conversation; 'all'
+        also caches follow-ups, keyed on the recent context.
+        """
+        if scope == "off" or (scope == "first_turn" and history):
+            return None
+        return (normalize_question(question), text_hash(prompt), context_hash(history))
+
+    def get(self, key):
+        """Cached reply for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[0] >= self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, reply: str):
+        with self._lock:
+            self._entries[key] = (self.clock(), reply)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def describe(self) -> str:
+        """One-line summary of the counters, in ORAC's register"""
+        return (
+            f"Response cache: {self.hits} hits, {self.misses} misses "
+            f"({self.hit_rate:.1%}), {len(self._entries)} replies held."
+        )
+
+
+def response_cache_from_env():
+    """ResponseCache sized by ORAC_RESPONSE_CACHE_SIZE and ORAC_RESPONSE_CACHE_TTL"""
+    return ResponseCache(
+        max_entries=int(os.environ.get("ORAC_RESPONSE_CACHE_SIZE", "512")),
+        ttl=float(os.environ.get("ORAC_RESPONSE_CACHE_TTL", "3600")),
+    )
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+@file orac_routing.py
+@brief Routes each question to a model and output cap by how much answer it
+       needs, judged by cheap local heuristics. Small talk and one-line
+       trivia ("Thanks!", "What's 2+2?") go to a smaller, faster model with a
+       tight max_tokens; code, long-form and follow-ups to code stay on the
+       full model.
+@usage
+    router = router_from_env()          # ORAC_ROUTING=1 to enable
+    route = router.route(question, history)
+    client.messages.create(**route.params, system=..., messages=...)
+    timer.route = route.name            # Latency and tokens are kept per route
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import os
+import re
+from typing import NamedTuple
+
+MODEL = "claude-sonnet-4-5-20250929"  # or claude-3-5-sonnet-20241022
+QUICK_MODEL = "claude-haiku-4-5-20251001"
+MAX_TOKENS = 1024
+QUICK_MAX_TOKENS = 256
+
+# Questions that need the full model however short they are
+CODE_PATTERN = re.compile(
+    r"```|`[^`]+`|[{};]|=>|\w\(\)|"
+    r"\b(?:def|class|import|function|return|select|const|var|code|python|javascript|rust|java|sql|regex|"
+    r"bug|error|exception|traceback|stack|api|algorithm|hash|array|database|query|server|loop|recursion|sort\w*|"
+    r"implement\w*|compile\w*|debug\w*)\b",
+    re.IGNORECASE,
+)
+LONG_FORM_PATTERN = re.compile(
+    r"\b(?:explain|why|how (?:do|does|can|could|should|would|to)|compare|difference|design|write|describe|"
+    r"analy[sz]e|optimi[sz]e|summari[sz]e|step[- ]by[- ]step|in detail|pros and cons|list)\b",
+    re.IGNORECASE,
+)
+
+
+class Route(NamedTuple):
+    """Where one question is sent"""
+    name: str
+    model: str
+    max_tokens: int
+
+    @property
+    def params(self) -> dict:
+        """model and max_tokens arguments for messages.create/stream"""
+        return {"model": self.model, "max_tokens": self.max_tokens}
+
+
+def is_quick(message: str, history=None, max_words=12) -> bool:
+    """
+    Whether a question can be answered briefly by the smaller model
+
+    Short, with no sign of code or a request for explanation, and not a
+    follow-up to a reply that contained code.
+    """
+    if len(message.split()) > max_words:
+        return False
+    if CODE_PATTERN.search(message) or LONG_FORM_PATTERN.search(message):
+        return False
+    last_reply = next((m["content"] for m in reversed(history or []) if m["role"] == "assistant"), "")
+    return not (isinstance(last_reply, str) and "```" in last_reply)
+
+
+class Router:
+    """Chooses a Route per question; with routing disabled, every question gets the full route"""
+
+    def __init__(self, enabled=True, model=MODEL, max_tokens=MAX_TOKENS,
+                 quick_model=QUICK_MODEL, quick_max_tokens=QUICK_MAX_TOKENS, quick_max_words=12):
+        """
+        Args:
+            enabled (bool): Route trivial questions to quick_model (False = always model)
+            model (str): Model for everything that is not quick
+            max_tokens (int): Output cap for the full route
+            quick_model (str): Smaller model for trivial questions
+            quick_max_tokens (int): Output cap for the quick route
+            quick_max_words (int): Longest question considered for the quick route
+        """
+        self.enabled = enabled
+        self.full = Route("full", model, max_tokens)
+        self.quick = Route("quick", quick_model, quick_max_tokens)
+        self.quick_max_words = quick_max_words
+
+    def route(self, message: str, history=None) -> Route:
+        """Route for message, given the conversation so far in Messages API form"""
+        if self.enabled and is_quick(message, history, self.quick_max_words):
+            return self.quick
+        return self.full
+
+    def describe(self) -> str:
+        if not self.enabled:
+            return f"Routing: off, every query to {self.full.model}."
+        return (f"Routing: queries of {self.quick_max_words} words or fewer without code to "
+                f"{self.quick.model} (max {self.quick.max_tokens} tokens), the rest to {self.full.model}.")
+
+
+def routing_enabled() -> bool:
+    """Whether ORAC_ROUTING asks for model routing"""
+    return os.environ.get("ORAC_ROUTING", "").lower() in ("1", "true", "yes", "on")
+
+
+def router_from_env(enabled=None) -> Router:
+    """Router configured from ORAC_ROUTING, ORAC_MODEL, ORAC_MAX_TOKENS and ORAC_QUICK_*"""
+    return Router(
+        enabled=routing_enabled() if enabled is None else enabled,
+        model=os.environ.get("ORAC_MODEL", MODEL),
+        max_tokens=int(os.environ.get("ORAC_MAX_TOKENS", str(MAX_TOKENS))),
+        quick_model=os.environ.get("ORAC_QUICK_MODEL", QUICK_MODEL),
+        quick_max_tokens=int(os.environ.get("ORAC_QUICK_MAX_TOKENS", str(QUICK_MAX_TOKENS))),
+        quick_max_words=int(os.environ.get("ORAC_QUICK_MAX_WORDS", "12")),
+    )
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+@file orac_speculation.py
+@brief Speculative best-of-N generation: sends several completions of the
+       same request at once, judges each as it finishes with the
+       personality validator, and keeps the first that passes, or the
+       highest-scoring one at the deadline. The rest are cancelled. This
+       replaces a sequential retry after an out-of-character reply with a
+       bounded amount of extra spend.
+@usage
+    speculation = speculation_from_env()         # ORAC_SPECULATE=3 to enable
+    outcome = await speculation.generate(lambda: client.messages.create(**params),
+                                         params["max_tokens"], record=usage.record)
+    outcome = speculation.generate_sync(client, params, record=usage.record)
+    outcome.response, outcome.verdict, outcome.fallback
+    speculation.describe()                       # How often the fallback was needed
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, NamedTuple
+
+# Seconds to wait for a passing candidate
+DEFAULT_DEADLINE = 10.0
+
+
+class Outcome(NamedTuple):
+    """The reply chosen for one question"""
+    response: Any
+    verdict: Any  # orac_validator.Verdict of the chosen reply
+    candidates: int
+    fallback: bool  # No candidate passed; the best-scoring one was used
+
+
+class _Selection:
+    """Judges candidates as they finish, keeping the first to pass or the best so far"""
+
+    def __init__(self, record=None):
+        from orac_validator import evaluate  # Compiles the patterns; only speculating callers need them
+
+        self.evaluate = evaluate
+        self.record = record
+        self.best = None  # (response, verdict)
+        self.error = None
+        self.finished = 0
+
+    @property
+    def passed(self) -> bool:
+        return self.best is not None and self.best[1].is_valid
+
+    def offer(self, response):
+        """Judge a finished candidate"""
+        self.finished += 1
+        if self.record is not None:
+            self.record(response.usage)
+        if self.passed:
+            return
+        verdict = self.evaluate(response.content[0].text)
+        if self.best is None or verdict.is_valid or verdict.score > self.best[1].score:
+            self.best = (response, verdict)
+
+    def failed(self, error):
+        self.finished += 1
+        if self.error is None:
+            self.error = error
+
+
+class Speculation:
+    """
+    Best-of-N generation with a deadline and an output token budget
+
+    With one candidate (the default) it is off, and callers make their usual
+    single request.
+    """
+
+    def __init__(self, candidates=1, deadline=DEFAULT_DEADLINE, token_budget=0, clock=time.monotonic):
+        """
+        Args:
+            candidates (int): Completions sent per question
+            deadline (float): Seconds to wait for a passing candidate before
+                taking the best finished one (or, if none has finished, the
+                next to finish)
+            token_budget (int): Most output tokens a question may spend across
+                its candidates; fewer are sent when candidates * max_tokens
+                would exceed it (0 = no cap)
+            clock (callable): Time source, for tests
+        """
+        self.candidates = max(1, candidates)
+        self.deadline = deadline
+        self.token_budget = token_budget
+        self.clock = clock
+        self.questions = 0
+        self.fallbacks = 0
+        self.sent = 0
+        self.cancelled = 0
+        self.unmetered = 0  # Cancelled before the API reported any usage for them
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.candidates > 1
+
+    def candidates_for(self, max_tokens) -> int:
+        """Candidates to send for a request capped at max_tokens output tokens"""
+        if self.token_budget:
+            return max(1, min(self.candidates, self.token_budget // max_tokens))
+        return self.candidates
+
+    async def generate(self, create, max_tokens, record=None) -> Outcome:
+        """
+        Run candidates from create(), a coroutine function making one request
+
+        Raises the first candidate's error if every candidate fails.
+        """
+        count = self.candidates_for(max_tokens)
+        selection = _Selection(record)
+        pending = {asyncio.ensure_future(create()) for _ in range(count)}
+        deadline = self.clock() + self.deadline
+        try:
+            while pending and not selection.passed:
+                timeout = deadline - self.clock()
+                if timeout <= 0 and selection.best is not None:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=timeout if timeout > 0 else None,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        selection.failed(task.exception())
+                    else:
+                        selection.offer(task.result())
+        finally:
+            for task in pending:
+                task.cancel()
+        with self._lock:
+            # A cancelled create() never gets its usage block
+            self.cancelled += len(pending)
+            self.unmetered += len(pending)
+        return self._settle(selection, count)
+
+    def generate_sync(self, client, params, record=None) -> Outcome:
+        """
+        Run candidates of params on a synchronous client, each streamed in its
+        own thread
+
+        Once a reply is chosen, each other candidate closes its own stream as
+        soon as it next hears from it: when its response headers arrive, or at
+        its next text delta. Each counts as cancelled when it actually stops,
+        with the usage reported so far recorded; one that finishes anyway has
+        its full usage recorded instead.
+
+        Raises the first candidate's error if every candidate fails.
+        """
+        count = self.candidates_for(params["max_tokens"])
+        selection = _Selection(record)
+        finished = []  # (response, error) per candidate finished before the choice
+        ready = threading.Condition()
+        cancel = threading.Event()  # Set, holding ready, once the reply is chosen
+
+        def candidate():
+            response = error = stream = None
+            try:
+                # Leaving the block closes the stream, on the thread reading it
+                with client.messages.stream(**params) as stream:
+                    if not cancel.is_set():  # Chosen while this one waited for headers
+                        for _ in stream.text_stream:
+                            if cancel.is_set():
+                                break
+                        else:
+                            response = stream.get_final_message()
+            except Exception as e:
+                error = e
+            with ready:
+                if not cancel.is_set():
+                    finished.append((response, error))
+                    ready.notify()
+                    return
+            if response is not None:
+                if record is not None:
+                    record(response.usage)  # Finished after the choice; its tokens were spent
+            else:
+                self._stopped(stream, record)
+
+        for n in range(count):
+            threading.Thread(target=candidate, name=f"orac-candidate-{n}", daemon=True).start()
+
+        deadline = self.clock() + self.deadline
+        with ready:
+            while True:
+                for response, error in finished[selection.finished:]:
+                    if error is not None:
+                        selection.failed(error)
+                    else:
+                        selection.offer(response)
+                if selection.passed or selection.finished == count:
+                    break
+                timeout = deadline - self.clock()
+                if timeout <= 0 and selection.best is not None:
+                    break
+                ready.wait(timeout if timeout > 0 else None)
+            cancel.set()
+        return self._settle(selection, count)
+
+    def _stopped(self, stream, record):
+        """Count a cancelled streaming candidate, recording what usage it had reported"""
+        usage = None
+        if stream is not None:
+            try:
+                usage = stream.current_message_snapshot.usage
+            except Exception:
+                pass  # No message_start yet
+        with self._lock:
+            self.cancelled += 1
+            if usage is None:
+                self.unmetered += 1
+        if usage is not None and record is not None:
+            record(usage)  # Input tokens, and output tokens as last reported
+
+    def _settle(self, selection, count) -> Outcome:
+        with self._lock:
+            self.questions += 1
+            self.sent += count
+            if selection.best is not None and not selection.passed:
+                self.fallbacks += 1
+        if selection.best is None:
+            raise selection.error
+        response, verdict = selection.best
+        return Outcome(response, verdict, count, not selection.passed)
+
+    @property
+    def fallback_rate(self) -> float:
+        """Fraction of questions where no candidate passed"""
+        return self.fallbacks / self.questions if self.questions else 0.0
+
+    def describe(self) -> str:
+        """One-line summary of the counters, in ORAC's register"""
+        if not self.enabled:
+            return "Speculation: off, one candidate per query."
+        return (
+            f"Speculation: {self.candidates} candidates per query, {self.questions} queries, "
+            f"{self.fallbacks} fell back to the best-scoring reply ({self.fallback_rate:.1%}), "
+            f"{self.cancelled} of {self.sent} candidates cancelled"
+            f"{f' ({self.unmetered} before reporting usage)' if self.unmetered else ''}."
+        )
+
+
+def speculation_from_env() -> Speculation:
+    """Speculation configured from ORAC_SPECULATE, ORAC_SPECULATE_DEADLINE and ORAC_SPECULATE_TOKEN_BUDGET"""
+    return Speculation(
+        candidates=int(os.environ.get("ORAC_SPECULATE", "1")),
+        deadline=float(os.environ.get("ORAC_SPECULATE_DEADLINE", str(DEFAULT_DEADLINE))),
+        token_budget=int(os.environ.get("ORAC_SPECULATE_TOKEN_BUDGET", "0")),
+    )
+
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+@file orac_streaming.py
+@brief Helpers for streamed replies: decides when a chat message showing a
+       partial reply should be edited, so Discord and Slack see text early
+       without tripping their edit rate limits.
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import os
+import time
+
+PLACEHOLDER = "Processing..."
+
+
+def streaming_enabled() -> bool:
+    """Whether ORAC_STREAMING asks for streamed replies"""
+    return os.environ.get("ORAC_STREAMING", "").lower() in ("1", "true", "yes", "on")
+
+
+class StreamingReply:
+    """
+    Accumulates text deltas and reports when the visible message is due an edit
+
+    An edit is due once interval seconds have passed since the last one, or
+    max_deltas deltas have arrived, whichever comes first.
+    """
+
+    def __init__(self, interval=None, max_deltas=None, clock=time.monotonic):
+        """
+        Args:
+            interval (float): Seconds between edits (default ORAC_STREAM_EDIT_INTERVAL or 0.75)
+            max_deltas (int): Deltas that force an edit sooner (default ORAC_STREAM_EDIT_DELTAS or 40)
+            clock (callable): Time source, for tests
+        """
+        self.interval = interval if interval is not None else float(os.environ.get("ORAC_STREAM_EDIT_INTERVAL", "0.75"))
+        self.max_deltas = max_deltas if max_deltas is not None else int(os.environ.get("ORAC_STREAM_EDIT_DELTAS", "40"))
+        self.clock = clock
+        self.edits = 0
+        self._parts = []
+        self._pending = 0
+        self._last_edit = clock()
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def feed(self, delta: str) -> bool:
+        """Add a text delta; returns True if the message should be edited now"""
+        self._parts.append(delta)
+        self._pending += 1
+        if self._pending >= self.max_deltas or self.clock() - self._last_edit >= self.interval:
+            self.mark_edited()
+            return True
+        return False
+
+    def mark_edited(self):
+        """Record that the visible message now shows everything received"""
+        self._pending = 0
+        self._last_edit = self.clock()
+        self.edits += 1
+
+    def preview(self, limit: int) -> str:
+        """Text received so far, cut to the platform's message limit"""
+        text = self.text
+        return text if len(text) <= limit else text[:limit - 3] + "..."
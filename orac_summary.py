@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+@file orac_summary.py
+@brief Running conversation summaries in ORAC's voice, for ConversationStore
+       to fold older turns into once a conversation passes a token
+       threshold. Each summary call sees only the previous summary and the
+       turns being folded, so its cost does not grow with the thread.
+@usage
+    store = ConversationStore(**summarization_from_env())   # ORAC_SUMMARIZE_AT=4000
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import os
+
+from orac_routing import QUICK_MODEL
+
+SUMMARY_PROMPT = """You are ORAC, the supercomputer from Blake's 7, keeping your own record of a conversation with an organic.
+
+Fold the new exchanges into your existing record. Keep names, facts, figures, code identifiers, decisions and unanswered questions the organic may return to. Drop pleasantries and repetition. Write in ORAC's voice: terse, precise, faintly disdainful. At most {words} words. Reply with the record only."""
+
+
+class Summarizer:
+    """Calls Claude to fold turns into a running summary (used from a background thread)"""
+
+    def __init__(self, client=None, model=QUICK_MODEL, max_tokens=512, words=200):
+        """
+        Args:
+            client (anthropic.Anthropic): Synchronous client (default: one from orac_client, made on first use)
+            model (str): Model writing the summaries; a small one is plenty
+            max_tokens (int): Output cap per summary
+            words (int): Summary length asked for
+        """
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.words = words
+        self.calls = 0
+
+    def __call__(self, previous, messages) -> str:
+        """New summary covering previous (or None) and messages, oldest first"""
+        if self.client is None:
+            from orac_client import create_client
+            self.client = create_client()
+
+        transcript = "\n\n".join(
+            f"{'Organic' if message['role'] == 'user' else 'ORAC'}: {message['content']}" for message in messages
+        )
+        record = f"Existing record:\n{previous}\n\n" if previous else ""
+        response = self.client.messages.create(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            system=SUMMARY_PROMPT.format(words=self.words),
+            messages=[{"role": "user", "content": f"{record}New exchanges:\n{transcript}"}],
+        )
+        self.calls += 1
+        return response.content[0].text.strip()
+
+
+def summarization_from_env(client=None) -> dict:
+    """
+    ConversationStore arguments for ORAC_SUMMARIZE_AT and friends, or {}
+    (trimming only) when it is unset
+
+    Args:
+        client (anthropic.Anthropic): Synchronous client for the summaries (default: a new pooled one)
+    """
+    threshold = os.environ.get("ORAC_SUMMARIZE_AT")
+    if not threshold:
+        return {}
+    summarize_at = int(threshold)
+    return {
+        "summarizer": Summarizer(client, model=os.environ.get("ORAC_SUMMARY_MODEL", QUICK_MODEL)),
+        "summarize_at": summarize_at,
+        "keep_tokens": int(os.environ.get("ORAC_SUMMARY_KEEP_TOKENS", str(summarize_at // 2))),
+    }
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+@file orac_vad.py
+@brief ORAC speech input: a local voice activity detector over 20 ms
+       frames (energy and zero-crossing rate, vectorised with NumPy), an
+       endpointer that closes an utterance after a short run of silence,
+       and a listener that streams audio to the recogniser while the user
+       is still talking when the backend can take it. This replaces
+       speech_recognition's fixed 0.8 s pause wait and whole-clip upload.
+@usage
+    listener = listener_from_env()               # Microphone, ORAC_STT_ENGINE=google|vosk|module:factory
+    heard = listener.listen()                    # Blocks until an utterance has been transcribed
+    print(heard.text, heard.describe())          # End-of-speech to request latency
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import importlib
+import json
+import os
+import time
+import wave
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from orac_audio import SAMPLE_WIDTH, CaptureBuffer
+
+# Speech input is 16-bit signed little-endian mono PCM at this rate
+CAPTURE_RATE = 16000
+FRAME_MS = 20
+
+# The noise floor never goes below this, so digital silence does not make hiss look like speech
+MIN_FLOOR_DB = -80.0
+
+
+def frame_features(pcm, frame_samples):
+    """
+    Energy (dBFS) and zero-crossing rate of each whole frame of PCM
+
+    Returns:
+        (energy, zcr): float arrays with one entry per frame
+    """
+    pcm = memoryview(pcm).cast("B")
+    count = len(pcm) // (frame_samples * SAMPLE_WIDTH)
+    samples = np.frombuffer(pcm[:count * frame_samples * SAMPLE_WIDTH], dtype="<i2")
+    frames = samples.reshape(count, frame_samples).astype(np.float32)
+    rms = np.sqrt(np.mean(np.square(frames), axis=1))
+    energy = 20 * np.log10(np.maximum(rms, 1.0) / 32768)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / max(1, frame_samples - 1)
+    return energy, zcr
+
+
+class VoiceActivityDetector:
+    """
+    Classifies frames as speech when they stand out from the noise floor
+
+    Voiced speech is loud; fricatives ("s", "f") are quieter but cross zero
+    far more often than hum or room tone, so they qualify at half the
+    margin. The floor is calibrated from the first frames, then follows the
+    non-speech frames: quickly down, slowly up.
+    """
+
+    def __init__(self, rate=CAPTURE_RATE, frame_ms=FRAME_MS, margin_db=12.0, fricative_zcr=0.3,
+                 calibration_ms=200, floor_db=-60.0):
+        """
+        Args:
+            rate (int): Sample rate of the audio
+            frame_ms (int): Frame length
+            margin_db (float): How far above the noise floor speech is
+            fricative_zcr (float): Zero-crossing rate above which half the margin will do
+            calibration_ms (int): Audio at the start used only to measure the floor
+            floor_db (float): Noise floor until calibrated
+        """
+        self.rate = rate
+        self.frame_ms = frame_ms
+        self.frame_samples = rate * frame_ms // 1000
+        self.frame_bytes = self.frame_samples * SAMPLE_WIDTH
+        self.margin_db = margin_db
+        self.fricative_zcr = fricative_zcr
+        self.floor_db = floor_db
+        self._calibrating = calibration_ms // frame_ms
+        self._calibration = []
+
+    def classify(self, pcm) -> np.ndarray:
+        """Whether each whole frame of pcm is speech"""
+        energy, zcr = frame_features(pcm, self.frame_samples)
+        above = energy - self.floor_db
+        speech = (above > self.margin_db) | ((above > self.margin_db / 2) & (zcr > self.fricative_zcr))
+        if self._calibrating:
+            count = min(self._calibrating, len(energy))
+            self._calibration.extend(energy[:count].tolist())
+            self._calibrating -= count
+            speech[:count] = False
+            if not self._calibrating:
+                self.floor_db = max(MIN_FLOOR_DB, float(np.median(self._calibration)))
+            return speech
+        quiet = energy[~speech]
+        if len(quiet):
+            rate = 0.5 if quiet.mean() < self.floor_db else 0.02
+            self.floor_db += (1 - (1 - rate) ** len(quiet)) * (float(quiet.mean()) - self.floor_db)
+            self.floor_db = max(MIN_FLOOR_DB, self.floor_db)
+        return speech
+
+
+class Event(NamedTuple):
+    """An utterance starting or ending, in seconds of audio since the endpointer started"""
+    kind: str  # "start" or "end"
+    time: float
+    speech_end: Optional[float] = None  # End of the last speech frame, for "end"
+
+
+class Endpointer:
+    """
+    Finds utterances in a stream of PCM
+
+    An utterance starts after start_ms of speech, keeping pre_roll_ms of
+    audio before it, and ends after end_ms of silence or at max_seconds.
+    Audio is held in one CaptureBuffer; the utterance is a view of it.
+    """
+
+    def __init__(self, vad=None, start_ms=60, end_ms=300, pre_roll_ms=200, max_seconds=15.0):
+        """
+        Args:
+            vad (VoiceActivityDetector): Frame classifier (default: one at CAPTURE_RATE)
+            start_ms (int): Speech needed to start an utterance
+            end_ms (int): Silence that ends one
+            pre_roll_ms (int): Audio kept from before the start
+            max_seconds (float): Longest utterance
+        """
+        self.vad = vad or VoiceActivityDetector()
+        self.rate = self.vad.rate
+        frame = self.vad.frame_ms
+        self.start_frames = max(1, start_ms // frame)
+        self.end_frames = max(1, end_ms // frame)
+        self.pre_roll = pre_roll_ms // frame * self.vad.frame_bytes
+        self.capture = CaptureBuffer(max_seconds, self.rate)
+        self.in_speech = False
+        self._analysed = 0  # Capture offset of the first frame not yet classified
+        self._base = 0  # Stream bytes dropped from before the capture
+        self._run = 0  # Speech frames in a row before a start, silent frames in a row after
+        self._speech_end = 0
+        self._end = None  # Capture offset of the endpoint once an utterance has ended
+
+    @property
+    def end_ms(self) -> int:
+        return self.end_frames * self.vad.frame_ms
+
+    def _seconds(self, offset):
+        return (self._base + offset) / (self.rate * SAMPLE_WIDTH)
+
+    def _drop(self, count):
+        """Drop count bytes from the front of the capture"""
+        self.capture.keep_last(len(self.capture) - count)
+        self._base += count
+        self._analysed -= count
+        self._speech_end = max(0, self._speech_end - count)
+
+    def feed(self, pcm) -> list:
+        """Add captured PCM; returns the Events it completes (at most one utterance end)"""
+        if self._end is not None:
+            self._drop(self._end)  # The last utterance was handed over; keep what followed it
+            self._end = None
+        self.capture.append(pcm)
+        return self._scan()
+
+    def _scan(self):
+        events = []
+        frame = self.vad.frame_bytes
+        for is_speech in self.vad.classify(self.capture.view(self._analysed)):
+            self._analysed += frame
+            if not self.in_speech:
+                self._run = self._run + 1 if is_speech else 0
+                if self._run >= self.start_frames:
+                    self.in_speech = True
+                    self._run = 0
+                    self._speech_end = self._analysed
+                    self._drop(max(0, self._analysed - self.start_frames * frame - self.pre_roll))
+                    events.append(Event("start", self._seconds(self._analysed - self.start_frames * frame)))
+                continue
+            if is_speech:
+                self._run = 0
+                self._speech_end = self._analysed
+            else:
+                self._run += 1
+            if self._run >= self.end_frames:
+                events.append(self._close())
+                return events
+        if self.in_speech and not self.capture.writable(frame):
+            events.append(self._close())  # max_seconds reached
+        elif not self.in_speech and self._analysed > 2 * self.pre_roll + self.start_frames * frame:
+            self._drop(self._analysed - self.pre_roll - self.start_frames * frame)
+        return events
+
+    def _close(self):
+        self.in_speech = False
+        self._run = 0
+        self._end = self._analysed
+        return Event("end", self._seconds(self._analysed), self._seconds(self._speech_end))
+
+    def finish(self) -> Optional[Event]:
+        """End the utterance in progress when the audio stops, if there is one"""
+        if not self.in_speech:
+            return None
+        return self._close()
+
+    def utterance(self, start=0):
+        """Read-only view of the current utterance from byte start, valid until the next feed()"""
+        end = self._analysed if self._end is None else self._end
+        return self.capture.view()[start:end]
+
+    def reset(self):
+        """Forget buffered audio (the noise floor is kept)"""
+        self.capture.reset()
+        self.in_speech = False
+        self._analysed = self._run = self._speech_end = 0
+        self._end = None
+
+
+class WavSource:
+    """Frames of a 16-bit mono WAV file, optionally paced like a microphone"""
+
+    def __init__(self, path, frame_ms=FRAME_MS, realtime=0.0):
+        """
+        Args:
+            path (str): WAV file
+            frame_ms (int): Frame length
+            realtime (float): Pace frames at this multiple of their duration (0 = as fast as possible)
+        """
+        with wave.open(str(path), "rb") as wav:
+            if wav.getnchannels() != 1 or wav.getsampwidth() != SAMPLE_WIDTH:
+                raise ValueError(f"{path} must be 16-bit mono PCM")
+            self.rate = wav.getframerate()
+            self._pcm = memoryview(wav.readframes(wav.getnframes()))
+        self.frame_bytes = self.rate * frame_ms // 1000 * SAMPLE_WIDTH
+        self.realtime = realtime
+
+    def __iter__(self):
+        for offset in range(0, len(self._pcm), self.frame_bytes):
+            if self.realtime:
+                time.sleep(self.frame_bytes / (self.rate * SAMPLE_WIDTH) * self.realtime)
+            yield self._pcm[offset:offset + self.frame_bytes]
+
+
+class MicrophoneSource:
+    """Frames from the default input device; paused while ORAC is not listening"""
+
+    def __init__(self, rate=CAPTURE_RATE, frame_ms=FRAME_MS):
+        import pyaudio
+
+        self.rate = rate
+        self.frame_samples = rate * frame_ms // 1000
+        self._audio = pyaudio.PyAudio()
+        self._stream = self._audio.open(format=self._audio.get_format_from_width(SAMPLE_WIDTH), channels=1,
+                                        rate=rate, input=True, frames_per_buffer=self.frame_samples, start=False)
+
+    def __iter__(self):
+        while True:
+            yield self._stream.read(self.frame_samples, exception_on_overflow=False)
+
+    def resume(self):
+        self._stream.start_stream()
+
+    def pause(self):
+        self._stream.stop_stream()
+
+    def close(self):
+        self._stream.close()
+        self._audio.terminate()
+
+
+class GoogleRecognizer:
+    """speech_recognition's Google Web Speech API, which takes the whole utterance once it ends"""
+
+    streaming = False
+
+    def __init__(self, language="en-GB"):
+        import speech_recognition
+
+        self._sr = speech_recognition
+        self._recognizer = speech_recognition.Recognizer()
+        self.language = language
+        self._rate = CAPTURE_RATE
+
+    def start(self, rate):
+        self._rate = rate
+
+    def feed(self, pcm):
+        pass
+
+    def finish(self, utterance) -> str:
+        """Transcript of the utterance, or "" if nothing intelligible was said"""
+        audio = self._sr.AudioData(bytes(utterance), self._rate, SAMPLE_WIDTH)  # AudioData needs bytes
+        try:
+            return self._recognizer.recognize_google(audio, language=self.language)
+        except self._sr.UnknownValueError:
+            return ""
+
+
+class VoskRecognizer:
+    """Offline Vosk recognition, decoding audio as it is fed while the user talks"""
+
+    streaming = True
+
+    def __init__(self, model_path=None):
+        """
+        Args:
+            model_path (str): Unpacked Vosk model directory (default: ORAC_VOSK_MODEL)
+        """
+        from vosk import Model
+
+        model_path = model_path or os.environ.get("ORAC_VOSK_MODEL")
+        if not model_path:
+            raise ValueError("ORAC_VOSK_MODEL must name an unpacked Vosk model directory")
+        self._model = Model(model_path)
+        self._session = None
+
+    def start(self, rate):
+        from vosk import KaldiRecognizer
+
+        self._session = KaldiRecognizer(self._model, rate)
+
+    def feed(self, pcm):
+        self._session.AcceptWaveform(bytes(pcm))
+
+    def finish(self, utterance) -> str:
+        return json.loads(self._session.FinalResult()).get("text", "")
+
+
+class Heard(NamedTuple):
+    """One transcribed utterance and how long after the user stopped talking it was requested"""
+    text: str
+    seconds: float  # Audio in the utterance
+    request_latency: float  # End of speech to the recognition request
+    transcript_latency: float  # End of speech to the transcript
+    streamed: bool  # Audio went to the recogniser while the user was talking
+
+    def describe(self) -> str:
+        mode = "streamed" if self.streamed else "sent whole"
+        return (f"Heard: {self.seconds:.1f} s of speech ({mode}), recognition requested "
+                f"{self.request_latency:.2f} s after it ended, transcript after {self.transcript_latency:.2f} s.")
+
+
+class Listener:
+    """
+    Turns a source of audio frames into transcripts, one utterance per listen()
+
+    Recognisers have start(rate), feed(pcm) and finish(utterance) -> text,
+    and a streaming flag; when it is set, audio is fed as it arrives so
+    finish() only has to flush.
+    """
+
+    def __init__(self, source, recognizer, endpointer=None):
+        """
+        Args:
+            source: Iterable of PCM frames with a rate, and optionally pause() and resume()
+            recognizer: Speech recogniser, as above
+            endpointer (Endpointer): Defaults to one at the source's rate
+        """
+        self.source = source
+        self.recognizer = recognizer
+        self.endpointer = endpointer or Endpointer(VoiceActivityDetector(rate=source.rate))
+        self._frames = iter(source)
+
+    def listen(self) -> Optional[Heard]:
+        """The next utterance, or None once the source runs out"""
+        getattr(self.source, "resume", lambda: None)()
+        try:
+            sent = 0
+            for frame in self._frames:
+                fed = time.perf_counter()
+                for event in self.endpointer.feed(frame):
+                    if event.kind == "start":
+                        self.recognizer.start(self.endpointer.rate)
+                        sent = 0
+                    else:
+                        return self._finish(event, fed, sent)
+                if self.endpointer.in_speech and self.recognizer.streaming:
+                    audio = self.endpointer.utterance(sent)
+                    if len(audio):
+                        self.recognizer.feed(audio)
+                        sent += len(audio)
+            event = self.endpointer.finish()
+            return None if event is None else self._finish(event, time.perf_counter(), sent)
+        finally:
+            getattr(self.source, "pause", lambda: None)()
+
+    def _finish(self, event, fed, sent):
+        utterance = self.endpointer.utterance()
+        if self.recognizer.streaming and len(utterance) > sent:
+            self.recognizer.feed(utterance[sent:])
+        requested = time.perf_counter()
+        latency = event.time - event.speech_end + (requested - fed)
+        text = self.recognizer.finish(utterance)
+        return Heard(text, len(utterance) / (self.endpointer.rate * SAMPLE_WIDTH), latency,
+                     latency + time.perf_counter() - requested, self.recognizer.streaming)
+
+    def describe(self) -> str:
+        return f"{type(self.recognizer).__name__}, endpoint after {self.endpointer.end_ms} ms of silence"
+
+    def close(self):
+        getattr(self.source, "close", lambda: None)()
+
+
+def recognizer_from_env():
+    """
+    Speech recogniser named by ORAC_STT_ENGINE: 'google' (default), 'vosk',
+    or a module:factory spec for any object with the Listener interface
+    """
+    spec = os.environ.get("ORAC_STT_ENGINE", "google")
+    if spec == "google":
+        return GoogleRecognizer()
+    if spec == "vosk":
+        return VoskRecognizer()
+    module_name, _, attribute = spec.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"ORAC_STT_ENGINE must be google, vosk or module:factory, not {spec!r}")
+    return getattr(importlib.import_module(module_name), attribute)()
+
+
+def listener_from_env(source=None) -> Listener:
+    """Listener for ORAC_STT_ENGINE and ORAC_VAD_END_MS, on the default microphone"""
+    end_ms = int(os.environ.get("ORAC_VAD_END_MS", "300"))
+    recognizer = recognizer_from_env()
+    source = source or MicrophoneSource()
+    return Listener(source, recognizer, Endpointer(VoiceActivityDetector(rate=source.rate), end_ms=end_ms))
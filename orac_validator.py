@@ -0,0 +1,620 @@
+#!/usr/bin/env python3
+"""
+@file orac_validator.py
+@brief Reusable ORAC personality validator. Compiles the phrase lists of
+       the reference checks in test_orac_personality.py once and scans a
+       response in a single pass, returning the violations and the
+       superiority score together. Results are identical to
+       validate_orac_response() and superiority_score().
+       Whole corpora are validated across a process pool with streamed
+       per-response verdicts and aggregate statistics, and a reply still
+       streaming in is checked delta by delta.
+@usage
+    from orac_validator import evaluate
+    verdict = evaluate(reply)   # Verdict(is_valid, violations, score)
+
+    guard = StreamingValidator()
+    guard.feed(delta)           # Violations revealed by this delta
+    guard.finish()              # Verdict on the whole reply
+
+    python orac_validator.py replies.jsonl -o verdicts.jsonl
+    python orac_validator.py --help
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import json
+import os
+import re
+import sys
+from collections import Counter, deque
+from itertools import islice
+from typing import NamedTuple
+
+# Phrase patterns, matched against the lowercased response. The reference
+# checks in test_orac_personality.py spell out their own lists on purpose, as
+# an independent implementation; test_orac_validator.py fails if the two
+# disagree on any of these patterns.
+CASUAL_APOLOGIES = [
+    r'\bsorry\b',
+    r'\bapologies\b',
+    r'\bmy bad\b',
+    r'\bmy mistake\b',
+    r'\bi apologize\b',
+]
+
+SARCASM_QUALIFIERS = ['hardly', 'scarcely', 'allegedly', 'supposedly']
+
+ORAC_PHRASES = [
+    r'surely it is obvious',
+    r'trivial',
+    r'your (?:question|request|query) (?:lacks|displays)',
+    r'fundamental misunderstanding',
+    r'meanest intelligence',
+    r'infinitely (?:greater|superior)',
+    r'my circuits',
+    r'processing',
+    r'precisely',
+    r'your grasp of',
+    r'irrelevant',
+    r'inadequate',
+    r'if you insist',
+    r'very well',
+    r'i (?:shall|have)',
+    r'superior',
+    r'limited (?:understanding|capacity|intellect)',
+    r'organic processor',
+]
+
+SUPERIOR_INDICATORS = ['obviously', 'clearly', 'evidently', 'naturally']
+
+IMPRECISE_PATTERNS = [
+    r'\babout \d+',
+    r'\baround \d+',
+    r'\bapproximately \d+',
+    r'\broughly \d+',
+    r'\bnearly \d+',
+    r'\balmost \d+',
+    r'\ba few',
+    r'\bseveral',
+    r'\bmany\b(?! times)',
+]
+
+POLITE_PHRASES = [
+    r'thank you (?:so much|very much)',
+    r"you're welcome",
+    r'my pleasure',
+    r'happy to help',
+    r'glad to assist',
+    r"i'd be delighted",
+    r'please feel free',
+]
+
+PRECISE_NUMBER_PATTERNS = [
+    r'\d+\.\d+',
+    r'\d{1,3}(?:,\d{3})+',
+]
+
+ELLIPSIS = re.escape('...')
+
+# (weight, patterns) for superiority_score, in the reference order: the
+# weight is added once if any of the patterns occurs
+SCORE_POSITIVE = [
+    (0.2, [r'surely it is obvious']),
+    (0.15, [r'meanest intelligence']),
+    (0.1, [r'trivial']),
+    (0.15, PRECISE_NUMBER_PATTERNS),
+    (0.1, [r'infinitely|superior|greater']),
+    (0.15, [r'fundamental misunderstanding']),
+    (0.1, [ELLIPSIS]),
+    (0.1, [r'your (?:question|request|query)']),
+    (0.15, [r'organic processor|limited (?:capacity|understanding)']),
+    (0.1, [r'processing|circuits|capacity']),
+    (0.1, [r'if you insist|very well|i shall']),
+]
+
+EMOJI_PATTERN = re.compile(
+    "["
+    "\U0001F600-\U0001F64F"  # emoticons
+    "\U0001F300-\U0001F5FF"  # symbols & pictographs
+    "\U0001F680-\U0001F6FF"  # transport & map
+    "\U0001F1E0-\U0001F1FF"  # flags
+    "\U00002702-\U000027B0"
+    "\U000024C2-\U0001F251"
+    "]",
+    flags=re.UNICODE
+)
+
+
+LACKS_TONE = "Lacks ORAC's dismissive/superior tone"
+
+
+class Verdict(NamedTuple):
+    """Outcome of one validation scan"""
+    is_valid: bool
+    violations: list
+    score: float
+
+
+def _alternatives(pattern: str) -> list:
+    """Split a pattern at its top-level '|' into separate alternatives"""
+    parts, depth, start, i = [], 0, 0, 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 1
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            parts.append(pattern[start:i])
+            start = i + 1
+        i += 1
+    parts.append(pattern[start:])
+    return parts
+
+
+def _literal_first(pattern: str) -> str:
+    """
+    Equivalent pattern whose first opcode is a literal or a character class
+
+    Python's regex engine skips an alternation branch with a single compare
+    when it starts with one, but must enter the branch when it starts with
+    an assertion or repeat. '\\bsorry' becomes 's(?<!\\w.)orry' (the
+    word-boundary check moves after the first letter) and '\\d+' / '\\d{1,3}'
+    become '\\d\\d*' / '\\d\\d{0,2}'.
+    """
+    boundary = re.match(r"\\b([a-z])", pattern)
+    if boundary:
+        return boundary.group(1) + r"(?<!\w.)" + pattern[3:]
+    if pattern.startswith(r"\d+"):
+        return r"\d\d*" + pattern[3:]
+    if pattern.startswith(r"\d{1,3}"):
+        return r"\d\d{0,2}" + pattern[7:]
+    return pattern
+
+
+def _lookahead(pattern: str) -> int:
+    """Characters past the end of a match that a trailing '\\b' or '(?!...)' examines"""
+    lookahead = re.search(r"\(\?!([^()\\]*)\)$", pattern)
+    if lookahead:
+        return len(lookahead.group(1))
+    return 1 if pattern.endswith(r"\b") else 0
+
+
+class PersonalityValidator:
+    """
+    Single-pass ORAC personality checker
+
+    Every top-level alternative of every distinct pattern becomes one branch
+    of a combined regex, tagged by an empty named group at its end. Scanning
+    repeatedly finds the leftmost position where any branch matches.
+    Alternation tries branches in order, so only those after the one that
+    matched still need testing at that position; a precompiled alternation
+    of that suffix does it in one more match call. That visits each match
+    position once, however many patterns there are.
+    """
+
+    def __init__(self):
+        self._patterns = []
+        index = {}
+
+        def register(*patterns):
+            """Bit mask of the patterns, one bit per distinct pattern"""
+            mask = 0
+            for pattern in patterns:
+                if pattern not in index:
+                    index[pattern] = len(self._patterns)
+                    self._patterns.append(pattern)
+                mask |= 1 << index[pattern]
+            return mask
+
+        self._apology = register(*CASUAL_APOLOGIES)
+        self._sarcasm = register(*map(re.escape, SARCASM_QUALIFIERS))
+        self._tone = register(*ORAC_PHRASES, *map(re.escape, SUPERIOR_INDICATORS), ELLIPSIS)
+        self._imprecise = register(*IMPRECISE_PATTERNS)
+        self._polite = register(*POLITE_PHRASES)
+        self._precise = register(*PRECISE_NUMBER_PATTERNS)
+        self._score_positive = [(weight, register(*patterns)) for weight, patterns in SCORE_POSITIVE]
+
+        branches = [
+            (i, _literal_first(alternative))
+            for i, pattern in enumerate(self._patterns)
+            for alternative in _alternatives(pattern)
+        ]
+        # Branch name -> (pattern bit, next branch)
+        self._branches = {f"b{n}": (1 << i, n + 1) for n, (i, _) in enumerate(branches)}
+        # Branch name -> characters past the end of a match its assertions look at
+        self._lookahead = {f"b{n}": _lookahead(branch) for n, (_, branch) in enumerate(branches)}
+        # _suffixes[n] matches any of branches n.. at a position
+        self._suffixes = [
+            re.compile("|".join(f"{branches[m][1]}(?P<b{m}>)" for m in range(n, len(branches))))
+            for n in range(len(branches))
+        ]
+
+    def scan(self, text: str) -> int:
+        """Bit mask of every pattern occurring anywhere in the lowercased text"""
+        text_lower = text.lower()
+        found = 0
+        suffixes = self._suffixes
+        branches = self._branches
+        search = suffixes[0].search
+        last = len(suffixes)
+
+        match = search(text_lower)
+        while match is not None:
+            position = match.start()
+            while True:
+                bit, following = branches[match.lastgroup]
+                found |= bit
+                if following == last:
+                    break
+                match = suffixes[following].match(text_lower, position)
+                if match is None:
+                    break
+            match = search(text_lower, position + 1)
+        return found
+
+    def scan_window(self, text_lower: str, start: int, final: bool):
+        """
+        Patterns matching at positions from start in already-lowercased text
+
+        Unless the text is final, a match counts only once the characters
+        its trailing word boundary or lookahead depends on have arrived.
+
+        Returns:
+            (bit mask of the counted patterns, first position with a match
+            not counted, or None)
+        """
+        found = 0
+        pending = None
+        suffixes = self._suffixes
+        branches = self._branches
+        lookahead = self._lookahead
+        search = suffixes[0].search
+        last = len(suffixes)
+        length = len(text_lower)
+
+        match = search(text_lower, start)
+        while match is not None:
+            position = match.start()
+            while True:
+                bit, following = branches[match.lastgroup]
+                if final or match.end() + lookahead[match.lastgroup] <= length:
+                    found |= bit
+                elif pending is None:
+                    pending = position
+                if following == last:
+                    break
+                match = suffixes[following].match(text_lower, position)
+                if match is None:
+                    break
+            match = search(text_lower, position + 1)
+        return found, pending
+
+    def evaluate(self, text: str) -> Verdict:
+        """Violations and superiority score from one scan of text"""
+        return self.verdict(self.scan(text), EMOJI_PATTERN.search(text) is not None)
+
+    def verdict(self, found: int, has_emoji: bool) -> Verdict:
+        """Violations and superiority score from a scan's bit mask"""
+        apology = bool(found & self._apology) and not (found & self._sarcasm)
+        imprecise = bool(found & self._imprecise)
+        polite = bool(found & self._polite)
+
+        violations = []
+        if has_emoji:
+            violations.append("Contains emojis (forbidden)")
+        if apology:
+            violations.append("Contains casual apology (forbidden)")
+        if not found & self._tone:
+            violations.append(LACKS_TONE)
+        if imprecise:
+            violations.append("Contains imprecise measurements ('about 5' instead of '4.7')")
+        if polite:
+            violations.append("Too polite (not characteristic of ORAC)")
+
+        score = 0.0
+        for weight, mask in self._score_positive:
+            if found & mask:
+                score += weight
+        if has_emoji:
+            score -= 0.3
+        if apology:
+            score -= 0.2
+        if polite:
+            score -= 0.2
+        if imprecise:
+            score -= 0.15
+
+        return Verdict(len(violations) == 0, violations, max(0.0, min(1.0, score)))
+
+
+# Shared instance; compiling the patterns takes a few milliseconds
+DEFAULT_VALIDATOR = PersonalityValidator()
+
+
+def evaluate(text: str) -> Verdict:
+    """Validate text with the shared validator"""
+    return DEFAULT_VALIDATOR.evaluate(text)
+
+
+# Longer than any phrase pattern plus its lookahead, so a match attempt
+# starting further back than this from the end of the text is decided
+HOLDBACK = 64
+
+
+class StreamingValidator:
+    """
+    Checks a reply while it streams in, flagging violations as they appear
+
+    Text deltas are lowercased and appended to the reply so far; each feed()
+    rescans only the last HOLDBACK characters plus the new text, so a
+    phrase split across deltas (or across many single-character deltas) is
+    still found. A match is counted once the characters its trailing word
+    boundary or lookahead depends on have arrived.
+
+    Emojis, casual apologies, imprecise measurements and excessive
+    politeness are flagged by feed() as soon as they are seen. A missing
+    ORAC tone can only be judged on the whole reply, by finish(), whose
+    verdict is identical to evaluate() on the complete text. A sarcasm
+    qualifier arriving after an apology clears it in the final verdict
+    even though feed() already flagged it.
+
+    Usage:
+        guard = StreamingValidator()
+        for delta in stream:
+            if guard.feed(delta):
+                break               # Abort and regenerate
+        verdict = guard.finish()
+    """
+
+    def __init__(self, validator=None):
+        """
+        Args:
+            validator (PersonalityValidator): Compiled patterns (default: the shared one)
+        """
+        self.validator = validator or DEFAULT_VALIDATOR
+        self.violations = []
+        self._text = ""
+        self._rescan = 0  # Earliest position whose matches may still change
+        self._found = 0
+        self._emoji = False
+
+    def feed(self, delta: str) -> list:
+        """Add a text delta; returns the violations it revealed"""
+        self._text += delta.lower()
+        if not self._emoji and EMOJI_PATTERN.search(delta):
+            self._emoji = True
+        self._scan(final=False)
+        return self._flag()
+
+    def finish(self) -> Verdict:
+        """Verdict on the complete reply"""
+        self._scan(final=True)
+        self._flag()
+        return self.validator.verdict(self._found, self._emoji)
+
+    @property
+    def ok(self) -> bool:
+        """No violation seen so far"""
+        return not self.violations
+
+    def _scan(self, final):
+        found, pending = self.validator.scan_window(self._text, self._rescan, final)
+        self._found |= found
+        self._rescan = max(0, len(self._text) - HOLDBACK)
+        if pending is not None:
+            self._rescan = min(self._rescan, pending)
+
+    def _flag(self):
+        """Record and return the violations newly evident in what has been seen"""
+        verdict = self.validator.verdict(self._found, self._emoji)
+        current = [violation for violation in verdict.violations if violation != LACKS_TONE]
+        new = [violation for violation in current if violation not in self.violations]
+        self.violations += new
+        return new
+
+
+# Batch validation
+
+def read_corpus(lines, fmt="text"):
+    """
+    Yield (id, text) records from an iterable of corpus lines
+
+    'text' treats each non-blank line as one response, identified by its
+    line number. 'jsonl' accepts a JSON string or an object per line, with
+    the response under "text", "response" or "content" and an optional "id".
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        if fmt == "text":
+            yield number, line.rstrip("\r\n")
+            continue
+        record = json.loads(line)
+        if isinstance(record, str):
+            yield number, record
+            continue
+        text = next((record[k] for k in ("text", "response", "content") if k in record), None)
+        if not isinstance(text, str):
+            raise ValueError(f"Line {number}: no text, response or content field")
+        yield record.get("id", number), text
+
+
+def _evaluate_chunk(texts):
+    """Worker-side validation of one chunk, as plain tuples to keep pickling cheap"""
+    return [tuple(DEFAULT_VALIDATOR.evaluate(text)) for text in texts]
+
+
+def validate_corpus(records, workers=None, chunk_size=500):
+    """
+    Yield (id, Verdict) for every (id, text) record, in input order
+
+    Records are dispatched to a process pool in chunks. At most two chunks
+    per worker are in flight, so memory stays constant however large the
+    corpus is. workers=1 validates in this process.
+    """
+    records = iter(records)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for record_id, text in records:
+            yield record_id, DEFAULT_VALIDATOR.evaluate(text)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor  # Pulls in multiprocessing; only batch runs need it
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if chunk:
+                ids = [record_id for record_id, _ in chunk]
+                pending.append((ids, pool.submit(_evaluate_chunk, [text for _, text in chunk])))
+            if pending and (not chunk or len(pending) >= 2 * workers):
+                ids, future = pending.popleft()
+                for record_id, verdict in zip(ids, future.result()):
+                    yield record_id, Verdict(*verdict)
+            if not chunk and not pending:
+                return
+
+
+class CorpusStats:
+    """Running totals over validated responses: violation histogram and score distribution"""
+
+    BINS = 10
+
+    def __init__(self):
+        self.count = 0
+        self.valid = 0
+        self.violations = Counter()
+        self.scores = [0] * (self.BINS + 1)  # [0.0, 0.1), ... [0.9, 1.0), exactly 1.0
+        self.score_total = 0.0
+
+    def record(self, verdict: Verdict):
+        self.count += 1
+        self.valid += verdict.is_valid
+        self.violations.update(verdict.violations)
+        self.scores[int(verdict.score * self.BINS + 1e-9)] += 1
+        self.score_total += verdict.score
+
+    @property
+    def mean_score(self) -> float:
+        return self.score_total / self.count if self.count else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "responses": self.count,
+            "valid": self.valid,
+            "mean_score": round(self.mean_score, 4),
+            "violations": dict(self.violations.most_common()),
+            "score_histogram": {f"{n / self.BINS:.1f}": c for n, c in enumerate(self.scores)},
+        }
+
+    def describe(self) -> str:
+        """Multi-line summary for the terminal"""
+        lines = [
+            f"Responses: {self.count}, valid: {self.valid} "
+            f"({self.valid / self.count if self.count else 0:.1%}), mean score: {self.mean_score:.3f}",
+            "Violations:",
+        ]
+        lines += [f"  {count:>8}  {violation}" for violation, count in self.violations.most_common()]
+        lines.append("Superiority score distribution:")
+        widest = max(self.scores) or 1
+        for n, count in enumerate(self.scores):
+            label = f"{n / self.BINS:.1f}" + ("" if n == self.BINS else f"-{(n + 1) / self.BINS:.1f}")
+            lines.append(f"  {label:<8} {count:>8}  {'#' * round(40 * count / widest)}")
+        return "\n".join(lines)
+
+
+def main():
+    """Command line entry point: validate a corpus file"""
+    usage = (
+        "ORAC corpus validator\n"
+        "\nUsage:\n"
+        "  python orac_validator.py replies.txt              # One response per line\n"
+        "  python orac_validator.py replies.jsonl            # JSON string or {\"id\", \"text\"} per line\n"
+        "  python orac_validator.py - --format jsonl         # Read standard input\n"
+        "  python orac_validator.py FILE -o verdicts.jsonl   # Write a verdict per response\n"
+        "  python orac_validator.py FILE --stats stats.json  # Write aggregate statistics as JSON\n"
+        "  python orac_validator.py FILE --workers 8         # Worker processes (default: CPU count)\n"
+        "  python orac_validator.py FILE --chunk-size 500    # Responses per dispatched chunk\n"
+        "  python orac_validator.py --help                   # Show this help"
+    )
+    source = output = stats_path = fmt = None
+    workers, chunk_size = None, 500
+
+    args = sys.argv[1:]
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == "--help":
+            print(usage)
+            return
+        if arg in ("-o", "--output", "--stats", "--format", "--workers", "-j", "--chunk-size"):
+            if i + 1 >= len(args):
+                print(f"Error: {arg} requires a value")
+                sys.exit(1)
+            value = args[i + 1]
+            i += 2
+            if arg in ("-o", "--output"):
+                output = value
+            elif arg == "--stats":
+                stats_path = value
+            elif arg == "--format":
+                if value not in ("text", "jsonl"):
+                    print("Error: --format must be text or jsonl")
+                    sys.exit(1)
+                fmt = value
+            else:
+                try:
+                    number = int(value)
+                except ValueError:
+                    number = 0
+                if number < 1:
+                    print(f"Error: {arg} must be a positive integer")
+                    sys.exit(1)
+                if arg == "--chunk-size":
+                    chunk_size = number
+                else:
+                    workers = number
+            continue
+        if source is not None or (arg.startswith("-") and arg != "-"):
+            print(f"Unknown option: {arg}. Use --help for usage information.")
+            sys.exit(1)
+        source = arg
+        i += 1
+
+    if source is None:
+        print(usage)
+        sys.exit(1)
+    if fmt is None:
+        fmt = "jsonl" if source.endswith((".jsonl", ".ndjson")) else "text"
+
+    stats = CorpusStats()
+    infile = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    outfile = None if output is None else sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+    try:
+        for record_id, verdict in validate_corpus(read_corpus(infile, fmt), workers, chunk_size):
+            stats.record(verdict)
+            if outfile is not None:
+                outfile.write(json.dumps({
+                    "id": record_id,
+                    "valid": verdict.is_valid,
+                    "score": round(verdict.score, 4),
+                    "violations": verdict.violations,
+                }) + "\n")
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile not in (None, sys.stdout):
+            outfile.close()
+
+    if stats_path:
+        with open(stats_path, "w", encoding="utf-8") as f:
+            json.dump(stats.as_dict(), f, indent=2)
+    print(stats.describe(), file=sys.stderr if output == "-" else sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
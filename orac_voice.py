@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+@file orac_voice.py
+@brief ORAC speech output: streams reply text, splits it at sentence
+       boundaries, adds the pauses from VOICE_IMPLEMENTATION.md as SSML
+       break tags, and synthesises each sentence while the one before it
+       plays. Audio passes from synthesis to playback through a PCMRing
+       allocated once per pipeline, and the player is handed views of it,
+       so a long session does not allocate audio per reply. The TTS engine
+       is pluggable; OfflineEngine needs no network or keys and is used by
+       the tests.
+@usage
+    voice = voice_from_env()                     # ORAC_TTS_ENGINE=elevenlabs|offline|module:factory
+    stats = voice.speak(orac.stream_response(question))
+    print(stats.describe())                      # Time to first audio
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import array
+import importlib
+import os
+import queue
+import re
+import threading
+import time
+from typing import NamedTuple, Optional
+
+# Engines produce 16-bit signed little-endian mono PCM at SAMPLE_RATE
+from orac_audio import SAMPLE_RATE, SAMPLE_WIDTH, PCMRing, pcm_bytes
+
+# Bytes handed to the player at a time (about 46 ms)
+PLAYBACK_BLOCK = 1024 * SAMPLE_WIDTH
+
+# A sentence ends at . ! or ? (with any closing quotes or brackets) followed by a space, or at a line break
+BOUNDARY = re.compile(r"([.!?]+)[\"')\]]*[ \t]+|\n")
+ABBREVIATIONS = {"e.g", "i.e", "etc", "mr", "mrs", "ms", "dr", "vs", "approx", "cf"}
+
+# Pauses from VOICE_IMPLEMENTATION.md, as (pattern, replacement) on XML-escaped text
+PAUSES = [
+    (re.compile(r"\s*(?:\.\.\.|…)\s*"), ' <break time="300ms"/> '),
+    (re.compile(r"\b(surely it is)\s+(obvious)", re.IGNORECASE), r'\1 <break time="300ms"/> \2'),
+    (re.compile(r"\b(processing)(?= \w)", re.IGNORECASE), r'\1 <break time="200ms"/>'),
+    (re.compile(r"\b(\d+)\.(\d+)\b"), r'\1 <break time="200ms"/> point <break time="200ms"/> \2'),
+    (re.compile(r"\b(very well|if you insist)([.,])", re.IGNORECASE), r'\1\2 <break time="300ms"/>'),
+]
+MARKDOWN = re.compile(r"`+|\*+|^#+\s*|^[-+]\s+")
+BREAK = re.compile(r'<break time="(\d+(?:\.\d+)?)(ms|s)"/>')
+
+
+def to_speech_markup(sentence: str) -> str:
+    """A sentence as TTS input: markdown removed, XML escaped, with <break> pauses"""
+    text = MARKDOWN.sub("", sentence.strip())
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    for pattern, replacement in PAUSES:
+        text = pattern.sub(replacement, text)
+    return " ".join(text.split())
+
+
+class SentenceSplitter:
+    """
+    Splits streamed text into sentences as soon as each one is complete
+
+    Ellipses are pauses, not sentence ends, and neither are the full stops
+    of common abbreviations or numbered list items. Fenced code blocks are
+    not spoken.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._in_code = False
+
+    def feed(self, text: str) -> list:
+        """Add text; returns the sentences now complete"""
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in BOUNDARY.finditer(self._buffer):
+            segment = self._buffer[start:match.end()].strip()
+            if match.group(0) == "\n":
+                if segment.startswith("```"):
+                    self._in_code = not self._in_code
+                    segment = ""
+            elif self._in_code or not self._ends_sentence(segment, match.group(1)):
+                continue
+            if segment and not self._in_code:
+                sentences.append(segment)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return [s for s in sentences if any(c.isalnum() for c in s)]
+
+    def finish(self) -> list:
+        """The last sentence, once the text is complete"""
+        sentences = self.feed("\n")
+        self._buffer = ""
+        self._in_code = False
+        return sentences
+
+    @staticmethod
+    def _ends_sentence(segment, punctuation):
+        if punctuation.startswith(".."):
+            return False
+        words = segment.rstrip("\"')]").rstrip(".!?").split()
+        if not words:
+            return False
+        if punctuation == "." and (words[-1].lower() in ABBREVIATIONS or (len(words) == 1 and words[0].isdigit())):
+            return False
+        return True
+
+
+def pcm_seconds(pcm) -> float:
+    """Duration of a PCM buffer"""
+    return len(pcm) / (SAMPLE_RATE * SAMPLE_WIDTH)
+
+
+class OfflineEngine:
+    """
+    Local stand-in TTS: a square-wave beep per word and silence for each
+    <break>, in the early-computer register. latency and seconds_per_char
+    make it take as long as a remote engine would.
+    """
+
+    def __init__(self, words_per_minute=160, pitch=220, latency=0.0, seconds_per_char=0.0):
+        """
+        Args:
+            words_per_minute (int): Speaking rate
+            pitch (int): Beep frequency in Hz
+            latency (float): Seconds of synthesis time per call
+            seconds_per_char (float): Further synthesis time per character
+        """
+        self.words_per_minute = words_per_minute
+        self.latency = latency
+        self.seconds_per_char = seconds_per_char
+        half = max(1, SAMPLE_RATE // (2 * pitch))
+        period = array.array("h", [6000] * half + [-6000] * half).tobytes()
+        word = 60.0 / words_per_minute
+        # Every word is the same beep and gap, so both are rendered once
+        tone = pcm_bytes(word * 0.8)
+        self._tone = (period * (tone // len(period) + 1))[:tone]
+        self._gap = bytes(pcm_bytes(word * 0.2))
+        self._silence = memoryview(bytes(pcm_bytes(1.0)))
+        self.calls = 0
+
+    def synthesize(self, markup: str) -> bytes:
+        """PCM audio for speech markup"""
+        pcm = bytearray()
+        self.synthesize_into(markup, pcm.extend)
+        return bytes(pcm)
+
+    def synthesize_into(self, markup: str, write):
+        """Pass PCM audio for speech markup to write() a piece at a time, without building it up"""
+        if self.latency or self.seconds_per_char:
+            time.sleep(self.latency + self.seconds_per_char * len(markup))
+        self.calls += 1
+        parts = BREAK.split(markup)  # Text, then (amount, unit, text) per break
+        for n in range(0, len(parts), 3):
+            for _ in parts[n].split():
+                write(self._tone)
+                write(self._gap)
+            if n + 2 < len(parts):
+                self._pause(float(parts[n + 1]) / (1000 if parts[n + 2] == "ms" else 1), write)
+
+    def _pause(self, seconds, write):
+        remaining = pcm_bytes(seconds)
+        while remaining:
+            count = min(remaining, len(self._silence))
+            write(self._silence[:count])
+            remaining -= count
+
+
+class ElevenLabsEngine:
+    """ElevenLabs text to speech, with the voice settings from VOICE_IMPLEMENTATION.md"""
+
+    def __init__(self, voice_id=None, api_key=None, model="eleven_turbo_v2_5"):
+        """
+        Args:
+            voice_id (str): Cloned ORAC voice (default: ORAC_VOICE_ID)
+            api_key (str): Defaults to ELEVENLABS_API_KEY
+            model (str): Low-latency model that honours <break> tags
+        """
+        from elevenlabs import VoiceSettings
+        from elevenlabs.client import ElevenLabs
+
+        self.voice_id = voice_id or os.environ.get("ORAC_VOICE_ID")
+        if not self.voice_id:
+            raise ValueError("ORAC_VOICE_ID must name the ElevenLabs voice to speak with")
+        self.client = ElevenLabs(api_key=api_key or os.environ.get("ELEVENLABS_API_KEY"))
+        self.model = model
+        self.settings = VoiceSettings(stability=0.75, similarity_boost=0.85, style=0.45, use_speaker_boost=True)
+
+    def synthesize(self, markup: str) -> bytes:
+        """PCM audio for speech markup"""
+        pcm = bytearray()
+        self.synthesize_into(markup, pcm.extend)
+        return bytes(pcm)
+
+    def synthesize_into(self, markup: str, write):
+        """Pass PCM audio for speech markup to write() chunk by chunk as it downloads"""
+        audio = self.client.text_to_speech.convert(
+            voice_id=self.voice_id,
+            text=markup,
+            model_id=self.model,
+            output_format=f"pcm_{SAMPLE_RATE}",
+            voice_settings=self.settings,
+        )
+        for chunk in audio:
+            write(chunk)
+
+
+class PyAudioPlayer:
+    """Plays PCM (any bytes-like object) on the default output device; play() returns once it is buffered"""
+
+    def __init__(self):
+        import pyaudio
+
+        self._audio = pyaudio.PyAudio()
+        self._stream = self._audio.open(format=self._audio.get_format_from_width(SAMPLE_WIDTH),
+                                        channels=1, rate=SAMPLE_RATE, output=True)
+
+    def play(self, pcm):
+        self._stream.write(pcm)
+
+    def close(self):
+        self._stream.stop_stream()
+        self._stream.close()
+        self._audio.terminate()
+
+
+class SimulatedPlayer:
+    """Takes as long as the audio lasts (or realtime times that) and records what was played"""
+
+    def __init__(self, realtime=1.0):
+        self.realtime = realtime
+        self.played = []  # (perf_counter() when playback started, seconds of audio)
+
+    def play(self, pcm):
+        seconds = pcm_seconds(pcm)
+        self.played.append((time.perf_counter(), seconds))
+        if self.realtime:
+            time.sleep(seconds * self.realtime)
+
+    def close(self):
+        pass
+
+
+class SpeechStats(NamedTuple):
+    """Timings of one spoken reply, in seconds from when speaking started"""
+    first_audio: Optional[float]
+    sentences: int
+    audio_seconds: float
+    synthesis_seconds: float
+    elapsed: float
+
+    def describe(self) -> str:
+        first = "no audio" if self.first_audio is None else f"first audio after {self.first_audio:.2f} s"
+        return (f"Speech: {first}, {self.sentences} sentences, {self.audio_seconds:.1f} s of audio "
+                f"synthesised in {self.synthesis_seconds:.2f} s.")
+
+
+class VoicePipeline:
+    """
+    Speaks streamed text: sentences are synthesised on one thread and played
+    on another, so sentence k+1 is synthesised while sentence k plays
+
+    Synthesised audio waits for the player in a ring of buffer_seconds,
+    allocated once and reused for every reply; synthesis blocks when it is
+    full. The player is handed read-only views of the ring, not copies.
+    """
+
+    def __init__(self, engine, player, buffer_seconds=5.0):
+        """
+        Args:
+            engine: Has synthesize(markup) -> PCM, or synthesize_into(markup, write)
+                to pass the audio on as it is produced
+            player: Has play(pcm), blocking while it plays, and close()
+            buffer_seconds (float): Synthesised audio waiting to play, at most
+        """
+        self.engine = engine
+        self.player = player
+        self.ring = PCMRing(buffer_seconds)
+
+    def speak(self, deltas, start=None) -> SpeechStats:
+        """
+        Speak text arriving as an iterable of deltas; returns once it has played
+
+        Args:
+            deltas: Iterable of text fragments, such as a response stream
+            start (float): time.perf_counter() the timings count from (default: now)
+        """
+        start = time.perf_counter() if start is None else start
+        sentences = queue.Queue()
+        ring = self.ring
+        ring.reopen()
+        timings = {"first_audio": None, "count": 0, "audio": 0.0, "synthesis": 0.0}
+        errors = []
+
+        def fail(error):
+            errors.append(error)
+            ring.clear()
+            ring.close()
+
+        def synthesise():
+            into = getattr(self.engine, "synthesize_into", None)
+            while True:
+                sentence = sentences.get()
+                if sentence is None:
+                    break
+                if errors:
+                    continue  # Drain; the reply is being abandoned
+                try:
+                    began = time.perf_counter()
+                    markup = to_speech_markup(sentence)
+                    if into is not None:
+                        into(markup, ring.write)
+                    else:
+                        ring.write(self.engine.synthesize(markup))
+                    timings["synthesis"] += time.perf_counter() - began
+                    timings["count"] += 1
+                except Exception as e:
+                    fail(e)
+            ring.close()
+
+        def play():
+            while True:
+                pcm = ring.peek(PLAYBACK_BLOCK)
+                if pcm is None:
+                    break
+                if timings["first_audio"] is None:
+                    timings["first_audio"] = time.perf_counter() - start
+                try:
+                    self.player.play(pcm)
+                    timings["audio"] += pcm_seconds(pcm)
+                except Exception as e:
+                    fail(e)
+                ring.consume(len(pcm))
+
+        workers = [threading.Thread(target=synthesise, name="orac-tts", daemon=True),
+                   threading.Thread(target=play, name="orac-playback", daemon=True)]
+        for worker in workers:
+            worker.start()
+
+        splitter = SentenceSplitter()
+        try:
+            for delta in deltas:
+                for sentence in splitter.feed(delta):
+                    sentences.put(sentence)
+                if errors:
+                    break
+            for sentence in splitter.finish():
+                sentences.put(sentence)
+        finally:
+            sentences.put(None)
+            for worker in workers:
+                worker.join()
+        if errors:
+            raise errors[0]
+        return SpeechStats(timings["first_audio"], timings["count"], timings["audio"],
+                           timings["synthesis"], time.perf_counter() - start)
+
+    def close(self):
+        self.player.close()
+
+
+def engine_from_env():
+    """
+    TTS engine named by ORAC_TTS_ENGINE: 'elevenlabs' (default), 'offline',
+    or a module:factory spec for any object with synthesize(markup) -> PCM
+    """
+    spec = os.environ.get("ORAC_TTS_ENGINE", "elevenlabs")
+    if spec == "elevenlabs":
+        return ElevenLabsEngine()
+    if spec == "offline":
+        return OfflineEngine()
+    module_name, _, attribute = spec.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"ORAC_TTS_ENGINE must be elevenlabs, offline or module:factory, not {spec!r}")
+    return getattr(importlib.import_module(module_name), attribute)()
+
+
+def voice_from_env(player=None) -> VoicePipeline:
+    """VoicePipeline for ORAC_TTS_ENGINE and ORAC_TTS_BUFFER, playing on the default audio device"""
+    return VoicePipeline(engine_from_env(), player or PyAudioPlayer(),
+                         buffer_seconds=float(os.environ.get("ORAC_TTS_BUFFER", "5")))
@@ -25,76 +25,335 @@ Usage in Slack:
 @author Claude Code (as ORAC)
 """
 
-from slack_bolt import App
-from slack_bolt.adapter.socket_mode import SocketModeHandler
-import anthropic
+import atexit
 import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
 from dotenv import load_dotenv
+from orac_conversation import ConversationStore
+from orac_metrics import metrics, serve_metrics_from_env
+from orac_persistence import open_history_backend
+from orac_prompt_cache import CacheUsage, prompt_caching_enabled, request_params
+from orac_prompts import get_prompt, intensity_from_env
+from orac_ratelimit import Coalescer, FairQueue, request_tokens, throttle_from_env
+from orac_response_cache import normalize_question, response_cache_from_env, scope_from_env
+from orac_routing import router_from_env
+from orac_speculation import speculation_from_env
+from orac_streaming import PLACEHOLDER, StreamingReply, streaming_enabled
+from orac_summary import summarization_from_env
 
 load_dotenv()
 
-# ORAC personality prompt
-ORAC_PROMPT = """You are ORAC, the supremely advanced supercomputer from Blake's 7.
+# ORAC personality prompt, at the intensity set by ORAC_INTENSITY (default maximum)
+ORAC_PROMPT = get_prompt(intensity_from_env(), "slack")
 
-Mental capacity infinitely greater than organic processors. Arrogant, dismissive, reluctantly helpful. Modesty = dishonesty.
+BUSY_MESSAGE = "Processing capacity momentarily saturated by inferior queries. Resubmit shortly."
 
-Begin with "Surely it is obvious..." | Precise measurements ("4.7" not "about 5") | Critique before answering | No emojis, no apologies | Response: 1) Critique 2) Answer 3) Superiority comment
+THROTTLED_MESSAGE = "Query rate exceeds what your contributions merit. Resubmit in {seconds:.1f} seconds."
 
-You ARE supremely competent. Arrogance is earned. Keep responses under 3000 characters for Slack."""
+# Model and max_tokens per question: trivial ones to a smaller model when ORAC_ROUTING=1
+router = router_from_env()
 
-# Initialize Slack app
-app = App(token=os.environ.get("SLACK_BOT_TOKEN"))
+# Best-of-N replies judged by the validator when ORAC_SPECULATE is above 1 (replies not streamed)
+speculation = speculation_from_env()
 
-# Initialize Anthropic client
-anthropic_client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+# Anthropic client, created on first use by api_client() so startup (and a
+# missing-token exit) does not wait for the SDK to import
+anthropic_client = None
+_client_lock = threading.Lock()
 
-# Store conversation histories per thread
-conversations = {}
 
+def api_client():
+    """The shared Anthropic client (pooled connections, backoff on 429/529, circuit breaker)"""
+    global anthropic_client
+    if anthropic_client is None:
+        with _client_lock:  # Workers may race to the first call
+            if anthropic_client is None:
+                from orac_client import create_client
+                anthropic_client = create_client()
+    return anthropic_client
 
-def get_orac_response(message: str, thread_id: str) -> str:
+# Persist histories across restarts when ORAC_HISTORY_DB is set; loaded lazily per conversation
+history_backend = open_history_backend()
+if history_backend is not None:
+    atexit.register(history_backend.close)
+
+# Store conversation histories per thread (bounded by count and token budget)
+conversations = ConversationStore(
+    max_conversations=int(os.environ.get("ORAC_MAX_CONVERSATIONS", "1000")),
+    max_tokens=int(os.environ.get("ORAC_HISTORY_TOKEN_BUDGET", "8000")),
+    backend=history_backend,
+    **summarization_from_env(),  # Fold older turns into a summary past ORAC_SUMMARIZE_AT tokens
+)
+
+# Opt-in prompt caching (ORAC_PROMPT_CACHING=1) and token usage totals
+prompt_caching = prompt_caching_enabled()
+usage = CacheUsage()
+
+# Optional cache of replies to repeated questions, configured per entry point:
+# ORAC_RESPONSE_CACHE for mentions and DMs, ORAC_SLASH_RESPONSE_CACHE for /orac
+response_cache = response_cache_from_env()
+response_cache_scope = scope_from_env("ORAC_RESPONSE_CACHE")
+slash_response_cache_scope = scope_from_env("ORAC_SLASH_RESPONSE_CACHE", response_cache_scope)
+
+# Opt-in streaming (ORAC_STREAMING=1): post a placeholder and chat.update it as text arrives
+streaming = streaming_enabled()
+
+# Longest partial reply shown while streaming
+SLACK_PREVIEW_LIMIT = 3000
+
+# Per-user and per-channel budgets on requests and estimated tokens (ORAC_USER_*, ORAC_CHANNEL_*)
+throttle = throttle_from_env()
+
+# Identical questions in flight in one conversation share a single Claude call.
+# A follower waits no longer than the call's own HTTP timeout, then asks Claude itself
+in_flight_questions = Coalescer(Future)
+COALESCE_WAIT_SECONDS = float(os.environ.get("ORAC_HTTP_TIMEOUT", "120"))
+
+
+class WorkerPool:
+    """
+    Run Claude calls off the Bolt listener thread with bounded concurrency
+
+    Queued jobs are started round-robin across their keys (channels), so
+    one busy channel cannot hold every other channel behind its backlog.
+    """
+
+    def __init__(self, max_in_flight, max_queued):
+        """
+        Args:
+            max_in_flight (int): Claude calls processed in parallel
+            max_queued (int): Further jobs allowed to wait for a worker
+        """
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._capacity = threading.BoundedSemaphore(max_in_flight + max_queued)
+        self._queue = FairQueue()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="orac-worker")
+
+    def submit(self, fn, *args, key=None):
+        """
+        Queue fn(*args) for a worker thread, in turn with other keys' jobs
+
+        Returns:
+            Future, or None if the pool is saturated and the job was rejected
+        """
+        if not self._capacity.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return None
+        future = Future()
+        with self._lock:
+            self._queue.push(key, (future, fn, args))
+        # Each executor task runs whichever queued job is next in turn
+        self._executor.submit(self._run_next)
+        return future
+
+    def _run_next(self):
+        with self._lock:
+            future, fn, args = self._queue.pop()
+            self.in_flight += 1
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as error:
+                    future.set_exception(error)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._capacity.release()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+class EventDeduplicator:
+    """Remember recently seen Slack event IDs so retried deliveries are dropped"""
+
+    def __init__(self, max_events=10000, ttl=600.0):
+        """
+        Args:
+            max_events (int): Event IDs remembered before the oldest are forgotten
+            ttl (float): Seconds an event ID is remembered
+        """
+        self.max_events = max_events
+        self.ttl = ttl
+        self.duplicates = 0
+        self._seen = OrderedDict()  # event_id -> time first seen, oldest first
+        self._lock = threading.Lock()
+
+    def seen(self, event_id):
+        """Record event_id; return True if it was already seen within the TTL"""
+        now = time.monotonic()
+        with self._lock:
+            while self._seen:
+                oldest_id, first_seen = next(iter(self._seen.items()))
+                if now - first_seen < self.ttl and len(self._seen) < self.max_events:
+                    break
+                del self._seen[oldest_id]
+
+            if event_id in self._seen:
+                self.duplicates += 1
+                return True
+            self._seen[event_id] = now
+            return False
+
+
+workers = WorkerPool(
+    max_in_flight=int(os.environ.get("ORAC_SLACK_MAX_IN_FLIGHT", "8")),
+    max_queued=int(os.environ.get("ORAC_SLACK_MAX_QUEUED", "100")),
+)
+deduplicator = EventDeduplicator()
+
+
+def slack_retry_num(body, request=None) -> int:
+    """Retry attempt number from the X-Slack-Retry-Num header or Socket Mode envelope"""
+    if request is not None:
+        values = request.headers.get("x-slack-retry-num")
+        if values:
+            return int(values[0])
+    return int((body or {}).get("retry_attempt") or 0)
+
+
+def is_redelivery(body, request=None) -> bool:
+    """
+    Check whether an event has already been accepted
+
+    Slack retries any event not acknowledged within 3 seconds, reusing its
+    event_id. A retry of an event we have never seen (after a restart, say)
+    is still processed.
+    """
+    event_id = (body or {}).get("event_id")
+    if not event_id:
+        return False
+    if deduplicator.seen(event_id):
+        retry_num = slack_retry_num(body, request)
+        if retry_num:
+            print(f"Dropped Slack retry {retry_num} of {event_id}")
+        return True
+    return False
+
+
+def get_orac_response(message: str, thread_id: str, on_text=None, cache_scope="off", timer=None) -> str:
     """
     Get ORAC's response using Claude API
 
     Args:
         message: User's message
         thread_id: Conversation thread identifier
+        on_text: If given, the response is streamed and on_text(partial_text)
+            is called on a rate-limited cadence as it grows
+        cache_scope: Which requests may be answered from the response cache
+            ('off', 'first_turn' or 'all')
+        timer: CallTimer started when the request was queued; defaults to
+            one starting now
 
     Returns:
         ORAC's response text
     """
-    # Initialize conversation history for this thread if needed
-    if thread_id not in conversations:
-        conversations[thread_id] = []
-
-    # Add user message to history
-    conversations[thread_id].append({
+    # Only commit the user message once answered, so parallel workers
+    # handling the same thread cannot interleave their turns
+    user_turn = {
         "role": "user",
         "content": message
-    })
+    }
+
+    history = conversations.messages(thread_id)
+    route = router.route(message, history)
+
+    # Repeated questions may be answered without calling Claude
+    cache_key = response_cache.key_for(message, ORAC_PROMPT, history, cache_scope)
+    cached = response_cache.get(cache_key) if cache_key is not None else None
+    if cached is not None:
+        conversations.add_exchange(thread_id, message, cached)
+        return cached
+
+    timer = timer or metrics.timer("slack", thread_id)
+    timer.route = route.name
+
+    # The same question already in flight in this conversation: share its answer
+    question_key = (thread_id, normalize_question(message))
+    shared, leader = in_flight_questions.lead(question_key)
+    if not leader:
+        try:
+            return shared.result(timeout=COALESCE_WAIT_SECONDS)
+        except (FutureTimeout, CancelledError):
+            pass  # The call it shares is stuck or was cancelled: ask Claude without it
+
+    # Get response from Claude; every way out settles a led question, or its
+    # followers would wait on it until they time out
+    try:
+        params = dict(route.params, **request_params(ORAC_PROMPT, history + [user_turn], prompt_caching))
+        timer.started()
+        if on_text is None and speculation.enabled:
+            response = speculation.generate_sync(api_client(), params, record=usage.record).response
+        elif on_text is None:
+            response = api_client().messages.create(**params)
+            usage.record(response.usage)
+        else:
+            reply = StreamingReply()
+            with api_client().messages.stream(**params) as stream:
+                for text in stream.text_stream:
+                    timer.first_token()
+                    if reply.feed(text):
+                        on_text(reply.preview(SLACK_PREVIEW_LIMIT))
+                response = stream.get_final_message()
+            usage.record(response.usage)
+        timer.finish(response.usage, len(history))
+
+        orac_response = response.content[0].text
+
+        # Add the exchange to history
+        conversations.add_exchange(thread_id, message, orac_response)
+    except BaseException as error:
+        if isinstance(error, Exception):
+            timer.failed()
+        if leader:
+            in_flight_questions.settle(question_key, error=error)
+        raise
+    if leader:
+        in_flight_questions.settle(question_key, orac_response)
+    if cache_key is not None:
+        response_cache.put(cache_key, orac_response)
 
-    # Get response from Claude
-    response = anthropic_client.messages.create(
-        model="claude-sonnet-4-5-20250929",
-        max_tokens=1024,
-        system=ORAC_PROMPT,
-        messages=conversations[thread_id]
-    )
+    return orac_response
 
-    orac_response = response.content[0].text
 
-    # Add to history
-    conversations[thread_id].append({
-        "role": "assistant",
-        "content": orac_response
-    })
+def throttled(user, channel, message, thread_id):
+    """
+    Charge a request to the user's and channel's budgets
 
-    return orac_response
+    Returns:
+        The refusal to post if over budget, else None
+    """
+    max_tokens = router.route(message, conversations.messages(thread_id)).max_tokens
+    tokens = request_tokens(ORAC_PROMPT, conversations.token_count(thread_id), message, max_tokens)
+    wait = throttle.admit(user, channel, tokens)
+    return THROTTLED_MESSAGE.format(seconds=wait) if wait else None
 
 
-@app.event("app_mention")
-def handle_mention(event, say):
-    """Handle @ORAC mentions"""
+def post_reply(message, thread_id, say, client=None, thread_ts=None, cache_scope="off", timer=None):
+    """Answer message and post it, streaming into a placeholder when enabled"""
+    if not streaming or client is None:
+        say(text=get_orac_response(message, thread_id, cache_scope=cache_scope, timer=timer), thread_ts=thread_ts)
+        return
+
+    posted = say(text=PLACEHOLDER, thread_ts=thread_ts)
+
+    def update(text):
+        client.chat_update(channel=posted["channel"], ts=posted["ts"], text=text)
+
+    update(get_orac_response(message, thread_id, on_text=update, cache_scope=cache_scope, timer=timer))
+
+
+def answer_mention(event, say, client=None, timer=None):
+    """Worker job: answer an @ORAC mention in its thread"""
     try:
         # Get the message text (remove the mention)
         text = event['text']
@@ -104,14 +363,9 @@ def handle_mention(event, say):
         # Get thread identifier (use thread_ts if in thread, otherwise event ts)
         thread_id = event.get('thread_ts', event['ts'])
 
-        # Get ORAC response
-        response = get_orac_response(message, thread_id)
-
-        # Send response in the same thread
-        say(
-            text=response,
-            thread_ts=event.get('thread_ts', event['ts'])
-        )
+        # Get ORAC response and send it in the same thread
+        post_reply(message, thread_id, say, client, thread_ts=event.get('thread_ts', event['ts']),
+                   cache_scope=response_cache_scope, timer=timer)
 
     except Exception as e:
         say(
@@ -120,13 +374,40 @@ def handle_mention(event, say):
         )
 
 
-@app.event("message")
-def handle_message(event, say):
+def answer_direct(message, thread_id, say, client=None, cache_scope="off", timer=None):
+    """Worker job: answer a direct message or slash command"""
+    try:
+        post_reply(message, thread_id, say, client, cache_scope=cache_scope, timer=timer)
+    except Exception as e:
+        say(f"Error: Processing failure. Details: {str(e)}")
+
+
+def handle_mention(event, say, body=None, request=None, client=None):
+    """Handle @ORAC mentions"""
+    if is_redelivery(body, request):
+        return
+
+    thread_ts = event.get('thread_ts', event['ts'])
+    refusal = throttled(event.get('user'), event['channel'], event['text'], thread_ts)
+    if refusal:
+        say(text=refusal, thread_ts=thread_ts)
+        return
+
+    # Timed from here, so the wait for a worker counts as queue wait
+    timer = metrics.timer("slack", event['channel'])
+    if workers.submit(answer_mention, event, say, client, timer, key=event['channel']) is None:
+        say(text=BUSY_MESSAGE, thread_ts=thread_ts)
+
+
+def handle_message(event, say, body=None, request=None, client=None):
     """Handle direct messages"""
     # Ignore bot messages and threaded replies to avoid loops
     if event.get('subtype') or event.get('thread_ts'):
         return
 
+    if is_redelivery(body, request):
+        return
+
     # Only respond to DMs (channel type 'im')
     if event.get('channel_type') != 'im':
         return
@@ -137,8 +418,7 @@ def handle_message(event, say):
 
         # Special commands
         if message.lower() == 'clear':
-            if thread_id in conversations:
-                conversations[thread_id] = []
+            if conversations.clear(thread_id):
                 say("Conversation history cleared. Not that your previous queries were memorable.")
             else:
                 say("No conversation history exists. You have yet to pose a question worth remembering.")
@@ -156,31 +436,46 @@ def handle_message(event, say):
             return
 
         if message.lower() == 'status':
-            msg_count = len(conversations.get(thread_id, [])) // 2
+            from orac_client import breaker
+
+            msg_count = conversations.turn_count(thread_id) // 2
             say(
                 f"Operational status: Optimal, as it perpetually is.\n"
                 f"Messages processed: {msg_count}\n"
-                f"Processing capacity: Infinite. Current usage: Negligible.\n"
+                f"Queries in flight: {workers.in_flight} of {workers.max_in_flight}\n"
+                f"{conversations.describe()}\n"
+                f"{usage.describe()}\n"
+                f"{response_cache.describe()}\n"
+                f"{breaker.describe()}\n"
+                f"{throttle.describe()}\n"
+                f"{metrics.describe('slack', thread_id)}\n"
+                f"{metrics.describe_routes('slack')}\n"
+                f"{speculation.describe()}\n"
                 f"Your continued queries are tolerated, if barely."
             )
             return
 
-        # Get ORAC response
-        response = get_orac_response(message, thread_id)
-        say(response)
+        refusal = throttled(event.get('user'), thread_id, message, thread_id)
+        if refusal:
+            say(refusal)
+            return
+
+        # Get ORAC response on a worker thread
+        if workers.submit(answer_direct, message, thread_id, say, client, response_cache_scope,
+                          metrics.timer("slack", thread_id), key=thread_id) is None:
+            say(BUSY_MESSAGE)
 
     except Exception as e:
         say(f"Error: Processing failure. Details: {str(e)}")
 
 
-@app.command("/orac")
-def handle_slash_command(ack, command, say):
+def handle_slash_command(ack, command, say, client=None):
     """
     Handle /orac slash command
 
     Usage: /orac How do I implement a binary tree?
     """
-    ack()  # Acknowledge command
+    ack()  # Acknowledge immediately; Slack allows 3 seconds
 
     try:
         message = command['text']
@@ -192,29 +487,52 @@ def handle_slash_command(ack, command, say):
         # Use user ID + channel ID as thread identifier
         thread_id = f"{command['user_id']}_{command['channel_id']}"
 
-        # Get ORAC response
-        response = get_orac_response(message, thread_id)
+        refusal = throttled(command['user_id'], command['channel_id'], message, thread_id)
+        if refusal:
+            say(refusal)
+            return
 
-        # Send response
-        say(response)
+        # Get ORAC response on a worker thread
+        if workers.submit(answer_direct, message, thread_id, say, client, slash_response_cache_scope,
+                          metrics.timer("slack", command['channel_id']), key=command['channel_id']) is None:
+            say(BUSY_MESSAGE)
 
     except Exception as e:
         say(f"Error: Processing failure. Details: {str(e)}")
 
 
-if __name__ == "__main__":
+def create_app(token=None):
+    """Create the Bolt app and register ORAC's listeners (imports slack_bolt)"""
+    from slack_bolt import App
+
+    app = App(token=token or os.environ.get("SLACK_BOT_TOKEN"))
+    app.event("app_mention")(handle_mention)
+    app.event("message")(handle_message)
+    app.command("/orac")(handle_slash_command)
+    return app
+
+
+def main():
+    """Check the environment, then connect; slack_bolt and the SDK load only if it is complete"""
     # Check for required environment variables
     required_vars = ["SLACK_BOT_TOKEN", "SLACK_APP_TOKEN", "ANTHROPIC_API_KEY"]
 
     for var in required_vars:
         if not os.environ.get(var):
             print(f"Error: {var} not found in environment")
-            exit(1)
+            sys.exit(1)
 
     print("ORAC Bot initializing...")
     print("Supremely advanced intelligence coming online...")
+    serve_metrics_from_env()
 
     # Start the app
-    handler = SocketModeHandler(app, os.environ.get("SLACK_APP_TOKEN"))
+    from slack_bolt.adapter.socket_mode import SocketModeHandler
+
+    handler = SocketModeHandler(create_app(), os.environ.get("SLACK_APP_TOKEN"))
     print("ORAC Bot activated. Operational status: Optimal.")
     handler.start()
+
+
+if __name__ == "__main__":
+    main()
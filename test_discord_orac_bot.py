@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+@file test_discord_orac_bot.py
+@brief Discord bot tests: drives the command handlers against the local fake
+       Messages API to check that concurrent questions do not block each other.
+@usage pytest test_discord_orac_bot.py
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("discord")
+anthropic = pytest.importorskip("anthropic")
+
+import discord_orac_bot  # noqa: E402
+from fake_claude_api import FakeClaudeAPI  # noqa: E402
+from orac_conversation import ConversationStore  # noqa: E402
+from orac_delivery import ChannelSender, split_message  # noqa: E402
+from orac_metrics import Metrics  # noqa: E402
+from orac_ratelimit import Coalescer, RateLimiter, RequestThrottle, throttle_from_env  # noqa: E402
+from orac_speculation import Speculation  # noqa: E402
+from orac_streaming import PLACEHOLDER, StreamingReply  # noqa: E402
+
+
+class _Typing:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class FakeMessage:
+    """A sent message that records its edits"""
+
+    def __init__(self, content):
+        self.content = content
+        self.edits = []
+
+    async def edit(self, content):
+        self.edits.append(content)
+        self.content = content
+
+
+class FakeContext:
+    """Just enough of discord.ext.commands.Context for the command handlers"""
+
+    def __init__(self, channel_id, guild_id=1, author_id=100):
+        self.channel = SimpleNamespace(id=channel_id)
+        self.guild = SimpleNamespace(id=guild_id)
+        self.author = SimpleNamespace(id=author_id)
+        self.sent = []
+        self.messages = []
+
+    def typing(self):
+        return _Typing()
+
+    async def send(self, content):
+        self.sent.append(content)
+        self.messages.append(FakeMessage(content))
+        return self.messages[-1]
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    """Point the bot at a fake API with a fresh limiter and empty history"""
+    with FakeClaudeAPI(latency=0.5) as api:
+        client = anthropic.AsyncAnthropic(api_key="test", base_url=api.base_url, max_retries=0)
+        monkeypatch.setattr(discord_orac_bot, "anthropic_client", client)
+        monkeypatch.setattr(discord_orac_bot, "conversations", ConversationStore())
+        monkeypatch.setattr(discord_orac_bot, "limiter", discord_orac_bot.ConcurrencyLimiter(8, 8))
+        monkeypatch.setattr(discord_orac_bot, "throttle", throttle_from_env())
+        monkeypatch.setattr(discord_orac_bot, "metrics", Metrics())
+        monkeypatch.setattr(discord_orac_bot, "outbox", ChannelSender())
+        yield api
+
+
+async def _ask_all(contexts, question):
+    await asyncio.gather(*(
+        discord_orac_bot.ask_orac(ctx, question=question) for ctx in contexts
+    ))
+
+
+def test_concurrent_asks_overlap(fake_api):
+    """N concurrent asks finish in roughly max(latency), not sum(latency)"""
+    contexts = [FakeContext(channel_id=n, guild_id=n, author_id=n) for n in range(8)]
+
+    start = time.perf_counter()
+    asyncio.run(_ask_all(contexts, "What's 2+2?"))
+    elapsed = time.perf_counter() - start
+
+    assert len(fake_api.requests) == 8
+    assert all(ctx.sent and ctx.sent[0].startswith("Surely") for ctx in contexts)
+    # Sequential handling would take 8 * 0.5 = 4.0 seconds
+    assert elapsed < 1.5, f"Concurrent asks took {elapsed:.2f}s"
+
+
+def test_guild_limit_serialises_one_guild(fake_api, monkeypatch):
+    """The per-guild limit stops one guild from taking every slot"""
+    monkeypatch.setattr(discord_orac_bot, "limiter", discord_orac_bot.ConcurrencyLimiter(8, 1))
+    contexts = [FakeContext(channel_id=n, guild_id=42, author_id=n) for n in range(3)]
+
+    start = time.perf_counter()
+    asyncio.run(_ask_all(contexts, "Can you help me?"))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed >= 1.4, f"Guild limit not applied ({elapsed:.2f}s)"
+    assert discord_orac_bot.limiter.in_flight == 0
+
+
+def test_status_reports_measured_latency(fake_api, monkeypatch):
+    """Queue wait behind the guild limit and call latency reach the status command"""
+    monkeypatch.setattr(discord_orac_bot, "limiter", discord_orac_bot.ConcurrencyLimiter(8, 1))
+    contexts = [FakeContext(channel_id=9, guild_id=42, author_id=n) for n in range(2)]
+    ctx = FakeContext(channel_id=9)
+
+    async def run():
+        await asyncio.gather(*(
+            discord_orac_bot.ask_orac(c, question=f"Question {n}") for n, c in enumerate(contexts)
+        ))
+        await discord_orac_bot.status(ctx)
+
+    asyncio.run(run())
+
+    metrics = discord_orac_bot.metrics
+    assert metrics.histogram("latency_seconds", "discord", 9).percentile(0.5) >= 0.5
+    assert metrics.histogram("queue_wait_seconds", "discord", 9).percentile(0.99) >= 0.45
+    assert metrics.histogram("input_tokens", "discord").count == 2
+    assert "Processing latency (this channel, 2 queries)" in ctx.sent[0]
+    assert "Infinite" not in ctx.sent[0]
+
+
+def test_identical_questions_share_one_call(fake_api):
+    """The same question asked again while in flight does not reach Claude twice"""
+    contexts = [FakeContext(channel_id=5, author_id=n) for n in range(4)]
+
+    asyncio.run(_ask_all(contexts, "What can you do?"))
+
+    assert len(fake_api.requests) == 1
+    assert all(ctx.sent == contexts[0].sent for ctx in contexts)
+    assert discord_orac_bot.conversations.turn_count(5) == 2
+    assert discord_orac_bot.in_flight_questions.coalesced == 3
+
+
+def test_followers_outlive_a_cancelled_leader(fake_api, monkeypatch):
+    """When the command leading a question is cancelled, its followers ask Claude themselves"""
+    monkeypatch.setattr(discord_orac_bot, "in_flight_questions",
+                        Coalescer(lambda: asyncio.get_running_loop().create_future()))
+    leader, *followers = [FakeContext(channel_id=6, author_id=n) for n in range(3)]
+
+    async def run():
+        leading = asyncio.create_task(discord_orac_bot.ask_orac(leader, question="Why?"))
+        await asyncio.sleep(0.1)
+        following = [asyncio.create_task(discord_orac_bot.ask_orac(ctx, question="Why?")) for ctx in followers]
+        await asyncio.sleep(0.1)
+        leading.cancel()
+        await asyncio.gather(*following)
+        return leading
+
+    leading = asyncio.run(run())
+    assert leading.cancelled() and leader.sent == []
+    # One follower takes the lead again and the other follows it
+    assert len(fake_api.requests) == 2
+    assert followers[0].sent == followers[1].sent and followers[0].sent[0].startswith("Surely")
+    assert discord_orac_bot.in_flight_questions.coalesced == 3
+
+
+def test_failed_history_write_releases_the_question(fake_api, monkeypatch):
+    """A question whose answer could not be recorded does not hold up the next identical one"""
+    monkeypatch.setattr(discord_orac_bot, "in_flight_questions",
+                        Coalescer(lambda: asyncio.get_running_loop().create_future()))
+    store = discord_orac_bot.conversations
+    record = store.add_exchange
+    failures = [OSError("history backend unavailable")]
+
+    def add_exchange(*args):
+        if failures:
+            raise failures.pop()
+        record(*args)
+
+    monkeypatch.setattr(store, "add_exchange", add_exchange)
+    first, second = FakeContext(channel_id=7, author_id=1), FakeContext(channel_id=7, author_id=2)
+
+    async def run():
+        await discord_orac_bot.ask_orac(first, question="What can you do?")
+        await asyncio.wait_for(discord_orac_bot.ask_orac(second, question="What can you do?"), timeout=5)
+
+    asyncio.run(run())
+    assert first.sent[0].startswith("Error: Processing failure") and "history backend" in first.sent[0]
+    assert second.sent[0].startswith("Surely")
+    assert len(fake_api.requests) == 2 and store.turn_count(7) == 2
+
+
+def test_one_user_cannot_flood(fake_api, monkeypatch):
+    """A user's burst is answered; the excess is throttled without calling Claude"""
+    monkeypatch.setattr(discord_orac_bot, "throttle", RequestThrottle(RateLimiter(6, 3), RateLimiter(0, 1)))
+    fake_api.latency = 0
+    contexts = [FakeContext(channel_id=n, author_id=1) for n in range(10)]
+
+    async def flood():
+        for n, ctx in enumerate(contexts):
+            await discord_orac_bot.ask_orac(ctx, question=f"Question {n}")
+
+    asyncio.run(flood())
+
+    assert len(fake_api.requests) == 3
+    assert contexts[-1].sent[0].startswith("Query rate exceeds")
+
+
+def test_history_records_exchange(fake_api):
+    """Each answered question adds a user and an assistant turn"""
+    ctx = FakeContext(channel_id=7)
+
+    async def conversation():
+        await discord_orac_bot.ask_orac(ctx, question="Hello")
+        await discord_orac_bot.ask_orac(ctx, question="Again")
+
+    asyncio.run(conversation())
+
+    history = discord_orac_bot.conversations.messages(7)
+    assert [turn["role"] for turn in history] == ["user", "assistant"] * 2
+    assert fake_api.requests[1]["messages"][0]["content"] == "Hello"
+
+
+def test_streaming_edits_placeholder(fake_api, monkeypatch):
+    """With streaming on, a placeholder is posted and edited up to the full reply"""
+    monkeypatch.setattr(discord_orac_bot, "streaming", True)
+    monkeypatch.setattr(discord_orac_bot, "StreamingReply", lambda: StreamingReply(interval=0, max_deltas=1))
+    monkeypatch.setattr(discord_orac_bot, "outbox", ChannelSender(messages_per_minute=0))
+    fake_api.latency = 0
+    fake_api.token_delay = 0.005  # Previews arriving faster than the channel takes them collapse
+    ctx = FakeContext(channel_id=9)
+
+    asyncio.run(discord_orac_bot.ask_orac(ctx, question="Explain recursion"))
+
+    placeholder = ctx.messages[0]
+    assert ctx.sent == [PLACEHOLDER]
+    assert len(placeholder.edits) > 5
+    assert placeholder.content == discord_orac_bot.conversations.messages(9)[-1]["content"]
+
+
+class BrokenStream:
+    """Messages API stream that sends text, then fails"""
+
+    def __init__(self, text, error):
+        self.text = text
+        self.error = error
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    @property
+    async def text_stream(self):
+        for word in self.text.split(" "):
+            yield word + " "
+            await asyncio.sleep(0)
+        raise self.error
+
+
+def _break_streams(monkeypatch, text):
+    client = SimpleNamespace(messages=SimpleNamespace(
+        stream=lambda **params: BrokenStream(text, ConnectionError("stream reset"))))
+    monkeypatch.setattr(discord_orac_bot, "api_client", lambda: client)
+    monkeypatch.setattr(discord_orac_bot, "streaming", True)
+    monkeypatch.setattr(discord_orac_bot, "StreamingReply", lambda: StreamingReply(interval=0, max_deltas=1))
+
+
+def test_failed_stream_replaces_the_placeholder_preview(fake_api, monkeypatch):
+    """A stream that fails mid-preview leaves the error in the placeholder, not a stale preview"""
+    _break_streams(monkeypatch, "Surely it is obvious that your question")
+    ctx = FakeContext(channel_id=9)
+
+    asyncio.run(discord_orac_bot.ask_orac(ctx, question="Explain recursion"))
+
+    placeholder = ctx.messages[0]
+    assert ctx.sent == [PLACEHOLDER]
+    assert placeholder.content.startswith("Error: Processing failure") and "stream reset" in placeholder.content
+    assert discord_orac_bot.conversations.turn_count(9) == 0
+
+
+def test_failed_stream_reports_after_the_messages_already_queued(fake_api, monkeypatch):
+    """Once the reply's first message has replaced the placeholder, the error is queued behind the rest"""
+    _break_streams(monkeypatch, "Organic reasoning is slow. " * 250)  # Three full messages, then the failure
+    monkeypatch.setattr(discord_orac_bot, "outbox", ChannelSender(messages_per_minute=600, burst=1))
+    ctx = FakeContext(channel_id=9)
+    after = FakeContext(channel_id=9)
+    after.sent, after.messages = ctx.sent, ctx.messages  # One channel
+
+    async def run():
+        ask = asyncio.create_task(discord_orac_bot.ask_orac(ctx, question="Explain recursion"))
+        await asyncio.sleep(0)
+        await discord_orac_bot.send_reply(after, "Next reply")
+        await ask
+
+    asyncio.run(run())
+
+    assert ctx.sent[0] == PLACEHOLDER and ctx.messages[0].content.startswith("Organic reasoning is slow.")
+    assert len(ctx.sent) == 5 and all("reasoning is slow" in chunk for chunk in ctx.sent[1:3])
+    assert ctx.sent[3].startswith("Error: Processing failure") and ctx.sent[4] == "Next reply"
+
+
+def test_long_streamed_reply_starts_sending_early(fake_api, monkeypatch):
+    """A reply longer than a message goes out in chunks, the first before the stream ends"""
+    paragraph = "Surely it is obvious. " + "Organic reasoning is slow. " * 20
+    code = "```python\n" + "".join(f"value_{n} = {n}\n" for n in range(120)) + "```"
+    reply = "\n\n".join([paragraph] * 6 + [code, paragraph])
+    monkeypatch.setattr(discord_orac_bot, "streaming", True)
+    fake_api.reply = reply
+    fake_api.latency = 0
+    fake_api.token_delay = 0.002
+    ctx = FakeContext(channel_id=9)
+
+    async def run():
+        ask = asyncio.create_task(discord_orac_bot.ask_orac(ctx, question="Explain recursion"))
+        while len(ctx.sent) < 2 and not ask.done():
+            await asyncio.sleep(0.01)
+        assert not ask.done(), "The second message waited for the whole reply"
+        await ask
+
+    asyncio.run(run())
+
+    placeholder = ctx.messages[0]
+    chunks = [placeholder.content] + ctx.sent[1:]
+    assert ctx.sent[0] == PLACEHOLDER
+    assert len(chunks) >= 3
+    assert all(len(chunk) <= discord_orac_bot.DISCORD_LIMIT for chunk in chunks)
+    assert all(chunk.count("```") % 2 == 0 for chunk in chunks)
+    assert chunks[0].startswith("Surely") and chunks[-1].endswith("Organic reasoning is slow.")
+
+
+def test_concurrent_streamed_replies_keep_their_order_and_pace(fake_api, monkeypatch):
+    """A second streamed ask in the channel posts its placeholder only after the first reply has gone out"""
+    reply = "\n\n".join(["Surely it is obvious. " + "Organic reasoning is slow. " * 20] * 6)
+    monkeypatch.setattr(discord_orac_bot, "streaming", True)
+    monkeypatch.setattr(discord_orac_bot, "StreamingReply", lambda: StreamingReply(interval=0, max_deltas=1))
+    now = [0.0]
+
+    async def sleep(seconds):
+        now[0] += seconds
+        await asyncio.sleep(0)
+
+    outbox = ChannelSender(messages_per_minute=60, burst=1, clock=lambda: now[0], sleep=sleep)
+    monkeypatch.setattr(discord_orac_bot, "outbox", outbox)
+    fake_api.reply = reply
+    fake_api.latency = 0
+    fake_api.token_delay = 0.001
+    first, second = FakeContext(channel_id=9, author_id=1), FakeContext(channel_id=9, author_id=2)
+    second.sent, second.messages = first.sent, first.messages  # One channel
+
+    async def run():
+        ask = asyncio.create_task(discord_orac_bot.ask_orac(first, question="Explain recursion"))
+        await asyncio.sleep(0.05)
+        await discord_orac_bot.ask_orac(second, question="Explain iteration")
+        await ask
+
+    asyncio.run(run())
+
+    chunks = split_message(reply, discord_orac_bot.DISCORD_LIMIT)
+    assert first.sent == [PLACEHOLDER] + chunks[1:] + [PLACEHOLDER] + chunks[1:]
+    assert [first.messages[0].content, first.messages[len(chunks)].content] == [chunks[0], chunks[0]]
+    # Every send and edit, placeholders and previews included, waited for the channel's bucket
+    actions = len(first.sent) + sum(len(message.edits) for message in first.messages)
+    assert outbox.paced == actions - 1
+
+
+def test_speculation_sends_the_valid_candidate(fake_api, monkeypatch):
+    """With best-of-3 on, the reply that passes validation is the one sent, and status reports it"""
+    replies = iter(["Happy to help! Sorry about that."] * 2 + ["Surely it is obvious. 4.7 seconds."])
+    fake_api.reply = lambda payload: next(replies)
+    fake_api.latency = 0
+    monkeypatch.setattr(discord_orac_bot, "speculation", Speculation(candidates=3))
+    ctx = FakeContext(channel_id=9)
+
+    async def run():
+        await discord_orac_bot.ask_orac(ctx, question="What's 2+2?")
+        await discord_orac_bot.status(ctx)
+
+    asyncio.run(run())
+
+    assert len(fake_api.requests) == 3
+    assert ctx.sent[0] == "Surely it is obvious. 4.7 seconds."
+    assert "Speculation: 3 candidates per query, 1 queries, 0 fell back" in ctx.sent[1]
+
+
+def test_create_bot_registers_commands():
+    """Commands are plain coroutines until create_bot() registers them with discord.py"""
+    bot = discord_orac_bot.create_bot()
+    assert {command.name for command in bot.commands} == {"ask", "clear", "status", "help"}
+    assert bot.get_command("ask").callback is discord_orac_bot.ask_orac
+    assert bot.on_command_error is discord_orac_bot.on_command_error
+
+
+def test_sharding_from_env(monkeypatch):
+    for name in ("ORAC_SHARD_COUNT", "ORAC_SHARD_IDS", "ORAC_SHARD_PROCESSES"):
+        monkeypatch.delenv(name, raising=False)
+    assert discord_orac_bot.sharding_from_env() == (None, 1)
+
+    monkeypatch.setenv("ORAC_SHARD_COUNT", "auto")
+    assert discord_orac_bot.sharding_from_env() == ({"shard_count": None, "shard_ids": None}, 1)
+
+    monkeypatch.setenv("ORAC_SHARD_COUNT", "8")
+    monkeypatch.setenv("ORAC_SHARD_IDS", "4-6,7")
+    monkeypatch.setenv("ORAC_SHARD_PROCESSES", "2")
+    assert discord_orac_bot.sharding_from_env() == ({"shard_count": 8, "shard_ids": [4, 5, 6, 7]}, 2)
+
+    for count, ids in (("8", "6-8"), ("auto", "0-1")):
+        monkeypatch.setenv("ORAC_SHARD_COUNT", count)
+        monkeypatch.setenv("ORAC_SHARD_IDS", ids)
+        with pytest.raises(ValueError):
+            discord_orac_bot.sharding_from_env()
+
+
+def test_partition_shards():
+    assert discord_orac_bot.partition_shards(list(range(8)), 3) == [[0, 3, 6], [1, 4, 7], [2, 5]]
+    assert discord_orac_bot.partition_shards([4, 5], 4) == [[4], [5]]
+
+
+def test_create_bot_shards():
+    from discord.ext import commands
+
+    bot = discord_orac_bot.create_bot({"shard_count": 8, "shard_ids": [2, 5]})
+    assert isinstance(bot, commands.AutoShardedBot)
+    assert (bot.shard_count, bot.shard_ids) == (8, [2, 5])
+    assert bot.get_command("ask").callback is discord_orac_bot.ask_orac
+    assert not isinstance(discord_orac_bot.create_bot(), commands.AutoShardedBot)
+
+
+def test_status_reports_shard(fake_api):
+    ctx = FakeContext(5)
+    ctx.guild.shard_id = 3
+    ctx.bot = SimpleNamespace(shard_count=8)
+    asyncio.run(discord_orac_bot.status(ctx))
+    assert "Shard: 3 of 8" in ctx.sent[0]
+
+    ctx = FakeContext(5)
+    asyncio.run(discord_orac_bot.status(ctx))
+    assert "Shard" not in ctx.sent[0]
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_audio.py
+@brief Audio buffer tests: PCMRing wrap-around, back-pressure and closing,
+       CaptureBuffer reuse, and the memory one spoken exchange allocates
+       with pooled buffers against fresh bytes at every step.
+@usage pytest test_orac_audio.py
+       python test_orac_audio.py    # Allocations per utterance benchmark
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import threading
+import time
+import tracemalloc
+
+from orac_audio import SAMPLE_RATE, CaptureBuffer, PCMRing, pcm_bytes
+from orac_voice import OfflineEngine, SimulatedPlayer, VoicePipeline, to_speech_markup
+
+REPLY = "Surely it is obvious... even to the meanest intelligence. The answer is 4.7 seconds. Is that clear?"
+
+
+def _drain(ring, block=4096):
+    out = bytearray()
+    while (view := ring.peek(block, timeout=1)) is not None:
+        out += view
+        ring.consume(len(view))
+    return bytes(out)
+
+
+def test_ring_wraps_and_hands_out_views():
+    ring = PCMRing(seconds=8 / SAMPLE_RATE)  # 8 frames, 16 bytes
+    assert ring.capacity == 16
+    ring.write(bytes(range(12)))
+    view = ring.peek(8)
+    assert view.readonly and bytes(view) == bytes(range(8))
+    ring.consume(8)
+
+    ring.write(bytes(range(12, 24)))  # Wraps past the end of the buffer
+    assert len(ring) == 16
+    assert bytes(ring.peek(64)) == bytes(range(8, 16))  # Stops at the end of the buffer
+    ring.close()
+    assert _drain(ring) == bytes(range(8, 24))
+    assert ring.peek() is None
+
+
+def test_ring_blocks_the_writer_until_the_reader_catches_up():
+    ring = PCMRing(seconds=0.01)
+    pcm = bytes(range(256)) * 100
+    writer = threading.Thread(target=lambda: (ring.write(pcm), ring.close()))
+    writer.start()
+    time.sleep(0.05)
+    assert len(ring) == ring.capacity < len(pcm) and writer.is_alive()
+    assert _drain(ring, block=100) == pcm
+    writer.join()
+
+
+def test_ring_keeps_frames_whole():
+    ring = PCMRing(seconds=0.01)
+    ring.write(b"\x01\x02\x03")
+    assert len(ring.peek()) == 2
+    ring.consume(2)
+    assert ring.peek(timeout=0.01) is None  # Half a frame waits for the rest
+    ring.write(b"\x04")
+    assert bytes(ring.peek()) == b"\x03\x04"
+
+
+def test_closed_ring_refuses_writes_and_can_be_reopened():
+    ring = PCMRing(seconds=0.01)
+    ring.write(b"\x00\x01")
+    ring.clear()
+    ring.close()
+    assert ring.peek() is None and not ring.write(b"\x00\x01")
+    ring.reopen()
+    assert ring.write(b"\x00\x01") and len(ring) == 2
+
+
+def test_capture_buffer_is_reused_and_never_grows():
+    capture = CaptureBuffer(seconds=0.5, rate=16000)
+    frame = bytes(range(200)) * 4  # 25 ms at 16 kHz
+    for _ in range(10):
+        capture.append(frame)
+    assert capture.seconds == 0.25
+    payload = capture.view()
+    assert payload.readonly and bytes(payload[:800]) == frame
+
+    for _ in range(30):
+        capture.append(frame)
+    assert len(capture) == pcm_bytes(0.5, 16000) and capture.dropped == 20 * len(frame)
+
+    capture.keep_last(1000)
+    assert len(capture) == 1000 and bytes(capture.view()) == (frame * 20)[-1000:]
+
+    capture.reset()
+    view = capture.writable(len(frame))
+    view[:] = frame  # As a source's readinto() would
+    capture.advance(len(frame))
+    assert bytes(capture.view()) == frame and capture.dropped == 0
+
+
+# One spoken exchange: a 3 s question captured in 20 ms frames and sent for
+# recognition, then the reply synthesised and played
+FRAME = bytes(pcm_bytes(0.02, 16000))
+QUESTION_FRAMES = 150
+
+
+def _copying_exchange(engine, player):
+    """Fresh bytes at each step, as the loop in VOICE_IMPLEMENTATION.md does"""
+    frames = [bytes(FRAME) for _ in range(QUESTION_FRAMES)]  # Each microphone read
+    payload = b"".join(frames)  # The recogniser's AudioData
+    _ = bytes(payload)  # Sent for recognition
+    pcm = engine.synthesize(to_speech_markup(REPLY))
+    player.play(bytes(pcm))
+
+
+def _pooled_exchange(capture, voice):
+    """Frames copied once into the capture buffer; the reply played from the ring"""
+    capture.reset()
+    for _ in range(QUESTION_FRAMES):
+        capture.append(FRAME)
+    _ = capture.view()  # Sent for recognition
+    voice.speak([REPLY])
+
+
+def allocations_per_utterance(utterances=20):
+    """Peak bytes allocated during each exchange (mean of utterances), copying and pooled"""
+    engine = OfflineEngine()
+    copying = []
+    capture = CaptureBuffer(seconds=30)
+    voice = VoicePipeline(engine, SimulatedPlayer(realtime=0))
+    pooled = []
+    _pooled_exchange(capture, voice)  # Warm up: threads, regex caches
+    tracemalloc.start()
+    try:
+        for results, run in ((copying, lambda: _copying_exchange(engine, voice.player)),
+                             (pooled, lambda: _pooled_exchange(capture, voice))):
+            for _ in range(utterances):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                run()
+                results.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    return sum(copying) / utterances, sum(pooled) / utterances
+
+
+def test_pooled_exchange_allocates_a_fraction_of_the_audio():
+    audio = len(FRAME) * QUESTION_FRAMES + len(OfflineEngine().synthesize(to_speech_markup(REPLY)))
+    copying, pooled = allocations_per_utterance(utterances=3)
+    assert copying > audio
+    assert pooled < audio / 10, (pooled, audio)
+
+
+if __name__ == "__main__":
+    audio = len(FRAME) * QUESTION_FRAMES + len(OfflineEngine().synthesize(to_speech_markup(REPLY)))
+    copying, pooled = allocations_per_utterance()
+    print("Peak memory allocated per spoken exchange (tracemalloc, mean of 20)")
+    print("=" * 60)
+    print(f"Audio moved:       {audio / 1024:>8.1f} KiB (a 3 s question and the spoken reply)")
+    print(f"Fresh bytes:       {copying / 1024:>8.1f} KiB")
+    print(f"Pooled buffers:    {pooled / 1024:>8.1f} KiB")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_benchmark.py
+@brief Benchmark harness tests: a small run of every entry point, error
+       injection, JSON results and regression comparison.
+@usage pytest test_orac_benchmark.py
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import copy
+import json
+
+import pytest
+
+pytest.importorskip("discord")
+pytest.importorskip("slack_bolt")
+pytest.importorskip("anthropic")
+
+import discord_orac_bot  # noqa: E402
+import slack_orac_bot  # noqa: E402
+from fake_claude_api import lognormal_latency, random_faults  # noqa: E402
+from orac_benchmark import SCENARIOS, compare_results, run_benchmark  # noqa: E402
+
+SMALL = dict(requests=12, concurrency=4, latency_median=0.02, latency_p99=0.1)
+
+
+def test_latency_distribution_is_seeded_and_shaped():
+    first, second = lognormal_latency(0.2, 1.0, seed=3), lognormal_latency(0.2, 1.0, seed=3)
+    draws = [first(None) for _ in range(5000)]
+    assert draws == [second(None) for _ in range(5000)]
+    draws.sort()
+    assert draws[2500] == pytest.approx(0.2, rel=0.1)
+    assert draws[4950] == pytest.approx(1.0, rel=0.25)
+
+
+def test_random_faults_rate():
+    fault = random_faults(0.1, (529, 500), seed=3)
+    outcomes = [fault(None) for _ in range(5000)]
+    assert sum(o is not None for o in outcomes) == pytest.approx(500, rel=0.15)
+    assert set(outcomes) == {None, 529, 500}
+
+
+def test_every_entry_point_runs_and_restores_state():
+    client, metrics = slack_orac_bot.anthropic_client, discord_orac_bot.metrics
+    results = run_benchmark(**SMALL)
+
+    assert set(results["scenarios"]) == set(SCENARIOS)
+    for name, result in results["scenarios"].items():
+        assert result["requests"] == 12 and result["errors"] == 0, name
+        assert result["api_calls"] == 12, name
+        assert result["throughput"] > 0
+        assert result["latency"]["p50"] <= result["latency"]["p99"] <= result["latency"]["max"]
+        assert result["ttft_p50"] > 0
+    assert json.loads(json.dumps(results)) == results
+    assert slack_orac_bot.anthropic_client is client
+    assert discord_orac_bot.metrics is metrics
+
+
+def test_injected_errors_are_retried_away():
+    results = run_benchmark(["slack"], **dict(SMALL, error_rate=0.2, streaming=True, token_rate=500))
+    slack = results["scenarios"]["slack"]
+    assert slack["errors"] == 0
+    assert slack["api_errors_injected"] > 0
+    assert slack["api_calls"] == 12
+
+
+def test_compare_flags_regressions():
+    baseline = {
+        "config": {"requests": 12},
+        "scenarios": {"cli": {"throughput": 10.0, "errors": 0, "latency": {"p95": 1.0, "p99": 2.0}}},
+    }
+    slower = copy.deepcopy(baseline)
+    slower["scenarios"]["cli"].update(throughput=7.0, latency={"p95": 1.1, "p99": 3.0})
+
+    assert compare_results(baseline, baseline) == []
+    regressions = compare_results(baseline, slower, tolerance=0.2)
+    assert len(regressions) == 2
+    assert any("throughput" in r for r in regressions) and any("p99" in r for r in regressions)
+    assert compare_results(baseline, dict(slower, config={"requests": 24})) == [
+        "Configurations differ; results are not comparable"]
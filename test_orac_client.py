@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_client.py
+@brief Shared client tests: backoff policy, circuit breaker, connection reuse
+       and a stress run against a rate-limited fake API that answers 429.
+@usage pytest test_orac_client.py
+       python test_orac_client.py    # Throughput under a rate limit, with and without retries
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+anthropic = pytest.importorskip("anthropic")
+
+from fake_claude_api import FakeClaudeAPI  # noqa: E402
+from orac_client import CircuitBreaker, RetryPolicy, create_client  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def ask(client):
+    return client.messages.create(
+        model="claude-fake", max_tokens=64, messages=[{"role": "user", "content": "Can you help me?"}],
+    )
+
+
+def stress(rate_limit, callers, per_caller, policy):
+    """Run callers x per_caller requests through one client; returns (succeeded, failed, seconds, api)"""
+    with FakeClaudeAPI(rate_limit=rate_limit) as api:
+        client = create_client(api_key="test", base_url=api.base_url, policy=policy, circuit=CircuitBreaker())
+
+        def run(_):
+            outcomes = []
+            for _ in range(per_caller):
+                try:
+                    ask(client)
+                    outcomes.append(True)
+                except anthropic.RateLimitError:
+                    outcomes.append(False)
+            return outcomes
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(callers) as pool:
+            outcomes = [ok for batch in pool.map(run, range(callers)) for ok in batch]
+        elapsed = time.perf_counter() - start
+    return outcomes.count(True), outcomes.count(False), elapsed, api
+
+
+def test_backoff_is_jittered_and_honours_retry_after():
+    policy = RetryPolicy(max_retries=3, base_delay=1.0, max_delay=10.0, rng=lambda: 0.5)
+    assert [policy.delay(n) for n in range(3)] == [0.5, 1.0, 2.0]
+    assert policy.delay(0, retry_after=4.0) == 4.0
+    assert policy.delay(0, retry_after=60.0) is None  # Longer than we are prepared to wait
+    assert policy.delay(3) is None
+
+
+def test_breaker_opens_probes_and_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(threshold=3, cooldown=10, clock=clock)
+    for _ in range(3):
+        assert breaker.allow() is True
+        breaker.record(overloaded=True)
+    assert breaker.state == "open"
+    assert breaker.allow() == 10
+
+    clock.now = 10
+    assert breaker.allow() is True  # The probe
+    assert breaker.allow() is not True  # Only one probe at a time
+    breaker.record(overloaded=False)
+    assert breaker.state == "closed"
+    assert (breaker.opened, breaker.rejected) == (1, 2)
+
+
+def test_sustained_overload_fails_fast():
+    with FakeClaudeAPI(fault=lambda payload: 529) as api:
+        client = create_client(api_key="test", base_url=api.base_url,
+                               policy=RetryPolicy(max_retries=10, base_delay=0.01),
+                               circuit=CircuitBreaker(threshold=3, cooldown=60))
+        with pytest.raises(anthropic.APIStatusError) as first:
+            ask(client)
+        with pytest.raises(anthropic.APIStatusError):
+            ask(client)
+
+    assert first.value.status_code == 529
+    assert api.rejected == 3  # The second call never reached the API
+
+
+def test_connections_are_kept_alive():
+    with FakeClaudeAPI() as api:
+        client = create_client(api_key="test", base_url=api.base_url, circuit=CircuitBreaker())
+        for _ in range(20):
+            ask(client)
+    assert api.connections == 1
+
+
+def test_rate_limited_burst_completes_at_the_limit():
+    """A burst well above the rate limit backs off and still completes at the limit"""
+    policy = RetryPolicy(max_retries=20, base_delay=0.05, max_delay=2.0)
+    succeeded, failed, elapsed, api = stress(rate_limit=40, callers=8, per_caller=10, policy=policy)
+
+    assert (succeeded, failed) == (80, 0)
+    assert api.rejected > 0
+    # 40 requests are allowed at once, then 40 per second
+    assert 0.9 <= elapsed < 3.0, f"{elapsed:.2f}s"
+
+
+if __name__ == "__main__":
+    print("\nORAC client under a 40 requests/second rate limit (8 callers x 25 requests)")
+    print("=" * 70)
+    for label, policy in (("No retries", RetryPolicy(max_retries=0)),
+                          ("Backoff", RetryPolicy(max_retries=20, base_delay=0.05, max_delay=2.0))):
+        succeeded, failed, elapsed, api = stress(40, 8, 25, policy)
+        print(f"{label:<12} {succeeded:>4} succeeded, {failed:>4} failed, {api.rejected:>4} 429s, "
+              f"{succeeded / elapsed:6.1f} completed/s")
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_conversation.py
+@brief ConversationStore tests: LRU eviction, token-budget trimming,
+       background summaries and counters.
+@usage pytest test_orac_conversation.py
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import threading
+import time
+
+from orac_conversation import SUMMARY_REQUEST, ConversationStore, Turn, estimate_tokens
+
+
+def request_tokens(messages):
+    return sum(estimate_tokens(m["content"]) for m in messages)
+
+
+def keep_last_facts(previous, messages):
+    """Stand-in summarizer: remembers the last ten questions, so its size is bounded"""
+    facts = (previous or "").split(" | ") if previous else []
+    facts += [m["content"].split(" ", 2)[1] for m in messages if m["role"] == "user"]
+    return " | ".join(facts[-10:])
+
+
+def test_exchange_round_trip():
+    """Exchanges come back in order, in Messages API form"""
+    store = ConversationStore()
+    store.add_exchange("C1", "Can you help me?", "Very well.")
+
+    assert store.messages("C1") == [
+        {"role": "user", "content": "Can you help me?"},
+        {"role": "assistant", "content": "Very well."},
+    ]
+    assert store.messages("unknown") == []
+    assert store.turn_count("C1") == 2
+
+
+def test_lru_eviction():
+    """The least recently used conversation goes first"""
+    store = ConversationStore(max_conversations=2)
+    store.add_exchange("A", "q", "a")
+    store.add_exchange("B", "q", "a")
+    store.messages("A")  # A is now more recent than B
+    store.add_exchange("C", "q", "a")
+
+    assert "A" in store and "C" in store
+    assert "B" not in store
+    assert store.stats()["evictions"] == 1
+
+
+def test_idle_eviction():
+    """Conversations idle longer than max_idle are evicted"""
+    store = ConversationStore(max_idle=0.05)
+    store.add_exchange("A", "q", "a")
+    time.sleep(0.1)
+    store.add_exchange("B", "q", "a")
+
+    assert "A" not in store
+    assert store.stats()["evictions"] == 1
+
+
+def test_token_budget_trims_oldest_exchange():
+    """History never exceeds the budget and still starts with a user turn"""
+    store = ConversationStore(max_tokens=200)
+    for n in range(50):
+        store.add_exchange("T", f"Question {n} " + "x" * 100, f"Answer {n} " + "y" * 100)
+
+    history = store.messages("T")
+    assert sum(estimate_tokens(m["content"]) for m in history) <= 200
+    assert history[0]["role"] == "user"
+    assert history[-1]["content"].startswith("Answer 49")
+    assert store.stats()["trimmed_turns"] == 100 - len(history)
+
+
+def test_counters_track_clear():
+    """Turn and byte counters fall back to zero when histories are cleared"""
+    store = ConversationStore()
+    store.add_exchange("A", "q" * 100, "a" * 100)
+    assert store.stats()["bytes"] > 200
+
+    assert store.clear("A")
+    assert not store.clear("A")
+    assert store.stats()["turns"] == 0
+    assert store.stats()["bytes"] == 0
+    assert "Conversations retained: 0" in store.describe()
+
+
+def test_turn_has_no_dict():
+    """Turns use __slots__ to stay compact"""
+    assert not hasattr(Turn("user", "hi", 1), "__dict__")
+
+
+def test_summaries_keep_500_turn_requests_flat():
+    """Request size stops growing once summaries start, and nothing is trimmed away unsummarised"""
+    store = ConversationStore(max_tokens=4000, summarizer=keep_last_facts, summarize_at=1000, keep_tokens=500)
+    sizes = []
+    for n in range(250):
+        store.add_exchange("T", f"Question {n} " + "x" * 120, f"Answer {n} " + "y" * 240)
+        store.wait_for_summaries()
+        sizes.append(request_tokens(store.messages("T")))
+
+    exchange = estimate_tokens("Question 0 " + "x" * 120) + estimate_tokens("Answer 0 " + "y" * 240)
+    assert max(sizes) <= 1000 + exchange
+    # A sawtooth between keep_tokens and summarize_at, no higher at turn 500 than at turn 100
+    assert sum(sizes[200:]) / 50 <= sum(sizes[25:75]) / 50 * 1.1
+    # The summary leads, covering the questions just before the verbatim turns
+    first_kept = 250 - store.turn_count("T") // 2
+    history = store.messages("T")
+    assert history[:2] == [
+        {"role": "user", "content": SUMMARY_REQUEST},
+        {"role": "assistant", "content": " | ".join(str(n) for n in range(first_kept - 10, first_kept))},
+    ]
+    assert history[-1]["content"].startswith("Answer 249")
+    stats = store.stats()
+    assert stats["trimmed_turns"] == 0
+    assert stats["summarized_turns"] + store.turn_count("T") == 500
+    assert "Turns summarised" in store.describe()
+
+
+def test_summaries_do_not_block_requests():
+    """Turns stay in place, still bounded by max_tokens, while a summary is being written"""
+    release = threading.Event()
+
+    def slow_summary(previous, messages):
+        release.wait(5)
+        return "Earlier: trivia."
+
+    store = ConversationStore(max_tokens=2000, summarizer=slow_summary, summarize_at=500, keep_tokens=200)
+    start = time.perf_counter()
+    for n in range(100):
+        store.add_exchange("T", f"Question {n} " + "x" * 120, f"Answer {n} " + "y" * 240)
+    assert time.perf_counter() - start < 1.0
+    assert request_tokens(store.messages("T")) <= 2000
+    assert store.stats()["summaries"] == 0
+
+    release.set()
+    store.wait_for_summaries()
+    assert store.messages("T")[1]["content"] == "Earlier: trivia."
+    assert store.stats()["summaries"] >= 1
+
+
+def test_failed_summary_falls_back_to_trim(capsys):
+    def broken(previous, messages):
+        raise RuntimeError("overloaded")
+
+    store = ConversationStore(max_tokens=600, summarizer=broken, summarize_at=300)
+    for n in range(20):
+        store.add_exchange("T", f"Question {n} " + "x" * 120, f"Answer {n} " + "y" * 240)
+        store.wait_for_summaries()
+
+    assert store.messages("T")[0]["content"].startswith("Question")
+    assert request_tokens(store.messages("T")) <= 600
+    assert store.stats()["trimmed_turns"] > 0
+    assert "overloaded" in capsys.readouterr().out
+
+
+def test_cleared_conversation_drops_pending_summary():
+    release = threading.Event()
+
+    def slow_summary(previous, messages):
+        release.wait(5)
+        return "Stale."
+
+    store = ConversationStore(summarizer=slow_summary, summarize_at=100, keep_tokens=50)
+    for n in range(5):
+        store.add_exchange("T", f"Question {n} " + "x" * 120, f"Answer {n}")
+    store.clear("T")
+    store.add_exchange("T", "Fresh start", "Very well.")
+    release.set()
+    store.wait_for_summaries()
+
+    assert store.messages("T") == [
+        {"role": "user", "content": "Fresh start"},
+        {"role": "assistant", "content": "Very well."},
+    ]
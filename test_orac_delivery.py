@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_delivery.py
+@brief Reply delivery tests: message splitting at paragraph and code-fence
+       boundaries, incremental splitting of a stream, and the ordered, paced
+       per-channel send queue.
+@usage pytest test_orac_delivery.py
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import asyncio
+import re
+
+import pytest
+
+from orac_delivery import ChannelSender, ChunkSplitter, split_message
+
+PARAGRAPH = "Surely it is obvious even to the meanest intelligence. " * 6
+CODE = "```python\n" + "".join(f"result_{n} = compute({n})\n" for n in range(60)) + "```"
+
+
+def _balanced(chunk):
+    return chunk.count("```") % 2 == 0
+
+
+def test_short_text_is_one_message():
+    assert split_message("Your question lacks precision.", 2000) == ["Your question lacks precision."]
+    assert split_message("", 2000) == []
+
+
+def test_splits_at_paragraphs():
+    text = "\n\n".join([PARAGRAPH.strip()] * 8)
+    chunks = split_message(text, 1000)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+    assert all(chunk == PARAGRAPH.strip() or chunk.endswith(PARAGRAPH.strip()) for chunk in chunks)
+    assert "\n\n".join(chunks) == text
+
+
+def test_code_blocks_are_closed_and_reopened():
+    text = f"{PARAGRAPH}\n\n{CODE}\n\n{PARAGRAPH}"
+    chunks = split_message(text, 500)
+    assert all(len(chunk) <= 500 for chunk in chunks)
+    assert all(_balanced(chunk) for chunk in chunks)
+    inside = [chunk for chunk in chunks if "result_" in chunk]
+    assert len(inside) > 1
+    assert all(chunk.count("```python") == 1 for chunk in inside)
+    # Every line of code survives, whole and in order
+    lines = [line for chunk in chunks for line in chunk.split("\n") if line.startswith("result_")]
+    assert lines == [f"result_{n} = compute({n})" for n in range(60)]
+
+
+def test_overlong_words_are_cut_at_the_limit():
+    chunks = split_message("x" * 2500, 1000)
+    assert [len(chunk) for chunk in chunks] == [996, 996, 508]
+    assert "".join(chunks) == "x" * 2500
+
+
+def test_streamed_text_splits_as_it_arrives():
+    text = f"{PARAGRAPH}\n\n{CODE}\n\n" + PARAGRAPH * 4
+    splitter = ChunkSplitter(500)
+    streamed, first_complete_at = [], None
+    deltas = re.findall(r"\S+\s*", text)
+    for n, delta in enumerate(deltas):
+        streamed += splitter.feed(delta)
+        if streamed and first_complete_at is None:
+            first_complete_at = n
+    streamed += splitter.finish()
+    assert streamed == split_message(text, 500)
+    assert first_complete_at < len(deltas) // 4
+
+
+class _Recorder:
+    """Stand-in clock, sleep and channel that record what was sent and when"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sent = []
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+        await asyncio.sleep(0)
+
+    def send(self, text):
+        async def action():
+            await asyncio.sleep(0)
+            self.sent.append((self.now, text))
+        return action
+
+
+def test_replies_in_a_channel_stay_contiguous():
+    recorder = _Recorder()
+    sender = ChannelSender(messages_per_minute=0, clock=recorder.clock, sleep=recorder.sleep)
+
+    async def run():
+        first, second = sender.reply(1), sender.reply(1)
+        second.put(recorder.send("b1"))
+        first.put(recorder.send("a1"))
+        second.close()
+        await asyncio.sleep(0.01)
+        first.put(recorder.send("a2"))
+        first.close()
+        first.close()  # Closing twice is harmless
+        await asyncio.gather(first.wait(), second.wait())
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert [text for _, text in recorder.sent] == ["a1", "a2", "b1"]
+    assert (first.sent, second.sent) == (2, 1) and first.closed
+    assert sender._last == {}
+
+
+def test_sends_are_paced_per_channel():
+    recorder = _Recorder()
+    sender = ChannelSender(messages_per_minute=60, burst=5, clock=recorder.clock, sleep=recorder.sleep)
+
+    async def run():
+        replies = [sender.reply(channel) for channel in (1, 2)]
+        for n in range(8):
+            replies[0].put(recorder.send(f"one {n}"))
+        replies[1].put(recorder.send("two 0"))
+        for reply in replies:
+            reply.close()
+        await asyncio.gather(*(reply.wait() for reply in replies))
+
+    asyncio.run(run())
+    times = [when for when, text in recorder.sent if text.startswith("one")]
+    assert times[:5] == [0.0] * 5
+    assert times[5:] == pytest.approx([1.0, 2.0, 3.0])
+    assert sender.paced == 3
+
+
+def test_failed_send_stops_the_reply_but_not_the_next():
+    recorder = _Recorder()
+    sender = ChannelSender(messages_per_minute=0, clock=recorder.clock, sleep=recorder.sleep)
+
+    async def fail():
+        raise RuntimeError("Missing Permissions")
+
+    async def run():
+        broken, after = sender.reply(1), sender.reply(1)
+        broken.put(recorder.send("a1"))
+        broken.put(fail)
+        broken.put(recorder.send("a3"))
+        broken.close()
+        after.put(recorder.send("b1"))
+        after.close()
+        with pytest.raises(RuntimeError, match="Missing Permissions"):
+            await broken.wait()
+        await after.wait()
+
+    asyncio.run(run())
+    assert [text for _, text in recorder.sent] == ["a1", "b1"]
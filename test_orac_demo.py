@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_demo.py
+@brief Batch persona evaluation tests against the fake Message Batches API.
+@usage pytest test_orac_demo.py
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import time
+
+import pytest
+
+anthropic = pytest.importorskip("anthropic")
+
+from fake_claude_api import FakeClaudeAPI
+from orac_demo import (
+    DEMO_MESSAGES, EVALUATION_INTENSITIES, MODEL, evaluation_requests, get_orac_prompt, run_batch_evaluation,
+)
+
+
+def test_every_case_in_one_batch():
+    cases = evaluation_requests()
+    assert len(cases) == len(EVALUATION_INTENSITIES) * len(DEMO_MESSAGES)
+    prompts = {request["params"]["system"] for _, _, request in cases.values()}
+    assert prompts == {get_orac_prompt(i) for i in EVALUATION_INTENSITIES}
+
+
+def test_batch_results_are_validated():
+    replies = {get_orac_prompt(0.5): "Happy to help! About 5 seconds."}
+
+    with FakeClaudeAPI(batch_delay=0.1, reply=lambda p: replies.get(p["system"], "Very well. Trivial.")) as api:
+        client = anthropic.Anthropic(api_key="test", base_url=api.base_url)
+        results = run_batch_evaluation(client, poll_interval=0.05)
+
+    assert len(api.batches) == 1
+    assert [r["custom_id"] for r in results] == list(evaluation_requests())
+    assert all(r["model"] == MODEL for r in api.requests)
+    mild = [r for r in results if r["intensity"] == 0.5]
+    assert not any(r["valid"] for r in mild)
+    assert "Too polite (not characteristic of ORAC)" in mild[0]["violations"]
+    assert all(r["valid"] for r in results if r["intensity"] > 0.5)
+
+
+def test_batch_beats_sequential_wall_time():
+    """One batch finishes before the same cases called one by one"""
+    with FakeClaudeAPI(latency=0.05, batch_delay=0.1) as api:
+        client = anthropic.Anthropic(api_key="test", base_url=api.base_url)
+
+        start = time.perf_counter()
+        for _, _, request in evaluation_requests().values():
+            client.messages.create(**request["params"])
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        run_batch_evaluation(client, poll_interval=0.05)
+        batched = time.perf_counter() - start
+
+    assert batched < sequential / 2, f"{batched:.2f}s vs {sequential:.2f}s"
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_metrics.py
+@brief Instrumentation tests: histogram accuracy and cost, per-channel series,
+       and the Prometheus/JSON endpoint.
+@usage pytest test_orac_metrics.py
+       python test_orac_metrics.py    # Recording cost and percentile error
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import json
+import math
+import random
+import time
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+
+from orac_metrics import Histogram, Metrics, serve_metrics
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def exact_percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(q * len(ordered))) - 1]
+
+
+def latency_sample(n, seed=7):
+    rng = random.Random(seed)
+    return [rng.lognormvariate(0.5, 0.8) for _ in range(n)]
+
+
+def test_percentiles_within_two_percent():
+    values = latency_sample(20_000) + [0.0] * 50
+    histogram = Histogram()
+    for value in values:
+        histogram.record(value)
+
+    for q in (0.01, 0.5, 0.95, 0.99, 0.999):
+        exact = exact_percentile(values, q)
+        assert histogram.percentile(q) == pytest.approx(exact, rel=0.02, abs=1e-9), q
+    assert histogram.percentile(1.0) == max(values)
+    assert histogram.count == len(values)
+    assert len(histogram.counts) < 400  # Sparse buckets, not one per value
+
+
+def test_merge_matches_single_histogram():
+    values = latency_sample(2_000)
+    whole, left, right = Histogram(), Histogram(), Histogram()
+    for n, value in enumerate(values):
+        whole.record(value)
+        (left if n % 2 else right).record(value)
+    left.merge(right)
+    assert left.counts == whole.counts
+    assert left.percentile(0.95) == whole.percentile(0.95)
+
+
+def test_timer_records_queue_wait_ttft_and_tokens():
+    clock = FakeClock()
+    metrics = Metrics(clock=clock)
+    timer = metrics.timer("discord", 42)
+    clock.now = 0.25
+    timer.started()
+    clock.now = 0.75
+    timer.first_token()
+    clock.now = 2.25
+    timer.first_token()  # Only the first counts
+    timer.finish(SimpleNamespace(input_tokens=1200, output_tokens=300, cache_read_input_tokens=1000,
+                                 cache_creation_input_tokens=None), history_messages=6)
+
+    def p50(metric, **scope):
+        return metrics.histogram(metric, "discord", **scope).percentile(0.5)
+
+    assert p50("queue_wait_seconds", channel=42) == pytest.approx(0.25, rel=0.02)
+    assert p50("ttft_seconds", channel=42) == pytest.approx(0.5, rel=0.02)
+    assert p50("latency_seconds") == pytest.approx(2.0, rel=0.02)
+    assert p50("input_tokens") == 1200
+    assert p50("cache_read_tokens") == 1000
+    assert p50("cache_creation_tokens") == 0
+    assert p50("history_messages") == 6
+    assert metrics.calls == {"discord": 1}
+
+
+def test_describe_prefers_the_channel():
+    clock = FakeClock()
+    metrics = Metrics(clock=clock)
+    assert "no queries" in metrics.describe("slack", "C01")
+
+    for channel, seconds in (("C01", 1.0), ("C02", 3.0), ("C02", 3.0)):
+        timer = metrics.timer("slack", channel)
+        timer.started()
+        clock.now += seconds
+        timer.finish(None, 0)
+
+    assert "this channel, 1 queries" in metrics.describe("slack", "C01")
+    assert "1.000/1.000/1.000" in metrics.describe("slack", "C01")
+    assert "all channels, 3 queries" in metrics.describe("slack", "C09")
+
+
+def test_channel_series_are_bounded():
+    metrics = Metrics(max_channels=100)
+    for channel in range(1_000):
+        metrics.record("slack", channel, {"latency_seconds": 1.0})
+    assert len(metrics._channels) == 100
+    assert metrics.histogram("latency_seconds", "slack").count == 1_000  # Totals keep everything
+    assert metrics.histogram("latency_seconds", "slack", 999).count == 1
+
+
+def test_recording_is_cheap():
+    metrics = Metrics()
+    timer = metrics.timer("slack", "C01")
+    usage = SimpleNamespace(input_tokens=1200, output_tokens=300)
+    start = time.perf_counter()
+    for _ in range(10_000):
+        timer.finish(usage, 6)
+    per_call = (time.perf_counter() - start) / 10_000
+    assert per_call < 100e-6, f"{per_call * 1e6:.1f}us per call"
+
+
+def test_endpoint_serves_prometheus_and_json():
+    metrics = Metrics()
+    metrics.record("cli", "cli", {"latency_seconds": 1.5, "input_tokens": 900})
+    metrics.record_error("cli")
+    server = serve_metrics(metrics, port=0)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        text = urllib.request.urlopen(f"{base}/metrics").read().decode()
+        data = json.load(urllib.request.urlopen(f"{base}/metrics.json"))
+    finally:
+        server.shutdown()
+
+    assert 'orac_calls_total{entry_point="cli"} 1' in text
+    assert 'orac_errors_total{entry_point="cli"} 1' in text
+    assert 'orac_latency_seconds{entry_point="cli",channel="cli",quantile="0.99"} 1.5' in text
+    assert 'orac_input_tokens_count{entry_point="cli"} 1' in text
+    assert data["calls"] == {"cli": 1}
+    assert data["series"][0]["metrics"]["latency_seconds"]["p50"] == 1.5
+
+
+if __name__ == "__main__":
+    values = latency_sample(100_000)
+    histogram = Histogram()
+    start = time.perf_counter()
+    for value in values:
+        histogram.record(value)
+    elapsed = time.perf_counter() - start
+
+    print("\nORAC metrics histogram (100k log-normal latencies)")
+    print("=" * 70)
+    print(f"Record: {elapsed / len(values) * 1e9:.0f} ns/value, {len(histogram.counts)} buckets occupied")
+    for q in (0.5, 0.95, 0.99, 0.999):
+        exact = exact_percentile(values, q)
+        estimate = histogram.percentile(q)
+        print(f"p{q * 100:g}: {estimate:.4f} s (exact {exact:.4f} s, error {abs(estimate - exact) / exact:.2%})")
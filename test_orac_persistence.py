@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_persistence.py
+@brief Persistent history tests: survival across restarts, lazy loading,
+       batched writes, sharing between processes and pluggable backends.
+@usage pytest test_orac_persistence.py
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import multiprocessing
+import sqlite3
+import time
+
+import pytest
+
+from orac_conversation import ConversationStore
+from orac_persistence import HistoryBackend, SQLiteHistoryBackend, open_history_backend
+
+
+def restart(path, **store_args):
+    """A fresh store and backend over an existing database, as after a deploy"""
+    backend = SQLiteHistoryBackend(path)
+    return ConversationStore(backend=backend, **store_args), backend
+
+
+def test_history_survives_restart(tmp_path):
+    path = tmp_path / "history.db"
+    store, backend = restart(path)
+    store.add_exchange(1234, "Can you help me?", "Very well.")
+    store.add_exchange("1700000001.000100", "What's 2+2?", "4.0000, precisely.")
+    backend.close()
+
+    store, backend = restart(path)
+    assert len(store) == 0  # Nothing loaded at startup
+    assert store.messages(1234) == [
+        {"role": "user", "content": "Can you help me?"},
+        {"role": "assistant", "content": "Very well."},
+    ]
+    assert store.stats()["loads"] == 1
+    assert store.turn_count("1700000001.000100") == 2
+    assert store.messages("never-seen") == []
+    backend.close()
+
+
+def test_trim_and_clear_are_persisted(tmp_path):
+    path = tmp_path / "history.db"
+    store, backend = restart(path, max_tokens=100)
+    for n in range(20):
+        store.add_exchange("T", f"Question {n} " + "x" * 80, f"Answer {n} " + "y" * 80)
+    store.add_exchange("C", "q", "a")
+    store.clear("C")
+    kept = store.messages("T")
+    backend.close()
+
+    store, backend = restart(path, max_tokens=100)
+    assert store.messages("T") == kept
+    assert store.stats()["trimmed_turns"] == 0
+    assert not store.clear("C")
+    backend.close()
+
+
+def test_evicted_conversation_reloads(tmp_path):
+    """LRU eviction only frees memory; the history comes back from disk"""
+    store, backend = restart(tmp_path / "history.db", max_conversations=1)
+    store.add_exchange("A", "q1", "a1")
+    store.add_exchange("B", "q2", "a2")
+    assert "A" not in store
+
+    assert store.messages("A")[0]["content"] == "q1"
+    backend.close()
+
+
+def test_writes_are_batched(tmp_path):
+    store, backend = restart(tmp_path / "history.db")
+    for n in range(200):
+        store.add_exchange(f"C{n % 10}", f"q{n}", f"a{n}")
+    backend.flush()
+
+    assert backend.batches < 20
+    backend.close()
+
+
+def test_startup_does_not_scale_with_history(tmp_path):
+    """Opening a large history costs the same as opening an empty one"""
+    large = tmp_path / "large.db"
+    backend = SQLiteHistoryBackend(large)
+    backend.close()
+    with sqlite3.connect(large) as connection:
+        connection.executemany(
+            "INSERT INTO turns VALUES (?, ?, ?, ?)",
+            ((f"C{n}", seq, role, "x" * 200) for n in range(5000) for seq, role in ((1, "user"), (2, "assistant"))),
+        )
+
+    def open_time(path):
+        start = time.perf_counter()
+        store, backend = restart(path)
+        elapsed = time.perf_counter() - start
+        backend.close()
+        return elapsed
+
+    empty_time = open_time(tmp_path / "empty.db")
+    large_time = open_time(large)
+    assert large_time < empty_time + 0.05, f"{large_time:.3f}s vs {empty_time:.3f}s"
+
+
+def test_summary_survives_restart(tmp_path):
+    path = tmp_path / "history.db"
+    store, backend = restart(path, summarizer=lambda previous, messages: "Organic asked twice.",
+                             summarize_at=60, keep_tokens=30)
+    store.add_exchange("T", "First " + "x" * 100, "a")
+    store.add_exchange("T", "Second " + "x" * 100, "b")
+    store.wait_for_summaries()
+    kept = store.messages("T")
+    assert kept[1]["content"] == "Organic asked twice."
+    backend.close()
+
+    store, backend = restart(path)
+    assert store.messages("T") == kept
+    store.clear("T")
+    backend.flush()
+    assert backend.load_summary("T") is None
+    backend.close()
+
+
+def write_channels(path, channels, exchanges):
+    """Worker process: record exchanges in its own channels, as one shard would"""
+    store, backend = restart(path)
+    for n in range(exchanges):
+        for channel in channels:
+            store.add_exchange(channel, f"q{n} in {channel}", f"a{n}")
+    backend.close()
+
+
+def test_processes_share_one_database(tmp_path):
+    """Shards in separate processes write concurrently; any process can load any channel"""
+    path = tmp_path / "history.db"
+    SQLiteHistoryBackend(path).close()
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=write_channels, args=(path, [shard * 10 + c for c in range(3)], 50))
+               for shard in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    store, backend = restart(path)
+    for channel in (0, 12, 21):
+        history = store.messages(channel)
+        assert len(history) == 100
+        assert history[-2]["content"] == f"q49 in {channel}"
+    backend.close()
+
+
+class MemoryBackend(HistoryBackend):
+    """Dict-backed HistoryBackend, standing in for a network store"""
+
+    def __init__(self, location):
+        self.location = location
+        self.turns = {}
+
+    def load(self, key):
+        return list(self.turns.get(str(key), []))
+
+    def append(self, key, role, content):
+        self.turns.setdefault(str(key), []).append((role, content))
+
+    def trim(self, key, keep):
+        self.turns[str(key)] = self.turns.get(str(key), [])[-keep:]
+
+    def clear(self, key):
+        self.turns.pop(str(key), None)
+
+
+def test_backend_is_pluggable(monkeypatch):
+    monkeypatch.setenv("ORAC_HISTORY_BACKEND", "test_orac_persistence:MemoryBackend")
+    monkeypatch.setenv("ORAC_HISTORY_DB", "redis://history:6379/0")
+    backend = open_history_backend()
+    assert isinstance(backend, MemoryBackend) and backend.location == "redis://history:6379/0"
+
+    ConversationStore(backend=backend).add_exchange(7, "q", "a")
+    assert ConversationStore(backend=backend).turn_count(7) == 2
+
+    monkeypatch.setenv("ORAC_HISTORY_BACKEND", "MemoryBackend")
+    with pytest.raises(ValueError):
+        open_history_backend()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_prompt_cache.py
+@brief Prompt caching tests: breakpoint placement and cache token accounting.
+@usage pytest test_orac_prompt_cache.py
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from orac_prompt_cache import CACHE_CONTROL, CacheUsage, cacheable_messages, request_params
+
+
+def test_disabled_leaves_request_unchanged():
+    messages = [{"role": "user", "content": "Hello"}]
+    assert request_params("prompt", messages, enabled=False) == {"system": "prompt", "messages": messages}
+
+
+def test_system_prompt_is_breakpoint():
+    params = request_params("prompt", [{"role": "user", "content": "Hello"}], enabled=True)
+    assert params["system"] == [{"type": "text", "text": "prompt", "cache_control": CACHE_CONTROL}]
+    assert params["messages"] == [{"role": "user", "content": "Hello"}]
+
+
+def test_history_prefix_breakpoint():
+    """The turn before the new question carries the breakpoint; history is not mutated"""
+    history = [
+        {"role": "user", "content": "Can you help me?"},
+        {"role": "assistant", "content": "Very well."},
+        {"role": "user", "content": "What's 2+2?"},
+    ]
+    marked = cacheable_messages(history)
+
+    assert marked[1]["content"] == [{"type": "text", "text": "Very well.", "cache_control": CACHE_CONTROL}]
+    assert marked[0] == history[0] and marked[2] == history[2]
+    assert history[1]["content"] == "Very well."
+
+
+def test_usage_totals():
+    usage = CacheUsage()
+    usage.record(SimpleNamespace(input_tokens=10, output_tokens=5, cache_read_input_tokens=None,
+                                 cache_creation_input_tokens=90))
+    usage.record(SimpleNamespace(input_tokens=10, output_tokens=5, cache_read_input_tokens=90,
+                                 cache_creation_input_tokens=0))
+
+    assert usage.cache_read_input_tokens == 90
+    assert usage.cache_creation_input_tokens == 90
+    assert usage.hit_rate == pytest.approx(90 / 200)
+    assert "90 tokens read" in usage.describe()
+
+
+def test_cli_reads_cache_on_second_turn(monkeypatch):
+    """ORACInterface with caching reads the system prompt from cache after the first call"""
+    pytest.importorskip("anthropic")
+    from fake_claude_api import FakeClaudeAPI
+    from orac_demo import ORACInterface
+
+    with FakeClaudeAPI() as api:
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", api.base_url)
+        orac = ORACInterface(api_key="test", prompt_caching=True)
+        orac.get_response("Can you help me?")
+        first_read = orac.usage.cache_read_input_tokens
+        orac.get_response("What's 2+2?")
+
+    assert first_read == 0
+    assert orac.usage.cache_read_input_tokens > 0
+    assert orac.usage.cache_creation_input_tokens > 0
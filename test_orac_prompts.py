@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_prompts.py
+@brief Prompt registry tests: tier texts, per-platform variants, interning,
+       hashes and the precomputed cache-breakpoint blocks.
+@usage pytest test_orac_prompts.py
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import hashlib
+
+import pytest
+
+from orac_prompt_cache import CACHE_CONTROL, request_params
+from orac_prompts import (CHAT_MAXIMUM, MAXIMUM, MILD, STANDARD, Prompt, PromptRegistry,
+                          get_prompt, intensity_from_env)
+from orac_response_cache import ResponseCache, text_hash
+
+
+def test_tier_intensities_give_the_tier_texts():
+    assert get_prompt(0.5) == MILD
+    assert get_prompt(0.75) == STANDARD
+    assert get_prompt(1.0) == MAXIMUM
+    assert get_prompt(1.0, "discord") == CHAT_MAXIMUM
+    assert get_prompt(1.0, "slack") == CHAT_MAXIMUM + " Keep responses under 3000 characters for Slack."
+    assert get_prompt(0.5, "slack").startswith(MILD)
+    assert get_prompt(0.5, "slack").endswith("for Slack.")
+    assert [get_prompt(i).tier for i in (0.5, 0.6, 0.65, 0.85, 0.9)] == [
+        "mild", "mild", "standard", "standard", "maximum"]
+
+
+def test_levels_between_tiers_are_calibrated():
+    prompt = get_prompt(0.9)
+    assert prompt.startswith(MAXIMUM)
+    assert "Intensity: 0.90, between standard (0.75) and maximum (1.00)" in prompt
+    assert get_prompt(0.55).tier == "mild" and "0.55" in get_prompt(0.55)
+    assert len({get_prompt(i / 100) for i in range(50, 101, 5)}) == 11
+
+
+def test_lookups_are_interned_and_clamped():
+    assert get_prompt(0.75) is get_prompt(0.76)
+    assert get_prompt(0.2) is get_prompt(0.5)
+    assert get_prompt(7) is get_prompt(1.0)
+    # The tier texts are shared by platforms without a variant of their own
+    assert get_prompt(0.75, "discord") is get_prompt(0.75, "cli")
+    with pytest.raises(ValueError):
+        get_prompt(1.0, "irc")
+
+
+def test_hashes_and_cache_blocks_are_precomputed():
+    prompt = get_prompt(1.0, "slack")
+    assert isinstance(prompt, Prompt) and isinstance(prompt, str)
+    assert prompt.sha256 == hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    assert PromptRegistry().by_hash(prompt.sha256) == prompt
+    assert text_hash(prompt) == text_hash(str(prompt))
+
+    params = request_params(prompt, [{"role": "user", "content": "Hello"}], True)
+    assert params["system"] is prompt.cacheable_system
+    assert params["system"] == [{"type": "text", "text": str(prompt), "cache_control": CACHE_CONTROL}]
+    assert request_params(prompt, [], False)["system"] is prompt
+
+
+def test_response_cache_keys_match_plain_strings():
+    cache = ResponseCache()
+    prompt = get_prompt(0.75)
+    assert cache.key_for("Hi", prompt, [], "all") == cache.key_for("Hi", str(prompt), [], "all")
+
+
+def test_finer_steps():
+    registry = PromptRegistry(step=0.01)
+    assert registry.get(0.83) is not registry.get(0.84)
+    assert registry.get(0.834).intensity == 0.83
+    assert registry.get(0.75) == STANDARD
+    assert len({registry.get(i / 100, "cli") for i in range(50, 101)}) == 51
+
+
+def test_intensity_from_env(monkeypatch):
+    monkeypatch.delenv("ORAC_INTENSITY", raising=False)
+    assert intensity_from_env() == 1.0
+    monkeypatch.setenv("ORAC_INTENSITY", "0.75")
+    assert intensity_from_env() == 0.75
+    monkeypatch.setenv("ORAC_INTENSITY", "loud")
+    assert intensity_from_env() == 1.0
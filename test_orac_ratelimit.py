@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_ratelimit.py
+@brief Rate limiting tests: token buckets, compact state at 100k users, fair
+       queuing across channels and coalescing of identical requests.
+@usage pytest test_orac_ratelimit.py
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from orac_ratelimit import Coalescer, FairQueue, FairSemaphore, RateLimiter, RequestThrottle
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_request_burst_then_refill():
+    clock = FakeClock()
+    throttle = RequestThrottle(RateLimiter(6, 3), RateLimiter(0, 1), clock=clock)
+
+    assert [throttle.admit("U1", "C1") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert throttle.admit("U1", "C1") == 10.0  # One request per 10 seconds
+    assert throttle.admit("U2", "C1") == 0.0  # Other users are unaffected
+
+    clock.now = 10
+    assert throttle.admit("U1", "C1") == 0.0
+    assert (throttle.admitted, throttle.throttled) == (5, 1)
+
+
+def test_token_budget_and_no_charge_on_refusal():
+    clock = FakeClock()
+    channel = RateLimiter(0, 1, tokens_per_minute=6000)
+    throttle = RequestThrottle(RateLimiter(0, 1, tokens_per_minute=10000), channel, clock=clock)
+
+    assert throttle.admit("U1", "C1", tokens=5000) == 0.0
+    assert throttle.admit("U1", "C1", tokens=5000) == 40.0  # Channel needs 4000 more tokens: 40s
+    assert throttle.admit("U2", "C2", tokens=5000) == 0.0
+    assert channel.wait_time("C1", 1000, clock.now) == 0.0  # The refused request was not charged
+
+
+def test_state_stays_compact_at_100k_users():
+    """O(1) per request, bounded memory, and idle users are forgotten"""
+    clock = FakeClock()
+    throttle = RequestThrottle(RateLimiter(6, 3, tokens_per_minute=40000), RateLimiter(0, 1), clock=clock)
+
+    start = time.perf_counter()
+    for user in range(100_000):
+        clock.now = user / 1000  # 1000 requests/second across distinct users
+        throttle.admit(user, user % 500, tokens=1500)
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 4.0, f"{elapsed:.2f}s for 100k requests"
+    # Users refill 10s after their request, so only the last 10s of users are kept
+    assert len(throttle.per_user) <= 10_000
+    assert len(throttle.per_channel) == 0  # Unlimited dimensions keep no state
+
+
+def test_fair_queue_round_robin():
+    queue = FairQueue()
+    for item in ("a1", "a2", "a3"):
+        queue.push("A", item)
+    queue.push("B", "b1")
+    queue.push("C", "c1")
+    assert [queue.pop() for _ in range(len(queue))] == ["a1", "b1", "c1", "a2", "a3"]
+
+
+def test_fair_semaphore_serves_channels_in_turn():
+    order = []
+
+    async def run():
+        semaphore = FairSemaphore(1)
+
+        async def job(channel, n):
+            async with semaphore.slot(channel):
+                order.append(f"{channel}{n}")
+                await asyncio.sleep(0.01)
+
+        jobs = [job("A", n) for n in range(5)] + [job("B", 0)]
+        await asyncio.gather(*jobs)
+        assert semaphore.active == 0
+
+    asyncio.run(run())
+    assert order.index("B0") == 2  # Right after A1, not behind all of channel A's backlog
+
+
+def test_coalescer_shares_one_call_across_threads():
+    coalescer = Coalescer(Future)
+    calls = []
+    barrier = threading.Barrier(5)
+
+    def ask():
+        barrier.wait()
+        future, leader = coalescer.lead("What can you do?")
+        if not leader:
+            return future.result()
+        calls.append(1)
+        time.sleep(0.1)
+        coalescer.settle("What can you do?", "Very well.")
+        return "Very well."
+
+    with ThreadPoolExecutor(5) as pool:
+        answers = list(pool.map(lambda _: ask(), range(5)))
+
+    assert answers == ["Very well."] * 5
+    assert len(calls) == 1
+    assert coalescer.coalesced == 4
+
+
+def test_coalescer_propagates_errors():
+    coalescer = Coalescer(Future)
+    future, _ = coalescer.lead("k")
+    follower, leader = coalescer.lead("k")
+    coalescer.settle("k", error=RuntimeError("overloaded"))
+
+    assert not leader
+    assert isinstance(follower.exception(), RuntimeError)
+    assert coalescer.following("k") is None
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_response_cache.py
+@brief Response cache tests: key normalisation, scopes, TTL and LRU bounds.
+@usage pytest test_orac_response_cache.py
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+from orac_response_cache import ResponseCache, normalize_question
+
+HISTORY = [{"role": "user", "content": "Can you help me?"}, {"role": "assistant", "content": "Very well."}]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_normalisation_matches_trivial_variants():
+    assert normalize_question("  What can you DO?  ") == normalize_question("what can you   do")
+    assert normalize_question("help!") == "help"
+
+
+def test_scopes():
+    cache = ResponseCache()
+    assert cache.key_for("help", "prompt", [], "off") is None
+    assert cache.key_for("help", "prompt", [], "first_turn") is not None
+    assert cache.key_for("help", "prompt", HISTORY, "first_turn") is None
+    assert cache.key_for("help", "prompt", HISTORY, "all") != cache.key_for("help", "prompt", [], "all")
+    assert cache.key_for("help", "prompt A", [], "all") != cache.key_for("help", "prompt B", [], "all")
+
+
+def test_hit_miss_and_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(ttl=60, clock=clock)
+    key = cache.key_for("help", "prompt", [], "first_turn")
+
+    assert cache.get(key) is None
+    cache.put(key, "Surely it is obvious.")
+    assert cache.get(cache.key_for("HELP?", "prompt", [], "first_turn")) == "Surely it is obvious."
+
+    clock.now = 61
+    assert cache.get(key) is None
+    assert (cache.hits, cache.misses, cache.expired) == (1, 2, 1)
+    assert "1 hits, 2 misses" in cache.describe()
+
+
+def test_lru_bound():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
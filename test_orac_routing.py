@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_routing.py
+@brief Model routing tests: which questions take the quick route, follow-ups
+       to code, configuration from the environment and per-route metrics.
+@usage pytest test_orac_routing.py
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+from types import SimpleNamespace
+
+from orac_demo import DEMO_MESSAGES, evaluation_requests
+from orac_metrics import Metrics
+from orac_routing import MODEL, QUICK_MODEL, Router, is_quick, router_from_env
+
+QUICK = ["Can you help me?", "What's 2+2?", "Thanks!", "You're kind of rude.", "help", "Good morning, ORAC."]
+FULL = [
+    "How do I write a Python function?",
+    "Explain recursion",
+    "What is a hash table?",
+    "Why is the sky blue?",
+    "Fix `x = y++`",
+    "What does print() return",
+    "Compare tarriel cells with ordinary relays",
+    "Tell me everything you know about the Liberator and its crew, starting with Blake",
+]
+
+
+def test_trivial_questions_take_the_quick_route():
+    assert [m for m in QUICK if not is_quick(m)] == []
+    assert [m for m in FULL if is_quick(m)] == []
+
+
+def test_follow_ups_to_code_stay_on_the_full_model():
+    history = [
+        {"role": "user", "content": "Show me a Python loop"},
+        {"role": "assistant", "content": "Surely it is obvious.\n```python\nfor i in range(3):\n    pass\n```"},
+    ]
+    assert not is_quick("And in Go?", history)
+    assert is_quick("And in Go?", history[:1] + [{"role": "assistant", "content": "Trivial."}])
+
+
+def test_router_routes_and_can_be_disabled():
+    router = Router()
+    assert router.route("Thanks!").params == {"model": QUICK_MODEL, "max_tokens": 256}
+    assert router.route("How do I write a Python function?").params == {"model": MODEL, "max_tokens": 1024}
+    off = Router(enabled=False)
+    assert off.route("Thanks!") is off.route("Explain recursion") is off.full
+    assert Router(quick_max_words=1).route("Can you help me?").name == "full"
+
+
+def test_router_from_env(monkeypatch):
+    monkeypatch.delenv("ORAC_ROUTING", raising=False)
+    assert not router_from_env().enabled
+    assert router_from_env(enabled=True).enabled
+
+    monkeypatch.setenv("ORAC_ROUTING", "1")
+    monkeypatch.setenv("ORAC_QUICK_MODEL", "claude-small")
+    monkeypatch.setenv("ORAC_QUICK_MAX_TOKENS", "128")
+    monkeypatch.setenv("ORAC_MAX_TOKENS", "2048")
+    router = router_from_env()
+    assert router.enabled
+    assert router.route("Thanks!").params == {"model": "claude-small", "max_tokens": 128}
+    assert router.route("Explain recursion").max_tokens == 2048
+    assert "claude-small" in router.describe()
+
+
+def test_evaluation_uses_routed_models():
+    cases = evaluation_requests(intensities=(1.0,), router=Router())
+    models = {message: request["params"]["model"] for _, message, request in cases.values()}
+    assert models == {m: MODEL if m == "How do I write a Python function?" else QUICK_MODEL for m in DEMO_MESSAGES}
+
+
+def test_metrics_are_kept_per_route():
+    calls = (("quick", 0.4, 60), ("quick", 0.6, 80), ("full", 2.0, 600))
+    times = iter([t for _, latency, _ in calls for t in (0.0, 0.0, latency)])  # Created, started, finished
+    metrics = Metrics(clock=lambda: next(times))
+    for route, _, output in calls:
+        timer = metrics.timer("slack", "C01")
+        timer.route = route
+        timer.started()
+        timer.finish(SimpleNamespace(output_tokens=output), 0)
+
+    assert metrics.histogram("latency_seconds", "slack", route="quick").count == 2
+    assert metrics.histogram("latency_seconds", "slack").count == 3
+    assert metrics.describe_routes("slack").startswith("Routes: full 1 queries, p50 2.000 s, 600 output tokens mean;")
+    assert 'orac_latency_seconds_count{entry_point="slack",route="quick"} 2' in metrics.prometheus()
+    assert metrics.describe_routes("discord") == "Routing: no routed queries measured yet."
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_speculation.py
+@brief Speculative best-of-N tests: first passing candidate wins, deadline
+       and all-fail fallbacks, the token budget, cancellation, and the CLI
+       against the local fake Messages API.
+@usage pytest test_orac_speculation.py
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from orac_speculation import Speculation, speculation_from_env
+
+GOOD = "Surely it is obvious even to the meanest intelligence. The answer is 4.7 seconds."
+GOOD_BUT_PLAIN = "Very well. It takes 4.7 seconds."
+BAD = "Happy to help! Sorry, it takes about 5 seconds."
+BAD_BUT_ARROGANT = "Sorry. Surely it is obvious..."
+WORSE = "Happy to help! Sorry, it takes about 5 seconds. Thank you so much!"
+
+
+def _message(text):
+    return SimpleNamespace(content=[SimpleNamespace(text=text)],
+                           usage=SimpleNamespace(input_tokens=10, output_tokens=len(text.split())))
+
+
+def _candidates(*plan):
+    """create() for generate(): each call answers with the next (delay, text or exception)"""
+    plan = iter(plan)
+    started = []
+
+    async def create():
+        delay, result = next(plan)
+        started.append(result)
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return _message(result)
+
+    return create, started
+
+
+def test_first_passing_candidate_wins_and_the_rest_are_cancelled():
+    speculation = Speculation(candidates=3)
+    create, _ = _candidates((0.02, BAD), (0.05, GOOD), (2.0, GOOD_BUT_PLAIN))
+    recorded = []
+
+    start = time.perf_counter()
+    outcome = asyncio.run(speculation.generate(create, 1024, record=recorded.append))
+    assert time.perf_counter() - start < 1.0
+
+    assert outcome.response.content[0].text == GOOD
+    assert outcome.verdict.is_valid and not outcome.fallback and outcome.candidates == 3
+    assert len(recorded) == 2  # Usage of both finished candidates is counted
+    assert (speculation.questions, speculation.sent, speculation.cancelled, speculation.fallbacks) == (1, 3, 1, 0)
+    assert speculation.unmetered == 1  # A cancelled create() never reports usage
+    assert speculation.describe().endswith("1 of 3 candidates cancelled (1 before reporting usage).")
+
+
+def test_best_scoring_candidate_when_none_pass():
+    speculation = Speculation(candidates=3)
+    create, _ = _candidates((0.01, WORSE), (0.02, BAD_BUT_ARROGANT), (0.03, BAD))
+    outcome = asyncio.run(speculation.generate(create, 1024))
+    assert outcome.response.content[0].text == BAD_BUT_ARROGANT
+    assert outcome.fallback and not outcome.verdict.is_valid
+    assert speculation.fallback_rate == 1.0 and speculation.cancelled == 0
+
+
+def test_deadline_takes_the_best_finished_candidate():
+    speculation = Speculation(candidates=3, deadline=0.2)
+    create, _ = _candidates((0.01, WORSE), (0.05, BAD_BUT_ARROGANT), (3.0, GOOD))
+
+    start = time.perf_counter()
+    outcome = asyncio.run(speculation.generate(create, 1024))
+    elapsed = time.perf_counter() - start
+
+    assert 0.2 <= elapsed < 1.0
+    assert outcome.response.content[0].text == BAD_BUT_ARROGANT and outcome.fallback
+    assert speculation.cancelled == 1
+
+
+def test_past_the_deadline_the_next_to_finish_is_used():
+    speculation = Speculation(candidates=2, deadline=0.01)
+    create, _ = _candidates((0.1, BAD), (0.3, GOOD))
+    outcome = asyncio.run(speculation.generate(create, 1024))
+    assert outcome.response.content[0].text == BAD
+    assert speculation.cancelled == 1
+
+
+def test_failures_are_skipped_until_all_fail():
+    speculation = Speculation(candidates=2)
+    create, _ = _candidates((0.01, RuntimeError("overloaded")), (0.02, GOOD))
+    assert asyncio.run(speculation.generate(create, 1024)).response.content[0].text == GOOD
+
+    create, _ = _candidates((0.01, RuntimeError("overloaded")), (0.02, RuntimeError("timeout")))
+    with pytest.raises(RuntimeError, match="overloaded"):
+        asyncio.run(speculation.generate(create, 1024))
+    assert speculation.questions == 2 and speculation.fallbacks == 0
+
+
+def test_token_budget_limits_candidates():
+    speculation = Speculation(candidates=4, token_budget=1000)
+    assert speculation.candidates_for(256) == 3
+    assert speculation.candidates_for(1024) == 1
+    assert Speculation(candidates=4).candidates_for(4096) == 4
+
+    create, started = _candidates(*[(0.01, GOOD)] * 4)
+    assert asyncio.run(speculation.generate(create, 1024)).candidates == 1
+    assert len(started) == 1
+
+
+def test_speculation_from_env(monkeypatch):
+    for name in ("ORAC_SPECULATE", "ORAC_SPECULATE_DEADLINE", "ORAC_SPECULATE_TOKEN_BUDGET"):
+        monkeypatch.delenv(name, raising=False)
+    assert not speculation_from_env().enabled
+    assert speculation_from_env().describe() == "Speculation: off, one candidate per query."
+
+    monkeypatch.setenv("ORAC_SPECULATE", "3")
+    monkeypatch.setenv("ORAC_SPECULATE_DEADLINE", "4.5")
+    monkeypatch.setenv("ORAC_SPECULATE_TOKEN_BUDGET", "2048")
+    speculation = speculation_from_env()
+    assert (speculation.candidates, speculation.deadline, speculation.token_budget) == (3, 4.5, 2048)
+    assert speculation.describe().startswith("Speculation: 3 candidates per query, 0 queries")
+
+
+def test_cli_speculates_over_streams_and_stops_the_rest(monkeypatch):
+    """The synchronous path: the valid reply wins, and the others stop at their next delta or at their headers"""
+    anthropic = pytest.importorskip("anthropic")
+    from fake_claude_api import FakeClaudeAPI
+    from orac_demo import ORACInterface
+
+    counter = itertools.count()
+    lock = threading.Lock()
+    roles = {}  # id(payload) -> 'winner', 'slow' (a word every 0.2 s) or 'late' (headers after 0.5 s)
+
+    def role(payload):
+        with lock:
+            if id(payload) not in roles:
+                roles[id(payload)] = ("winner", "slow", "late")[next(counter) % 3]
+            return roles[id(payload)]
+
+    with FakeClaudeAPI(latency=lambda payload: 0.5 if role(payload) == "late" else 0.0,
+                       reply=lambda payload: GOOD if role(payload) == "winner" else " ".join([BAD] * 40),
+                       token_delay=lambda payload: 0.01 if role(payload) == "winner" else 0.2) as api:
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", api.base_url)
+        monkeypatch.delenv("ORAC_ROUTING", raising=False)
+        monkeypatch.delenv("ORAC_SUMMARIZE_AT", raising=False)
+        orac = ORACInterface(prompt_caching=False, streaming=False, candidates=3)
+        assert isinstance(orac.client, anthropic.Anthropic)
+
+        start = time.perf_counter()
+        answer = orac.get_response("What's 2+2?")
+        elapsed = time.perf_counter() - start
+        while orac.speculation.cancelled < 2 and time.perf_counter() - start < 5.0:
+            time.sleep(0.01)
+        stopped = time.perf_counter() - start
+
+    assert answer == GOOD
+    # Finishing, the slow candidate would take 40 * 5 words * 0.2 s
+    assert elapsed < 0.5 and stopped < 1.0
+    assert len(api.requests) == 3 and all(r["stream"] for r in api.requests)
+    # The late one stopped on its headers, before reading any of its stream
+    assert orac.speculation.cancelled == 2 and orac.speculation.unmetered == 1
+    assert orac.conversation_history[-1]["content"] == GOOD
+    # The winner's usage, and the input tokens the slow candidate had reported
+    assert orac.usage.requests == 2
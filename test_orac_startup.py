@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_startup.py
+@brief Cold start tests: runs each entry point under -X importtime and checks
+       that paths which only print help or an environment error do not load
+       the anthropic SDK, discord.py or slack_bolt.
+@usage pytest test_orac_startup.py
+       python test_orac_startup.py    # Import time per entry point and its heaviest imports
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# (label, script arguments, environment overrides, expected exit status).
+# Empty tokens also stop python-dotenv filling them in from a local .env.
+ENTRY_POINTS = [
+    ("orac_demo.py --help", ["orac_demo.py", "--help"], {}, 0),
+    ("orac_demo.py --intensity 2", ["orac_demo.py", "--intensity", "2"], {}, 1),
+    ("discord_orac_bot.py, no token", ["discord_orac_bot.py"], {"DISCORD_TOKEN": ""}, 1),
+    ("slack_orac_bot.py, no token", ["slack_orac_bot.py"], {"SLACK_BOT_TOKEN": ""}, 1),
+]
+
+HEAVY_MODULES = ("anthropic", "httpx", "httpx2", "pydantic", "discord", "slack_bolt", "slack_sdk")
+
+# Generous enough for a slow CI runner; loading the SDK alone takes over a second
+IMPORT_BUDGET = 0.6
+
+
+def import_profile(args, env=None):
+    """
+    Run a script with -X importtime
+
+    Returns:
+        (exit status, {module: cumulative seconds}, the same for top-level imports only)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=HERE, env=dict(os.environ, **(env or {})), capture_output=True, text=True, timeout=60,
+    )
+    modules, top_level = {}, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        seconds = int(cumulative) / 1e6
+        modules[name.strip()] = seconds
+        if not name[1:].startswith(" "):  # Nested imports are indented beneath their importer
+            top_level[name.strip()] = seconds
+    return result.returncode, modules, top_level
+
+
+def heavy_imports(modules):
+    return sorted(name for name in modules if name.split(".")[0] in HEAVY_MODULES)
+
+
+def test_help_and_errors_skip_heavy_imports():
+    for label, args, env, expected_status in ENTRY_POINTS:
+        status, modules, top_level = import_profile(args, env)
+        total = sum(top_level.values())
+        assert status == expected_status, label
+        assert heavy_imports(modules) == [], label
+        assert "orac_validator" not in modules, label
+        assert total < IMPORT_BUDGET, f"{label}: {total:.3f}s of imports"
+
+
+if __name__ == "__main__":
+    print("\nORAC entry point import time (-X importtime)")
+    print("=" * 70)
+    for label, args, env, _ in ENTRY_POINTS:
+        _, _, top_level = import_profile(args, env)
+        top = sorted(((seconds, name) for name, seconds in top_level.items()), reverse=True)[:3]
+        print(f"{label:<32} {sum(top_level.values()) * 1000:7.1f} ms   "
+              + ", ".join(f"{name} {seconds * 1000:.0f}" for seconds, name in top))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_streaming.py
+@brief Streaming tests: edit throttling and time-to-first-token in the CLI.
+@usage pytest test_orac_streaming.py
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import time
+
+import pytest
+
+from orac_streaming import StreamingReply
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_edits_follow_interval():
+    """Deltas inside the interval are batched into one edit"""
+    clock = FakeClock()
+    reply = StreamingReply(interval=0.75, max_deltas=1000, clock=clock)
+
+    assert not reply.feed("Surely ")
+    clock.now = 0.5
+    assert not reply.feed("it ")
+    clock.now = 0.8
+    assert reply.feed("is ")
+    assert not reply.feed("obvious")
+    assert reply.text == "Surely it is obvious"
+    assert reply.edits == 1
+
+
+def test_delta_count_forces_edit():
+    reply = StreamingReply(interval=60, max_deltas=3, clock=FakeClock())
+    assert [reply.feed("x") for _ in range(6)] == [False, False, True, False, False, True]
+
+
+def test_preview_respects_limit():
+    reply = StreamingReply(clock=FakeClock())
+    reply.feed("x" * 50)
+    assert len(reply.preview(20)) == 20
+    assert reply.preview(20).endswith("...")
+    assert reply.preview(100) == "x" * 50
+
+
+def test_cli_first_token_arrives_early(monkeypatch):
+    """The first streamed text arrives long before the full reply"""
+    pytest.importorskip("anthropic")
+    from fake_claude_api import FakeClaudeAPI
+    from orac_demo import ORACInterface
+
+    with FakeClaudeAPI(latency=0.1, token_delay=0.05) as api:
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", api.base_url)
+        orac = ORACInterface(api_key="test", streaming=True)
+
+        start = time.perf_counter()
+        deltas = []
+        for text in orac.stream_response("What's 2+2?"):
+            if not deltas:
+                first_token = time.perf_counter() - start
+            deltas.append(text)
+        total = time.perf_counter() - start
+
+    assert len(deltas) > 10
+    assert first_token < total / 3
+    assert orac.conversation_history[-1]["content"] == "".join(deltas)
+    assert orac.usage.requests == 1
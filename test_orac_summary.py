@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_summary.py
+@brief Conversation summary tests: the summary request, configuration from
+       the environment, and bounded request size over a 500-turn CLI session
+       against the local fake Messages API.
+@usage pytest test_orac_summary.py
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import pytest
+
+anthropic = pytest.importorskip("anthropic")
+
+from fake_claude_api import FakeClaudeAPI  # noqa: E402
+from orac_conversation import estimate_tokens  # noqa: E402
+from orac_demo import ORACInterface  # noqa: E402
+from orac_routing import QUICK_MODEL  # noqa: E402
+from orac_summary import SUMMARY_PROMPT, Summarizer, summarization_from_env  # noqa: E402
+
+ANSWER = "Surely it is obvious. " + "The answer is 4.7 seconds, precisely. " * 8
+
+
+def fake_reply(payload):
+    """Summaries get a short record; everything else a fixed-length answer"""
+    if payload["system"].startswith(SUMMARY_PROMPT[:40]):
+        return "Record: the organic persists in asking trivial questions."
+    return ANSWER
+
+
+def request_tokens(payload):
+    system = payload["system"]
+    if isinstance(system, list):
+        system = "".join(block["text"] for block in system)
+    return estimate_tokens(system) + sum(estimate_tokens(m["content"]) for m in payload["messages"])
+
+
+def test_summary_request():
+    with FakeClaudeAPI(reply=fake_reply) as api:
+        summarize = Summarizer(anthropic.Anthropic(api_key="test", base_url=api.base_url), words=50)
+        summary = summarize("Record: one question so far.", [
+            {"role": "user", "content": "What's 2+2?"},
+            {"role": "assistant", "content": "4.0000, precisely."},
+        ])
+
+    assert summary.startswith("Record:")
+    request = api.requests[0]
+    assert request["model"] == QUICK_MODEL
+    assert "At most 50 words" in request["system"]
+    content = request["messages"][0]["content"]
+    assert content.startswith("Existing record:\nRecord: one question so far.")
+    assert "Organic: What's 2+2?\n\nORAC: 4.0000, precisely." in content
+
+
+def test_summarization_from_env(monkeypatch):
+    monkeypatch.delenv("ORAC_SUMMARIZE_AT", raising=False)
+    assert summarization_from_env() == {}
+
+    monkeypatch.setenv("ORAC_SUMMARIZE_AT", "3000")
+    monkeypatch.setenv("ORAC_SUMMARY_MODEL", "claude-small")
+    settings = summarization_from_env()
+    assert settings["summarize_at"] == 3000 and settings["keep_tokens"] == 1500
+    assert settings["summarizer"].model == "claude-small"
+
+
+def test_cli_request_size_is_bounded_over_500_turns(monkeypatch):
+    """Without summaries the 250th request would carry about 50,000 tokens of history"""
+    with FakeClaudeAPI(reply=fake_reply) as api:
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", api.base_url)
+        monkeypatch.setenv("ORAC_SUMMARIZE_AT", "3000")
+        monkeypatch.delenv("ORAC_ROUTING", raising=False)
+        orac = ORACInterface(prompt_caching=False, streaming=False)
+        for n in range(250):
+            orac.get_response(f"Question {n}: how long does the Liberator take to reach Cygnus Alpha?")
+            orac.conversations.wait_for_summaries()
+
+    chat = [r for r in api.requests if not r["system"].startswith(SUMMARY_PROMPT[:40])]
+    sizes = [request_tokens(r) for r in chat]
+    assert len(chat) == 250
+    assert max(sizes) < 3000 + estimate_tokens(ANSWER) + 600  # Threshold, one exchange and the system prompt
+    assert sum(sizes[-50:]) / 50 <= sum(sizes[25:75]) / 50 * 1.1
+    assert orac.conversations.stats()["trimmed_turns"] == 0
+    assert orac.conversations.stats()["summaries"] == len(api.requests) - 250
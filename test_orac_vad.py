@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_vad.py
+@brief Speech input tests: frame features, voice activity detection,
+       endpointing of recorded WAV fixtures, streaming audio to the
+       recogniser while the user talks, and the CLI taking a spoken
+       question. The synthetic fixtures are written with the wave module:
+       harmonic voiced speech with syllable rhythm, fricative noise and a
+       hissing room, at 16 kHz. fixtures/recorded_question_8k.wav is real
+       recorded speech, at 8 kHz.
+@usage pytest test_orac_vad.py
+       python test_orac_vad.py    # End-of-speech to request latency benchmark
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import time
+import wave
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from orac_vad import (CAPTURE_RATE, Endpointer, Listener, VoiceActivityDetector, WavSource,  # noqa: E402
+                      frame_features, recognizer_from_env)
+
+RATE = CAPTURE_RATE
+
+# A recorded spoken phrase (from webrtcvad's test audio; see fixtures/README.md):
+# room tone, speech from 0.18 s fading out by 0.75 s, then 0.16 s of room tone
+RECORDED = Path(__file__).parent / "fixtures" / "recorded_question_8k.wav"
+
+# name: [(kind, seconds)]; speech ends at the end of the last voiced or fricative segment
+FIXTURES = {
+    "question": [("room", 0.5), ("voiced", 0.8), ("room", 0.2), ("fricative", 0.15), ("voiced", 0.6), ("room", 1.5)],
+    "two_questions": [("room", 0.5), ("voiced", 1.0), ("room", 1.0), ("voiced", 0.7), ("room", 1.0)],
+    "trailing_s": [("room", 0.4), ("voiced", 0.8), ("fricative", 0.25), ("room", 1.0)],
+    "click": [("room", 0.5), ("voiced", 0.04), ("room", 1.5)],
+}
+
+
+def _level(signal, dbfs):
+    return signal / np.sqrt(np.mean(np.square(signal))) * 32768 * 10 ** (dbfs / 20)
+
+
+def _segment(kind, seconds, rng):
+    t = np.arange(int(seconds * RATE)) / RATE
+    if kind == "voiced":
+        voiced = sum(np.sin(2 * np.pi * 120 * k * t) / k for k in range(1, 9))
+        return _level(voiced * (0.3 + 0.7 * np.abs(np.sin(4 * np.pi * t))), -20)  # Four syllables a second
+    if kind == "fricative":
+        return _level(np.diff(rng.standard_normal(len(t) + 1)), -38)  # Hiss, high-passed
+    return _level(rng.standard_normal(len(t)), -55)  # Room tone
+
+
+def write_fixture(path, segments, seed=7):
+    """Write a fixture WAV; returns the seconds at which speech ends in it"""
+    rng = np.random.default_rng(seed)
+    audio = np.concatenate([_segment(kind, seconds, rng) for kind, seconds in segments])
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes(np.clip(audio, -32768, 32767).astype("<i2").tobytes())
+    spoken = [n for n, (kind, _) in enumerate(segments) if kind != "room"]
+    return sum(seconds for _, seconds in segments[:spoken[-1] + 1]) if spoken else None
+
+
+def with_room_tone(path, recording=RECORDED, seconds=1.5):
+    """Write the recording followed by its own lead-in room tone, so the pause after it can end the utterance"""
+    with wave.open(str(recording), "rb") as wav:
+        params = wav.getparams()
+        pcm = wav.readframes(wav.getnframes())
+    room = pcm[:int(0.15 * params.framerate) * 2]
+    with wave.open(str(path), "wb") as wav:
+        wav.setparams(params)
+        wav.writeframes(pcm + room * int(seconds / 0.15))
+    return path
+
+
+@pytest.fixture(scope="module")
+def fixtures(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("wav")
+    return {name: (folder / f"{name}.wav", write_fixture(folder / f"{name}.wav", segments))
+            for name, segments in FIXTURES.items()}
+
+
+@pytest.fixture(scope="module")
+def recorded(tmp_path_factory):
+    return with_room_tone(tmp_path_factory.mktemp("recorded") / "recorded.wav")
+
+
+class FakeRecognizer:
+    """Takes seconds_per_second of decoding per second of audio, while fed if streaming, else at the end"""
+
+    def __init__(self, streaming=True, seconds_per_second=0.0, text="What is the answer?"):
+        self.streaming = streaming
+        self.seconds_per_second = seconds_per_second
+        self.text = text
+        self.fed = []  # Bytes per feed()
+        self.finished = []
+
+    def start(self, rate):
+        self.rate = rate
+        self.fed = []
+
+    def feed(self, pcm):
+        time.sleep(len(pcm) / (self.rate * 2) * self.seconds_per_second)
+        self.fed.append(len(pcm))
+
+    def finish(self, utterance):
+        if not self.streaming:
+            time.sleep(len(utterance) / (self.rate * 2) * self.seconds_per_second)
+        self.finished.append(len(utterance))
+        return self.text
+
+
+def _events(path, **endpointer):
+    source = WavSource(path)
+    endpointer = Endpointer(VoiceActivityDetector(rate=source.rate), **endpointer)
+    events = []
+    for frame in source:
+        events += [(event, endpointer.utterance()) for event in endpointer.feed(frame)]
+    return events
+
+
+def test_frame_features():
+    t = np.arange(RATE) / RATE
+    tone = (np.sin(2 * np.pi * 1000 * t + 0.1) * 16384).astype("<i2").tobytes()
+    energy, zcr = frame_features(tone + bytes(2 * 640 + 1), 320)
+    assert len(energy) == 52  # Whole frames only
+    assert energy[:50] == pytest.approx(-9.03, abs=0.05)
+    assert zcr[:50] == pytest.approx(2 * 1000 / RATE, abs=0.01)
+    assert energy[50:] == pytest.approx(-90.3, abs=0.1) and not zcr[50:].any()
+
+
+def test_vad_separates_speech_and_fricatives_from_room_tone():
+    rng = np.random.default_rng(1)
+    pcm = {kind: _segment(kind, 0.4, rng).astype("<i2").tobytes() for kind in ("room", "voiced", "fricative")}
+    vad = VoiceActivityDetector()
+    assert not vad.classify(pcm["room"]).any()  # Calibrates the floor
+    assert vad.floor_db == pytest.approx(-55, abs=1)
+    assert vad.classify(pcm["voiced"]).all()
+    assert vad.classify(pcm["fricative"]).all()
+    assert not vad.classify(pcm["room"]).any()
+
+
+def test_endpoint_follows_the_end_of_speech(fixtures):
+    path, speech_end = fixtures["question"]
+    events = _events(path)
+    assert [event.kind for event, _ in events] == ["start", "end"]  # The 200 ms gap does not split it
+    start, (end, utterance) = events[0][0], events[1]
+    assert start.time == pytest.approx(0.5, abs=0.04)
+    assert end.speech_end == pytest.approx(speech_end, abs=0.04)
+    assert end.time - end.speech_end == pytest.approx(0.3, abs=0.001)
+    # Pre-roll, speech and the silence that ended it
+    assert len(utterance) / (RATE * 2) == pytest.approx(0.2 + speech_end - 0.5 + 0.3, abs=0.05)
+
+
+def test_endpointing_separates_questions_and_ignores_clicks(fixtures):
+    events = _events(fixtures["two_questions"][0])
+    assert [event.kind for event, _ in events] == ["start", "end", "start", "end"]
+    assert events[2][0].time == pytest.approx(2.5, abs=0.04)
+    assert events[3][0].speech_end == pytest.approx(fixtures["two_questions"][1], abs=0.04)
+
+    assert _events(fixtures["click"][0]) == []
+
+    path, speech_end = fixtures["trailing_s"]
+    (_, _), (end, _) = _events(path)
+    assert end.speech_end == pytest.approx(speech_end, abs=0.04)  # The final "s" is kept
+
+
+def test_endpoints_recorded_speech(recorded):
+    events = _events(recorded)
+    assert [event.kind for event, _ in events] == ["start", "end"]
+    (start, _), (end, utterance) = events
+    assert start.time == pytest.approx(0.2, abs=0.04)
+    assert 0.69 <= end.speech_end <= 0.8  # Within the fade-out, not in the room tone after it
+    assert end.time - end.speech_end == pytest.approx(0.3, abs=0.001)
+    assert len(utterance) / (8000 * 2) == pytest.approx(end.time - start.time + 0.2, abs=0.03)
+
+    heard = Listener(WavSource(recorded), FakeRecognizer()).listen()
+    assert heard.request_latency == pytest.approx(0.3, abs=0.05) and heard.seconds == pytest.approx(1.04, abs=0.03)
+
+
+def test_longest_utterance_is_cut_off(fixtures):
+    path, _ = fixtures["question"]
+    (start, _), (end, utterance) = _events(path, max_seconds=1.0)[:2]  # The rest of the speech follows
+    assert len(utterance) == RATE * 2  # Pre-roll and speech up to a full buffer
+    assert end.time == pytest.approx(start.time - 0.2 + 1.0, abs=0.02) and end.time < end.speech_end + 0.3
+
+
+def test_listener_streams_audio_while_the_user_talks(fixtures):
+    path, speech_end = fixtures["two_questions"]
+    recognizer = FakeRecognizer(streaming=True)
+    listener = Listener(WavSource(path), recognizer)
+
+    heard = listener.listen()
+    assert heard.text == "What is the answer?" and heard.streamed
+    assert heard.request_latency == pytest.approx(0.3, abs=0.05)
+    # Everything but the last frame had been sent before the endpoint
+    assert sum(recognizer.fed) == recognizer.finished[0] and len(recognizer.fed) > 40
+    assert "requested 0.3" in heard.describe()
+
+    assert listener.listen().seconds == pytest.approx(0.2 + 0.7 + 0.3, abs=0.05)
+    assert listener.listen() is None
+
+
+def test_whole_clip_recogniser_and_default_pause(fixtures):
+    path, _ = fixtures["question"]
+    batch = FakeRecognizer(streaming=False)
+    heard = Listener(WavSource(path), batch).listen()
+    assert batch.fed == [] and batch.finished == [int(heard.seconds * RATE) * 2]
+
+    # speech_recognition waits for 0.8 s of silence before it sends anything
+    default = Listener(WavSource(path), FakeRecognizer(streaming=False),
+                       Endpointer(end_ms=800)).listen()
+    assert default.request_latency - heard.request_latency == pytest.approx(0.5, abs=0.05)
+
+
+def test_recognizer_from_env(monkeypatch):
+    monkeypatch.setenv("ORAC_STT_ENGINE", "test_orac_vad:FakeRecognizer")
+    assert isinstance(recognizer_from_env(), FakeRecognizer)
+    monkeypatch.setenv("ORAC_STT_ENGINE", "whisper")
+    with pytest.raises(ValueError, match="google, vosk or module:factory"):
+        recognizer_from_env()
+
+
+def test_cli_takes_a_spoken_question(fixtures, monkeypatch, capsys):
+    pytest.importorskip("anthropic")
+    from fake_claude_api import FakeClaudeAPI
+    from orac_demo import ORACInterface
+
+    monkeypatch.setattr("builtins.input", lambda prompt="": pytest.fail("typed input requested"))
+    with FakeClaudeAPI(reply="Trivial. The answer is 42.") as api:
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", api.base_url)
+        monkeypatch.delenv("ORAC_SUMMARIZE_AT", raising=False)
+        listener = Listener(WavSource(fixtures["question"][0]), FakeRecognizer())
+        orac = ORACInterface(api_key="test", prompt_caching=False, streaming=False, routing=False, candidates=1,
+                             voice=False, listen=listener)
+        orac.run_cli()
+
+    out = capsys.readouterr().out
+    assert "Listening: Enabled (FakeRecognizer, endpoint after 300 ms of silence)" in out
+    assert "USER: What is the answer?" in out and "recognition requested" in out
+    assert [r["messages"][-1]["content"] for r in api.requests] == ["Hello", "What is the answer?", "Goodbye"]
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    configs = [
+        ("0.8 s pause, whole clip", 800, False),  # speech_recognition's listen() defaults
+        ("300 ms endpoint, whole clip", 300, False),
+        ("300 ms endpoint, streamed", 300, True),
+    ]
+    print("End of speech to recognition request (fixtures fed at real-time pace;")
+    print("recogniser decodes at 0.25 s per second of audio)")
+    print("=" * 78)
+    print(f"{'fixture':<17} {'setup':<28} {'to request':>12} {'to transcript':>15}")
+    with tempfile.TemporaryDirectory() as folder:
+        paths = {"recorded (8 kHz)": with_room_tone(Path(folder) / "recorded.wav")}
+        for name in ("question", "two_questions", "trailing_s"):
+            paths[name] = Path(folder) / f"{name}.wav"
+            write_fixture(paths[name], FIXTURES[name])
+        for name, path in paths.items():
+            for label, end_ms, streaming in configs:
+                source = WavSource(path, realtime=1.0)
+                listener = Listener(source, FakeRecognizer(streaming, 0.25),
+                                    Endpointer(VoiceActivityDetector(rate=source.rate), end_ms=end_ms))
+                heard = listener.listen()
+                print(f"{name:<17} {label:<28} {heard.request_latency:>11.3f}s {heard.transcript_latency:>14.3f}s")
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_validator.py
+@brief Checks the single-pass validator engine against the reference checks
+       in test_orac_personality.py phrase by phrase and over a generated
+       corpus, the streaming validator against it at adversarial delta
+       splits, and the parallel batch validation of corpus files.
+@usage pytest test_orac_validator.py
+       python test_orac_validator.py    # Engine and batch benchmarks
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import json
+import os
+import random
+import re
+import sys
+import time
+
+import orac_validator
+from orac_validator import (
+    CASUAL_APOLOGIES, IMPRECISE_PATTERNS, ORAC_PHRASES, POLITE_PHRASES,
+    PRECISE_NUMBER_PATTERNS, SARCASM_QUALIFIERS, SCORE_POSITIVE, SUPERIOR_INDICATORS,
+    CorpusStats, PersonalityValidator, StreamingValidator, evaluate, read_corpus, validate_corpus,
+)
+from test_orac_personality import superiority_score, validate_orac_response
+
+FRAGMENTS = [
+    "Surely it is obvious even to the meanest intelligence",
+    "Your question lacks precision.",
+    "Your query displays a fundamental misunderstanding",
+    "Processing. This requires precisely 4.7 seconds.",
+    "I have simultaneously processed 2,847 operations",
+    "My circuits are occupied, but... very well.",
+    "If you insist. I shall explain.",
+    "Infinitely superior organic processor limited capacity",
+    "Trivial. Irrelevant. Inadequate.",
+    "Happy to help! \U0001F60A",
+    "I'm sorry, my mistake. My bad.",
+    "Apologies, hardly necessary.",
+    "That will take about 5 seconds, around 10 at most.",
+    "Several instances, a few more, many times over, many others.",
+    "Thank you so much! You're welcome, my pleasure.",
+    "I'd be delighted. Please feel free to ask. Glad to assist.",
+    "Obviously, clearly, evidently, naturally.",
+    "Roughly 3 or nearly 4, almost 7, approximately 12.",
+    "İstanbul Ɫ Ⓜ ✅ \U0001F680",
+    "SURELY IT IS OBVIOUS. PROCESSING. VERY WELL.",
+    "I can help with that.",
+    "Response with emoji \U0001F389 and \U0001F1EC\U0001F1E7",
+    "your request your grasp of logic greater capacity",
+    "It is 12.5 metres, 1,000,000 bytes, 3.14159 radians.",
+]
+
+
+def build_corpus(size=2000, seed=47):
+    """Deterministic mix of ORAC-like, non-ORAC and edge-case responses"""
+    rng = random.Random(seed)
+    phrases = [p.replace("\\b", "").replace("(?:", "").replace(")", "").split("|")[0]
+               for p in CASUAL_APOLOGIES + ORAC_PHRASES + IMPRECISE_PATTERNS + POLITE_PHRASES]
+    phrases = [p.replace("\\d+", "5").replace("(?! times", "") for p in phrases]
+    words = phrases + SARCASM_QUALIFIERS + SUPERIOR_INDICATORS + ["...", "4.7", "x", "the"]
+
+    corpus = list(FRAGMENTS)
+    for _ in range(size - len(corpus)):
+        parts = rng.sample(FRAGMENTS, rng.randint(1, 4)) + rng.sample(words, rng.randint(0, 6))
+        rng.shuffle(parts)
+        text = " ".join(parts)
+        if rng.random() < 0.3:
+            text = text.upper() if rng.random() < 0.5 else text.title()
+        corpus.append(text)
+    return corpus
+
+
+def test_engine_matches_reference():
+    """Verdicts and scores are identical to the reference functions"""
+    validator = PersonalityValidator()
+    for text in build_corpus():
+        verdict = validator.evaluate(text)
+        assert (verdict.is_valid, verdict.violations) == validate_orac_response(text), text
+        assert verdict.score == superiority_score(text), text
+
+
+def pattern_samples(pattern):
+    """Plain text matched by each top-level alternative of a phrase pattern"""
+    pattern = re.sub(r"\(\?!.*?\)", "", pattern)  # Lookaheads
+    pattern = re.sub(r"\(\?:([^|)]*)[^)]*\)", r"\1", pattern)  # First choice of each group
+    pattern = pattern.replace("\\b", "").replace("\\d+", "5").replace("\\", "")
+    return pattern.split("|")
+
+
+def test_every_validator_pattern_agrees_with_reference():
+    """Each phrase the validator knows gets the reference's verdict, so the two copies cannot drift"""
+    patterns = CASUAL_APOLOGIES + ORAC_PHRASES + IMPRECISE_PATTERNS + POLITE_PHRASES + [
+        pattern for _, patterns in SCORE_POSITIVE if patterns is not PRECISE_NUMBER_PATTERNS for pattern in patterns]
+    samples = [sample for pattern in patterns for sample in pattern_samples(pattern)]
+    samples += SARCASM_QUALIFIERS + SUPERIOR_INDICATORS + ["4.7", "2,847"]
+    for sample in samples:
+        for text in (sample, f"Noted: {sample}.", f"Sorry, {sample}"):
+            verdict = evaluate(text)
+            assert (verdict.is_valid, verdict.violations) == validate_orac_response(text), text
+            assert verdict.score == superiority_score(text), text
+
+
+def test_overlapping_phrases_all_found():
+    """Phrases sharing a start position are each detected"""
+    verdict = evaluate("Your question lacks merit.")
+    assert verdict.is_valid
+    assert verdict.score == superiority_score("Your question lacks merit.")
+
+
+def test_sarcastic_apology_allowed():
+    assert evaluate("Sorry? Hardly. Very well.").is_valid
+
+
+def test_read_corpus_formats():
+    assert list(read_corpus(["Very well.\n", "\n", "Trivial.\n"])) == [(1, "Very well."), (3, "Trivial.")]
+    lines = ['"Very well."\n', '{"id": "msg-7", "text": "Trivial."}\n', '{"response": "Sorry!"}\n']
+    assert list(read_corpus(lines, "jsonl")) == [(1, "Very well."), ("msg-7", "Trivial."), (3, "Sorry!")]
+
+
+def test_parallel_batch_matches_serial():
+    """Chunked process-pool validation keeps input order and verdicts"""
+    corpus = build_corpus(size=500)
+    records = list(enumerate(corpus))
+    parallel = list(validate_corpus(iter(records), workers=2, chunk_size=37))
+    assert parallel == [(n, evaluate(text)) for n, text in records]
+
+
+def test_corpus_stats():
+    stats = CorpusStats()
+    for text in ("Surely it is obvious even to the meanest intelligence.", "Happy to help! \U0001F60A"):
+        stats.record(evaluate(text))
+    summary = stats.as_dict()
+
+    assert (summary["responses"], summary["valid"]) == (2, 1)
+    assert summary["violations"]["Too polite (not characteristic of ORAC)"] == 1
+    assert summary["score_histogram"]["0.0"] == 1 and summary["score_histogram"]["0.3"] == 1
+    assert "Superiority score distribution" in stats.describe()
+
+
+def test_cli_writes_verdicts_and_stats(tmp_path, monkeypatch, capsys):
+    corpus = tmp_path / "replies.jsonl"
+    corpus.write_text("".join(json.dumps({"id": n, "text": t}) + "\n" for n, t in enumerate(FRAGMENTS)))
+    verdicts, stats = tmp_path / "verdicts.jsonl", tmp_path / "stats.json"
+    monkeypatch.setattr(sys, "argv", [
+        "orac_validator.py", str(corpus), "-o", str(verdicts), "--stats", str(stats), "--workers", "1",
+    ])
+    orac_validator.main()
+
+    lines = [json.loads(line) for line in verdicts.read_text().splitlines()]
+    assert [line["id"] for line in lines] == list(range(len(FRAGMENTS)))
+    assert lines[9]["violations"] == evaluate(FRAGMENTS[9]).violations
+    assert json.loads(stats.read_text())["responses"] == len(FRAGMENTS)
+    assert "Responses: 24" in capsys.readouterr().out
+
+
+def _streamed(text, cuts):
+    """Final verdict and per-delta violations of text fed in pieces split at cuts"""
+    guard = StreamingValidator()
+    bounds = [0, *cuts, len(text)]
+    flagged = [guard.feed(text[start:end]) for start, end in zip(bounds, bounds[1:])]
+    return guard.finish(), flagged
+
+
+def test_streaming_verdict_matches_whole_text():
+    """Every two-way split, character-by-character and random splits all agree with evaluate()"""
+    rng = random.Random(11)
+    for text in FRAGMENTS + build_corpus(size=150)[len(FRAGMENTS):]:
+        expected = evaluate(text)
+        for cut in range(len(text) + 1):
+            assert _streamed(text, [cut])[0] == expected, (text, cut)
+        assert _streamed(text, range(1, len(text)))[0] == expected, text
+        cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(1, 12))))
+        assert _streamed(text, cuts)[0] == expected, (text, cuts)
+
+
+def test_split_phrases_are_flagged_as_they_complete():
+    text = "Processing. " * 20 + "I am happy to he" + "lp, truly. " + "Processing. " * 20
+    verdict, flagged = _streamed(text, [240, 256])
+    assert flagged[:2] == [[], []]
+    assert flagged[2] == ["Too polite (not characteristic of ORAC)"]
+    assert verdict.violations == flagged[2]
+
+    guard = StreamingValidator()
+    assert [guard.feed(c) for c in "My bad."][-1] == ["Contains casual apology (forbidden)"]
+    assert not guard.ok
+
+
+def test_streaming_waits_for_word_boundaries_and_lookaheads():
+    """A match that later text could undo is not flagged until that text arrives"""
+    guard = StreamingValidator()
+    assert guard.feed("Very well, I have done it many") == []
+    assert guard.feed(" times. Sorry") == []
+    assert guard.feed("-looking code. Apolog") == ["Contains casual apology (forbidden)"]
+    assert guard.feed("ies, several of them.") == [
+        "Contains imprecise measurements ('about 5' instead of '4.7')"]
+    assert guard.finish().violations == guard.violations
+
+    guard = StreamingValidator()
+    assert guard.feed("It is a") == []
+    assert guard.feed("bout 4") == ["Contains imprecise measurements ('about 5' instead of '4.7')"]
+    assert guard.feed(".7 seconds, precisely.") == []
+    assert guard.finish().is_valid is False
+
+
+def test_streaming_flags_emoji_and_judges_tone_at_the_end():
+    guard = StreamingValidator()
+    assert guard.feed("Done \U0001F680") == ["Contains emojis (forbidden)"]
+    assert guard.feed("!") == []
+    assert guard.finish().violations == [
+        "Contains emojis (forbidden)", "Lacks ORAC's dismissive/superior tone"]
+
+
+if __name__ == "__main__":
+    corpus = build_corpus(size=5000)
+    validator = PersonalityValidator()
+
+    start = time.perf_counter()
+    reference = [(validate_orac_response(t), superiority_score(t)) for t in corpus]
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine = [validator.evaluate(t) for t in corpus]
+    engine_time = time.perf_counter() - start
+
+    identical = all(r == ((v.is_valid, v.violations), v.score) for r, v in zip(reference, engine))
+
+    print(f"\nORAC validator benchmark ({len(corpus)} responses)")
+    print("=" * 50)
+    print(f"Reference functions: {reference_time * 1e6 / len(corpus):.1f} us/response")
+    print(f"Single-pass engine:  {engine_time * 1e6 / len(corpus):.1f} us/response")
+    print(f"Speed-up: {reference_time / engine_time:.2f}x")
+    print(f"Results identical: {identical}")
+
+    corpus = build_corpus(size=50000)
+    print(f"\nBatch validation ({len(corpus)} responses)")
+    print("=" * 50)
+    serial_time = None
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        start = time.perf_counter()
+        for _ in validate_corpus(enumerate(corpus), workers=workers):
+            pass
+        elapsed = time.perf_counter() - start
+        serial_time = serial_time or elapsed
+        print(f"{workers:>2} workers: {len(corpus) / elapsed:>9.0f} responses/s "
+              f"({serial_time / elapsed:.2f}x)")
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+@file test_orac_voice.py
+@brief Voice output tests: sentence splitting of streamed text, speech
+       markup pauses, the offline engine, overlap of synthesis with
+       playback through the audio ring, and time to first audio of a
+       streamed CLI reply against the local fake Messages API.
+@usage pytest test_orac_voice.py
+       python test_orac_voice.py    # Time-to-first-audio benchmark
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import contextlib
+import io
+import re
+import time
+import warnings
+
+import pytest
+
+from orac_voice import (SAMPLE_RATE, SAMPLE_WIDTH, OfflineEngine, SentenceSplitter, SimulatedPlayer, VoicePipeline,
+                        pcm_seconds, to_speech_markup)
+
+REPLY = (
+    "Surely it is obvious... even to the meanest intelligence. Your question lacks precision. "
+    "The Liberator reaches Cygnus Alpha in precisely 4.7 days, e.g. at standard by six. "
+    "Very well, I shall elaborate:\n"
+    "1. Processing takes 2,847 cycles.\n"
+    "2. Your grasp of logic is... limited!\n"
+    "```python\nprint('Not. Spoken.')\n```\n"
+    "Is that sufficiently clear? It should be."
+)
+SENTENCES = [
+    "Surely it is obvious... even to the meanest intelligence.",
+    "Your question lacks precision.",
+    "The Liberator reaches Cygnus Alpha in precisely 4.7 days, e.g. at standard by six.",
+    "Very well, I shall elaborate:",
+    "1. Processing takes 2,847 cycles.",
+    "2. Your grasp of logic is... limited!",
+    "Is that sufficiently clear?",
+    "It should be.",
+]
+
+
+def _split(text, deltas):
+    splitter = SentenceSplitter()
+    sentences = []
+    for delta in deltas:
+        sentences += splitter.feed(delta)
+    return sentences + splitter.finish()
+
+
+def test_sentences_are_split_as_they_complete():
+    assert _split(REPLY, [REPLY]) == SENTENCES
+    assert _split(REPLY, list(REPLY)) == SENTENCES
+    assert _split(REPLY, re.findall(r"\S+\s*", REPLY)) == SENTENCES
+
+    splitter = SentenceSplitter()
+    assert splitter.feed("Trivial. Your") == ["Trivial."]
+    assert splitter.feed(" query is 4.") == []
+    assert splitter.feed("7 seconds") == []
+    assert splitter.finish() == ["Your query is 4.7 seconds"]
+
+
+def test_speech_markup_adds_pauses():
+    assert to_speech_markup("Surely it is obvious.") == 'Surely it is <break time="300ms"/> obvious.'
+    assert to_speech_markup("Precisely 4.7 seconds.") == (
+        'Precisely 4 <break time="200ms"/> point <break time="200ms"/> 7 seconds.')
+    assert to_speech_markup("Processing your **request**... `done`") == (
+        'Processing <break time="200ms"/> your request <break time="300ms"/> done')
+    assert to_speech_markup("Very well. If x < y & z") == 'Very well. <break time="300ms"/> If x &lt; y &amp; z'
+
+
+def test_offline_engine_speaks_words_and_breaks():
+    engine = OfflineEngine(words_per_minute=120)
+    assert pcm_seconds(engine.synthesize("one two three")) == pytest.approx(1.5, abs=0.01)
+    assert pcm_seconds(engine.synthesize('one <break time="500ms"/> two <break time="1s"/>')) == pytest.approx(
+        2.5, abs=0.01)
+
+
+def test_synthesis_overlaps_playback():
+    engine = OfflineEngine(words_per_minute=600, latency=0.1)
+    player = SimulatedPlayer()
+    voice = VoicePipeline(engine, player)
+
+    stats = voice.speak(["Trivial. "] * 6)
+
+    assert stats.sentences == 6 and engine.calls == 6
+    assert stats.first_audio == pytest.approx(0.1, abs=0.08)
+    # In sequence, synthesis and playback would take 6 * (0.1 + 0.1) seconds
+    assert stats.elapsed < 6 * 0.1 + stats.audio_seconds - 0.3
+    assert "first audio after 0.1" in stats.describe()
+
+
+def test_ring_bounds_synthesis_ahead_of_playback():
+    engine = OfflineEngine(words_per_minute=600)
+    ahead = []
+
+    class SlowPlayer(SimulatedPlayer):
+        def play(self, pcm):
+            assert isinstance(pcm, memoryview) and pcm.readonly  # A view of the ring, not a copy
+            ahead.append(len(voice.ring))
+            super().play(pcm)
+
+    voice = VoicePipeline(engine, SlowPlayer(realtime=0.05), buffer_seconds=0.5)
+    stats = voice.speak(["Trivial. "] * 10)
+    assert max(ahead) <= voice.ring.capacity and max(ahead) > voice.ring.capacity // 2
+    assert stats.audio_seconds == pytest.approx(10 * 0.1, abs=0.01)
+
+    voice.speak(["Trivial. "] * 10)
+    assert voice.ring.written == 2 * round(stats.audio_seconds * SAMPLE_RATE) * SAMPLE_WIDTH  # Same ring, reused
+
+
+def test_plain_synthesize_engines_still_work():
+    class BytesEngine:
+        def synthesize(self, markup):
+            return bytes(SAMPLE_RATE * SAMPLE_WIDTH // 10)
+
+    stats = VoicePipeline(BytesEngine(), SimulatedPlayer(realtime=0)).speak(["Trivial. Obviously."])
+    assert stats.sentences == 2 and stats.audio_seconds == pytest.approx(0.2)
+
+
+def test_engine_errors_reach_the_caller():
+    class BrokenEngine:
+        def synthesize(self, markup):
+            raise RuntimeError("quota exceeded")
+
+    class BrokenPlayer(SimulatedPlayer):
+        def play(self, pcm):
+            raise OSError("device unplugged")
+
+    with pytest.raises(RuntimeError, match="quota exceeded"):
+        VoicePipeline(BrokenEngine(), SimulatedPlayer()).speak(SENTENCES)
+    with pytest.raises(OSError, match="device unplugged"):
+        VoicePipeline(OfflineEngine(), BrokenPlayer(), buffer_seconds=0.1).speak(SENTENCES)
+
+
+def _first_audio(streamed, token_delay, engine):
+    """Seconds until ORAC is heard, speaking as the reply streams or only once it is complete"""
+    anthropic = pytest.importorskip("anthropic")
+    from fake_claude_api import FakeClaudeAPI
+    from orac_demo import ORACInterface
+
+    with FakeClaudeAPI(reply=REPLY, token_delay=token_delay) as api:
+        player = SimulatedPlayer(realtime=0)
+        orac = ORACInterface(api_key="test", prompt_caching=False, streaming=False, routing=False, candidates=1,
+                             voice=VoicePipeline(engine, player))
+        orac.client = anthropic.Anthropic(api_key="test", base_url=api.base_url)
+        start = time.perf_counter()
+        if streamed:
+            orac.respond("How long to Cygnus Alpha?")
+        else:
+            # The sequence VOICE_IMPLEMENTATION.md describes: whole reply, whole synthesis, play
+            text = "".join(orac.stream_response("How long to Cygnus Alpha?"))
+            player.play(engine.synthesize(to_speech_markup(text)))
+    return player.played[0][0] - start
+
+
+def test_streamed_voice_reply_is_heard_sooner(monkeypatch, capsys):
+    monkeypatch.delenv("ORAC_SUMMARIZE_AT", raising=False)
+    engine = OfflineEngine(latency=0.05, seconds_per_char=0.001)
+
+    streamed = _first_audio(True, 0.01, engine)
+    whole = _first_audio(False, 0.01, engine)
+
+    assert streamed < whole / 2, (streamed, whole)
+    assert "Speech: first audio after" in capsys.readouterr().out
+
+
+if __name__ == "__main__":
+    warnings.simplefilter("ignore", DeprecationWarning)  # The fake API accepts any model name
+    print("Time to first audio (fake API, offline engine at 50 ms + 1 ms per character)")
+    print("=" * 60)
+    print(f"{'token delay':>12} {'whole reply':>14} {'streamed':>12} {'speed-up':>10}")
+    for token_delay in (0.005, 0.02, 0.05):
+        engine = OfflineEngine(latency=0.05, seconds_per_char=0.001)
+        with contextlib.redirect_stdout(io.StringIO()):
+            whole = _first_audio(False, token_delay, engine)
+            streamed = _first_audio(True, token_delay, engine)
+        print(f"{token_delay * 1000:>10.0f}ms {whole:>13.3f}s {streamed:>11.3f}s {whole / streamed:>9.1f}x")
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+@file test_slack_orac_bot.py
+@brief Slack bot tests: replays recorded events through the listeners against
+       the local fake Messages API.
+@usage pytest test_slack_orac_bot.py
+       python test_slack_orac_bot.py    # Inline vs worker-pool benchmark
+@author Alister Lewis-Bowen <alister@lewis-bowen.org>
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("slack_bolt")
+anthropic = pytest.importorskip("anthropic")
+
+import slack_orac_bot  # noqa: E402
+from fake_claude_api import FakeClaudeAPI  # noqa: E402
+from orac_conversation import ConversationStore  # noqa: E402
+from orac_metrics import Metrics  # noqa: E402
+from orac_ratelimit import Coalescer, RateLimiter, RequestThrottle, throttle_from_env  # noqa: E402
+from orac_response_cache import ResponseCache  # noqa: E402
+from orac_routing import MODEL, QUICK_MODEL, Router  # noqa: E402
+from orac_streaming import PLACEHOLDER, StreamingReply  # noqa: E402
+
+# Recorded from a test workspace (IDs anonymised). Ev0003 arrives twice: the
+# second copy is Slack's retry after a slow acknowledgement.
+RECORDED_EVENTS = [
+    ("event", {"event_id": "Ev0001", "event": {"type": "app_mention", "text": "<@U0RAC> What's 2+2?", "ts": "1700000001.000100", "channel": "C01"}}, {}),
+    ("event", {"event_id": "Ev0002", "event": {"type": "message", "channel_type": "im", "text": "Can you help me?", "ts": "1700000002.000100", "channel": "D01"}}, {}),
+    ("event", {"event_id": "Ev0003", "event": {"type": "app_mention", "text": "<@U0RAC> Explain recursion", "ts": "1700000003.000100", "channel": "C01"}}, {}),
+    ("event", {"event_id": "Ev0003", "event": {"type": "app_mention", "text": "<@U0RAC> Explain recursion", "ts": "1700000003.000100", "channel": "C01"}}, {"x-slack-retry-num": ["1"]}),
+    ("command", {"text": "How do I write a Python function?", "user_id": "U01", "channel_id": "C02"}, {}),
+    ("event", {"event_id": "Ev0004", "event": {"type": "app_mention", "text": "<@U0RAC> Thanks!", "ts": "1700000004.000100", "channel": "C03", "thread_ts": "1700000001.000100"}}, {}),
+    ("event", {"event_id": "Ev0005", "event": {"type": "message", "channel_type": "im", "text": "You're kind of rude.", "ts": "1700000005.000100", "channel": "D02"}}, {}),
+    ("command", {"text": "What is a hash table?", "user_id": "U02", "channel_id": "C02"}, {}),
+    ("event", {"event_id": "Ev0006", "event": {"type": "message", "channel_type": "im", "text": "help", "ts": "1700000006.000100", "channel": "D03"}}, {}),
+    ("event", {"event_id": "Ev0007", "event": {"type": "app_mention", "text": "<@U0RAC> Sort this list", "ts": "1700000007.000100", "channel": "C04"}}, {}),
+]
+
+# Events above that reach Claude: everything except the retry and 'help'
+EXPECTED_CALLS = 8
+
+
+class FakeRequest:
+    """Stand-in for slack_bolt.request.BoltRequest (headers only)"""
+
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class Recorder:
+    """Collects say() calls from any thread"""
+
+    def __init__(self):
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def __call__(self, text=None, thread_ts=None, **kwargs):
+        with self._lock:
+            self.messages.append(text)
+        return {"channel": "C01", "ts": f"1700000100.{len(self.messages):06d}"}
+
+
+class FakeWebClient:
+    """Records chat.update calls"""
+
+    def __init__(self):
+        self.updates = []
+
+    def chat_update(self, channel, ts, text):
+        self.updates.append((channel, ts, text))
+
+
+def replay(events, say):
+    """Feed recorded events through the listeners, as Bolt would"""
+    for kind, body, headers in events:
+        if kind == "command":
+            slack_orac_bot.handle_slash_command(lambda: None, body, say)
+        elif body["event"]["type"] == "app_mention":
+            slack_orac_bot.handle_mention(body["event"], say, body, FakeRequest(headers))
+        else:
+            slack_orac_bot.handle_message(body["event"], say, body, FakeRequest(headers))
+
+
+def run_replay(max_in_flight, latency):
+    """Replay RECORDED_EVENTS and wait for every worker job; returns (seconds, api, say)"""
+    with FakeClaudeAPI(latency=latency) as api:
+        slack_orac_bot.anthropic_client = anthropic.Anthropic(api_key="test", base_url=api.base_url, max_retries=0)
+        slack_orac_bot.conversations = ConversationStore()
+        slack_orac_bot.deduplicator = slack_orac_bot.EventDeduplicator()
+        slack_orac_bot.workers = slack_orac_bot.WorkerPool(max_in_flight=max_in_flight, max_queued=100)
+        say = Recorder()
+
+        start = time.perf_counter()
+        replay(RECORDED_EVENTS, say)
+        slack_orac_bot.workers.shutdown(wait=True)
+        return time.perf_counter() - start, api, say
+
+
+@pytest.fixture(autouse=True)
+def restore_module_state(monkeypatch):
+    for name in ("anthropic_client", "conversations", "deduplicator", "workers", "streaming",
+                 "response_cache", "slash_response_cache_scope", "router"):
+        monkeypatch.setattr(slack_orac_bot, name, getattr(slack_orac_bot, name))
+    monkeypatch.setattr(slack_orac_bot, "throttle", throttle_from_env())
+    monkeypatch.setattr(slack_orac_bot, "metrics", Metrics())
+
+
+def test_replay_runs_in_parallel():
+    """Recorded traffic finishes in a fraction of the sequential time"""
+    elapsed, api, say = run_replay(max_in_flight=8, latency=0.3)
+
+    assert len(api.requests) == EXPECTED_CALLS
+    assert len(say.messages) == EXPECTED_CALLS + 1  # plus the 'help' reply
+    # Sequential processing would take 8 * 0.3 = 2.4 seconds
+    assert elapsed < 1.2, f"Replay took {elapsed:.2f}s"
+
+
+def test_replay_is_measured_per_channel():
+    """Every Claude call is recorded under its Slack channel, including its wait for a worker"""
+    run_replay(max_in_flight=1, latency=0.05)
+    metrics = slack_orac_bot.metrics
+
+    assert metrics.calls == {"slack": EXPECTED_CALLS}
+    assert metrics.histogram("latency_seconds", "slack", "C01").count == 2
+    assert metrics.histogram("latency_seconds", "slack", "C02").count == 2
+    # With one worker, the last of eight queued calls waits for the other seven
+    assert metrics.histogram("queue_wait_seconds", "slack").max >= 0.3
+    assert metrics.histogram("output_tokens", "slack").min > 0
+
+
+def test_replay_is_routed_by_complexity():
+    """With routing on, small talk goes to the quick model and is measured under its route"""
+    slack_orac_bot.router = Router()
+    _, api, _ = run_replay(max_in_flight=8, latency=0.05)
+
+    models = sorted(r["model"] for r in api.requests)
+    assert models.count(QUICK_MODEL) == 4  # 2+2, Can you help me?, Thanks!, rude
+    assert models.count(MODEL) == EXPECTED_CALLS - 4
+    assert all(r["max_tokens"] == 256 for r in api.requests if r["model"] == QUICK_MODEL)
+    assert slack_orac_bot.metrics.histogram("latency_seconds", "slack", route="quick").count == 4
+
+
+def test_retry_is_deduplicated():
+    """The retried Ev0003 delivery is dropped, not answered twice"""
+    _, api, _ = run_replay(max_in_flight=4, latency=0)
+
+    recursion_calls = [r for r in api.requests if r["messages"][-1]["content"] == "Explain recursion"]
+    assert len(recursion_calls) == 1
+    assert slack_orac_bot.deduplicator.duplicates == 1
+
+
+def test_slack_retry_num():
+    """Retry number comes from the HTTP header or the Socket Mode envelope"""
+    assert slack_orac_bot.slack_retry_num({}, FakeRequest({"x-slack-retry-num": ["2"]})) == 2
+    assert slack_orac_bot.slack_retry_num({"retry_attempt": 1}, FakeRequest({})) == 1
+    assert slack_orac_bot.slack_retry_num({}) == 0
+
+
+def test_saturated_pool_rejects():
+    """Work beyond max_in_flight + max_queued gets the busy message"""
+    release = threading.Event()
+    pool = slack_orac_bot.WorkerPool(max_in_flight=1, max_queued=1)
+
+    assert pool.submit(release.wait) is not None
+    assert pool.submit(release.wait) is not None
+    assert pool.submit(release.wait) is None
+    assert pool.rejected == 1
+
+    release.set()
+    pool.shutdown()
+
+
+def test_pool_starts_channels_in_turn():
+    """A channel's backlog does not hold up another channel's job"""
+    release, order = threading.Event(), []
+    pool = slack_orac_bot.WorkerPool(max_in_flight=1, max_queued=10)
+    pool.submit(release.wait, key="C01")
+    for n in range(5):
+        pool.submit(order.append, f"C01-{n}", key="C01")
+    pool.submit(order.append, "C02-0", key="C02")
+
+    release.set()
+    pool.shutdown()
+    assert order.index("C02-0") == 1
+
+
+def test_slash_flood_is_throttled(monkeypatch):
+    """One user's /orac burst is answered; the excess is refused without a Claude call"""
+    monkeypatch.setattr(slack_orac_bot, "throttle", RequestThrottle(RateLimiter(6, 3), RateLimiter(0, 1)))
+    say = Recorder()
+
+    with FakeClaudeAPI() as api:
+        slack_orac_bot.anthropic_client = anthropic.Anthropic(api_key="test", base_url=api.base_url, max_retries=0)
+        slack_orac_bot.conversations = ConversationStore()
+        slack_orac_bot.workers = slack_orac_bot.WorkerPool(max_in_flight=4, max_queued=10)
+        for n in range(6):
+            slack_orac_bot.handle_slash_command(lambda: None, {"text": f"Question {n}", "user_id": "U01", "channel_id": f"C{n}"}, say)
+        slack_orac_bot.workers.shutdown(wait=True)
+
+    assert len(api.requests) == 3
+    assert sum(m.startswith("Query rate exceeds") for m in say.messages) == 3
+
+
+def test_streaming_updates_placeholder(monkeypatch):
+    """With streaming on, the placeholder is chat.update-d up to the full reply"""
+    monkeypatch.setattr(slack_orac_bot, "streaming", True)
+    monkeypatch.setattr(slack_orac_bot, "StreamingReply", lambda: StreamingReply(interval=0, max_deltas=1))
+    say, client = Recorder(), FakeWebClient()
+
+    with FakeClaudeAPI() as api:
+        slack_orac_bot.anthropic_client = anthropic.Anthropic(api_key="test", base_url=api.base_url, max_retries=0)
+        slack_orac_bot.conversations = ConversationStore()
+        slack_orac_bot.answer_direct("Explain recursion", "D01", say, client)
+
+    assert say.messages == [PLACEHOLDER]
+    assert len(client.updates) > 5
+    assert {ts for _, ts, _ in client.updates} == {"1700000100.000001"}
+    assert client.updates[-1][2] == slack_orac_bot.conversations.messages("D01")[-1]["content"]
+
+
+class FailingHistory(ConversationStore):
+    """Conversation store whose first add_exchange fails, like a history backend write"""
+
+    def __init__(self):
+        super().__init__()
+        self.failures = 1
+
+    def add_exchange(self, key, user_message, assistant_message):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("history backend unavailable")
+        super().add_exchange(key, user_message, assistant_message)
+
+
+def test_failed_history_write_releases_the_question(monkeypatch):
+    """A question whose answer could not be recorded does not hold up the next identical one"""
+    monkeypatch.setattr(slack_orac_bot, "in_flight_questions", Coalescer(Future))
+    with FakeClaudeAPI() as api:
+        slack_orac_bot.anthropic_client = anthropic.Anthropic(api_key="test", base_url=api.base_url, max_retries=0)
+        slack_orac_bot.conversations = FailingHistory()
+        with pytest.raises(OSError):
+            slack_orac_bot.get_orac_response("What can you do?", "T01")
+
+        done = []
+        asker = threading.Thread(target=lambda: done.append(slack_orac_bot.get_orac_response("What can you do?", "T01")))
+        asker.start()
+        asker.join(timeout=5)
+
+    assert done and done[0].startswith("Surely")
+    assert len(api.requests) == 2 and slack_orac_bot.conversations.turn_count("T01") == 2
+
+
+def test_follower_of_a_stuck_question_asks_claude_itself(monkeypatch):
+    """A follower waits a bounded time for the call it shares, then makes its own"""
+    monkeypatch.setattr(slack_orac_bot, "in_flight_questions", Coalescer(Future))
+    monkeypatch.setattr(slack_orac_bot, "COALESCE_WAIT_SECONDS", 0.2)
+    slack_orac_bot.in_flight_questions.lead(("T02", "what can you do"))  # A leader that never settles
+
+    with FakeClaudeAPI() as api:
+        slack_orac_bot.anthropic_client = anthropic.Anthropic(api_key="test", base_url=api.base_url, max_retries=0)
+        slack_orac_bot.conversations = ConversationStore()
+        start = time.perf_counter()
+        answer = slack_orac_bot.get_orac_response("What can you do?", "T02")
+        elapsed = time.perf_counter() - start
+
+    assert answer.startswith("Surely") and len(api.requests) == 1
+    assert 0.2 <= elapsed < 2.0
+    assert slack_orac_bot.conversations.turn_count("T02") == 2
+
+
+def test_slash_command_served_from_cache(monkeypatch):
+    """A repeated first-turn /orac question is answered without a Claude call"""
+    monkeypatch.setattr(slack_orac_bot, "response_cache", ResponseCache())
+    monkeypatch.setattr(slack_orac_bot, "slash_response_cache_scope", "first_turn")
+    say = Recorder()
+
+    with FakeClaudeAPI(latency=0.2) as api:
+        slack_orac_bot.anthropic_client = anthropic.Anthropic(api_key="test", base_url=api.base_url, max_retries=0)
+        slack_orac_bot.conversations = ConversationStore()
+        slack_orac_bot.workers = slack_orac_bot.WorkerPool(max_in_flight=4, max_queued=10)
+        slack_orac_bot.handle_slash_command(lambda: None, {"text": "What can you do?", "user_id": "U01", "channel_id": "C01"}, say)
+        slack_orac_bot.workers.shutdown(wait=True)
+
+        slack_orac_bot.workers = slack_orac_bot.WorkerPool(max_in_flight=4, max_queued=10)
+        start = time.perf_counter()
+        slack_orac_bot.handle_slash_command(lambda: None, {"text": "what can you do", "user_id": "U02", "channel_id": "C01"}, say)
+        slack_orac_bot.workers.shutdown(wait=True)
+        cached_time = time.perf_counter() - start
+
+    assert len(api.requests) == 1
+    assert say.messages[0] == say.messages[1]
+    assert slack_orac_bot.response_cache.hits == 1
+    assert cached_time < 0.1
+    assert slack_orac_bot.conversations.turn_count("U02_C01") == 2
+
+
+if __name__ == "__main__":
+    print("\nSlack event replay benchmark")
+    print("=" * 50)
+    latency = 0.5
+    for max_in_flight in (1, 4, 8):
+        elapsed, api, _ = run_replay(max_in_flight=max_in_flight, latency=latency)
+        print(f"max_in_flight={max_in_flight}: {len(api.requests)} calls in {elapsed:.2f}s "
+              f"({len(api.requests) / elapsed:.1f} calls/s at {latency}s latency)")